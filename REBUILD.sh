@@ -2,10 +2,12 @@
 
 # Rebuild data from sources.
 
-# This is a top-level driver script that runs scripts named
-# [0-9][0-9]*.sh in the subdirectory pipeline/ in alphanumeric order
-# (lowest numbers first). Outputs "ERROR" and terminates immediately
-# if any script fails.
+# This is a top-level driver script that runs all pipeline stages with
+# the build driver scripts/rebuild.py (see pipeline/ for the stages).
+# Stages whose inputs, scripts and options have not changed since the
+# last run are skipped. Arguments are passed to the build driver (e.g.
+# -j N for N parallel jobs, --download to fetch new sources). Outputs
+# "ERROR" and terminates immediately if any stage fails.
 
 
 set -eu
@@ -30,11 +32,7 @@ EOF
 }
 trap error ERR
 
-for script in "$SCRIPTDIR/pipeline/"[0-9][0-9]*.sh; do
-    echo $'\n'"Running $script ..."$'\n' >&2
-    time "$script"
-    echo $'\n'"Completed $script"$'\n' >&2
-done
+time python "$SCRIPTDIR/scripts/rebuild.py" "$@"
 
 cat <<EOF >&2
 ##########
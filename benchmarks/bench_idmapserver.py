@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+# Load test for idmapserver.py: throughput and latency of batched
+# lookups from concurrent clients, compared to running applyidmap.py
+# for each batch.
+
+# The server is started in a subprocess on a free port with either a
+# given ID mapping or a synthetic one.
+
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import random
+import socket
+import tempfile
+import threading
+import subprocess
+
+from six.moves.http_client import HTTPConnection
+
+BENCHDIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTDIR = os.path.join(BENCHDIR, '..', 'scripts')
+
+sys.path.insert(0, SCRIPTDIR)
+
+from synthetic import synthetic_terms
+
+
+def argparser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-n', '--nodes', type=int, default=300000,
+                    help='Number of synthetic terms (default 300000)')
+    ap.add_argument('-m', '--mapping', metavar='FILE', default=None,
+                    help='Use existing ID mapping instead of synthetic')
+    ap.add_argument('-c', '--clients', type=int, default=4,
+                    help='Number of concurrent clients (default 4)')
+    ap.add_argument('-b', '--batch', type=int, default=100,
+                    help='IDs per request (default 100)')
+    ap.add_argument('-r', '--requests', type=int, default=500,
+                    help='Requests per client (default 500)')
+    return ap
+
+
+def write_mapping(out, n):
+    """Write synthetic ID mapping in the getidmapping.py format."""
+    for term in synthetic_terms(n):
+        for xref in term['xrefs']:
+            uid = xref.split(':', 1)[1]
+            out.write('{}\tPRO\t{}\n'.format(uid, term['id']))
+
+
+def read_uniprot_ids(fn):
+    with open(fn) as f:
+        return [l.split('\t', 1)[0] for l in f]
+
+
+def free_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def wait_for_server(port, timeout=300):
+    start = time.time()
+    while time.time() - start < timeout:
+        try:
+            conn = HTTPConnection('127.0.0.1', port)
+            conn.request('GET', '/status')
+            conn.getresponse().read()
+            return
+        except socket.error:
+            time.sleep(0.1)
+    raise RuntimeError('server did not start')
+
+
+def make_batches(ids, count, size, seed):
+    rnd = random.Random(seed)
+    # include some IDs that are not in the mapping
+    return ['\n'.join(rnd.choice(ids) if rnd.random() < 0.95 else
+                      'MISSING{}'.format(rnd.randint(0, 10**6))
+                      for _ in range(size)) + '\n'
+            for _ in range(count)]
+
+
+def run_client(port, batches, latencies):
+    conn = HTTPConnection('127.0.0.1', port)
+    for body in batches:
+        start = time.time()
+        conn.request('POST', '/map', body)
+        response = conn.getresponse()
+        response.read()
+        if response.status != 200:
+            raise RuntimeError('status {}'.format(response.status))
+        latencies.append(time.time() - start)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values)-1, int(len(values) * p / 100.0))]
+
+
+def applyidmap_seconds(mapping, batch):
+    """Return time of one applyidmap.py run for batch."""
+    fd, fn = tempfile.mkstemp(suffix='.txt')
+    with os.fdopen(fd, 'w') as out:
+        out.write(batch)
+    try:
+        start = time.time()
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call([
+                sys.executable, os.path.join(SCRIPTDIR, 'applyidmap.py'),
+                mapping, fn], stdout=devnull, stderr=devnull)
+        return time.time() - start
+    finally:
+        os.remove(fn)
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    mapping = args.mapping
+    if mapping is None:
+        fd, mapping = tempfile.mkstemp(suffix='.dat')
+        with os.fdopen(fd, 'w') as out:
+            write_mapping(out, args.nodes)
+    port = free_port()
+    server = subprocess.Popen([
+        sys.executable, os.path.join(SCRIPTDIR, 'idmapserver.py'),
+        '-p', str(port), mapping])
+    try:
+        wait_for_server(port)
+        ids = read_uniprot_ids(mapping)
+        batches = [make_batches(ids, args.requests, args.batch, i)
+                   for i in range(args.clients)]
+        latencies = [[] for _ in range(args.clients)]
+        threads = [threading.Thread(target=run_client,
+                                    args=(port, batches[i], latencies[i]))
+                   for i in range(args.clients)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+        latencies = [l for client in latencies for l in client]
+        if len(latencies) != args.clients * args.requests:
+            raise RuntimeError('client failed')
+        print('{} clients, {} requests of {} IDs in {:.2f} s'.format(
+            args.clients, len(latencies), args.batch, elapsed))
+        print('{:.1f} requests/s, {:.0f} IDs/s'.format(
+            len(latencies) / elapsed, len(latencies) * args.batch / elapsed))
+        print('latency p50 {:.2f} ms, p99 {:.2f} ms'.format(
+            1000 * percentile(latencies, 50),
+            1000 * percentile(latencies, 99)))
+        print('applyidmap.py for one batch: {:.2f} s'.format(
+            applyidmap_seconds(mapping, batches[0][0])))
+    finally:
+        server.terminate()
+        server.wait()
+        if args.mapping is None:
+            os.remove(mapping)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
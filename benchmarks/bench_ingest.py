@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+# Benchmark peak memory of loading an OBO Graph with json.load
+# (before) against incremental reading with OboGraph.read() (after).
+
+# Each mode is run in a separate process so that peak RSS
+# (ru_maxrss) is measured independently.
+
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import resource
+import tempfile
+import subprocess
+
+BENCHDIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHDIR, '..', 'scripts'))
+
+from synthetic import write_obographs
+
+
+MODES = ['load', 'stream']
+
+
+def argparser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-n', '--nodes', type=int, default=300000,
+                    help='Number of synthetic terms (default 300000)')
+    ap.add_argument('-i', '--input', metavar='FILE', default=None,
+                    help='Use existing JSON-LD file instead of synthetic')
+    ap.add_argument('--measure', choices=MODES, default=None,
+                    help=argparse.SUPPRESS)
+    return ap
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024.0 * 1024 if sys.platform == 'darwin' else 1024.0)
+
+
+def measure(mode, fn):
+    from getidmapping import OboGraph, assure_list
+    start = time.time()
+    if mode == 'load':
+        with open(fn) as f:
+            data = json.load(f)
+        graphs = [OboGraph(g) for g in assure_list(data['graphs'])]
+        for graph in graphs:
+            graph._analyze()
+    else:
+        graphs = list(OboGraph.read(fn))
+    nodes = sum(len(g._node_by_id) for g in graphs)
+    print(json.dumps({
+        'mode': mode,
+        'nodes': nodes,
+        'seconds': time.time() - start,
+        'peak_rss_mb': peak_rss_mb(),
+    }))
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    if args.measure:
+        return measure(args.measure, args.input)
+
+    fn = args.input
+    if fn is None:
+        fd, fn = tempfile.mkstemp(suffix='.jsonld')
+        with os.fdopen(fd, 'w') as out:
+            write_obographs(out, args.nodes)
+    try:
+        size = os.path.getsize(fn) / (1024.0 * 1024)
+        print('input {} ({:.1f} MB)'.format(fn, size))
+        for mode in MODES:
+            output = subprocess.check_output([
+                sys.executable, os.path.abspath(__file__),
+                '--measure', mode, '--input', fn])
+            result = json.loads(output.decode('utf-8'))
+            print('{mode:8s} {nodes:8d} nodes {seconds:7.2f} s '
+                  '{peak_rss_mb:8.1f} MB peak RSS'.format(**result))
+    finally:
+        if args.input is None:
+            os.remove(fn)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
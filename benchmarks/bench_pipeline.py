@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+
+# Benchmark the pipeline stages on synthetic PRO-scale data and keep
+# a history of results.
+
+# Generates a synthetic OBO file (see synthetic.py) and runs on it, in
+# order, preprocess_obo.process_file(), obo2og.process(),
+# compact_og.process(), getidmapping.process_graph() with -g and -f,
+# and applyidmap.py end to end, each stage reading the output of the
+# previous one. Each stage is run in a separate process so that peak
+# RSS (ru_maxrss) is measured independently.
+
+# Results are appended to a JSON history file and compared to the
+# latest earlier run with the same parameters and Python version;
+# stages more than --threshold slower are reported as regressions and
+# give exit status 1.
+
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import platform
+import resource
+import tempfile
+import subprocess
+
+BENCHDIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHDIR, '..', 'scripts'))
+
+from synthetic import write_obo
+
+
+# Stages in order, with input and output file names in the work
+# directory
+STAGES = [
+    ('preprocess', 'pr.obo', 'pr.pre.obo'),
+    ('ogconvert', 'pr.pre.obo', 'pr.og'),
+    ('compact', 'pr.og', 'pr.jsonld'),
+    ('idmap-g', 'pr.jsonld', 'pr-idmapping.dat'),
+    ('idmap-f', 'pr.jsonld', 'pr-idmapping-f.dat'),
+    ('apply', 'pr-idmapping.dat', 'pr-mapped.txt'),
+]
+
+STAGE_NAMES = [s[0] for s in STAGES]
+
+DEFAULT_HISTORY = os.path.join(BENCHDIR, 'history.json')
+
+
+def argparser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-n', '--nodes', type=int, default=300000,
+                    help='Number of synthetic terms (default 300000)')
+    ap.add_argument('-s', '--seed', type=int, default=0,
+                    help='Random seed')
+    ap.add_argument('-S', '--stages', metavar='STAGE', nargs='+',
+                    choices=STAGE_NAMES, default=STAGE_NAMES,
+                    help='Stages to time (default all; the stages '
+                    'before them are run untimed for their inputs)')
+    ap.add_argument('-w', '--workdir', metavar='DIR', default=None,
+                    help='Keep generated files in DIR (default temporary)')
+    ap.add_argument('-H', '--history', metavar='FILE',
+                    default=DEFAULT_HISTORY,
+                    help='JSON history file (default benchmarks/'
+                    'history.json)')
+    ap.add_argument('--no-history', default=False, action='store_true',
+                    help='Do not read or write the history file')
+    ap.add_argument('-t', '--threshold', type=float, default=0.2,
+                    help='Slowdown reported as regression (default 0.2)')
+    ap.add_argument('--measure', choices=STAGE_NAMES, default=None,
+                    help=argparse.SUPPRESS)
+    return ap
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024.0 * 1024 if sys.platform == 'darwin' else 1024.0)
+
+
+def run_stage(stage, input_fn, output_fn):
+    from common import open_output
+    if stage == 'preprocess':
+        import preprocess_obo
+        with open_output(output_fn) as out:
+            preprocess_obo.process_file(input_fn, out)
+    elif stage == 'ogconvert':
+        import obo2og
+        with open_output(output_fn) as out:
+            obo2og.process(input_fn, out)
+    elif stage == 'compact':
+        import compact_og
+        with open_output(output_fn) as out:
+            compact_og.process(input_fn, out)
+    elif stage in ('idmap-g', 'idmap-f'):
+        import getidmapping
+        flag = '-g' if stage == 'idmap-g' else '-f'
+        options = getidmapping.argparser().parse_args([flag, input_fn])
+        with open_output(output_fn) as out:
+            for graph in getidmapping.OboGraph.read(input_fn):
+                getidmapping.process_graph(graph, options, out)
+    elif stage == 'apply':
+        import applyidmap
+        ids_fn = output_fn + '.ids'
+        with open(input_fn) as f, open(ids_fn, 'w') as out:
+            for line in f:
+                out.write(line.split('\t', 1)[0] + '\n')
+        stdout = sys.stdout
+        try:
+            with open(output_fn, 'w') as sys.stdout:
+                applyidmap.main(['applyidmap.py', input_fn, ids_fn])
+        finally:
+            sys.stdout = stdout
+            os.remove(ids_fn)
+    else:
+        raise ValueError(stage)
+
+
+def measure(stage, workdir, nodes):
+    logging.disable(logging.WARNING)    # per-term messages
+    _, input_name, output_name = STAGES[STAGE_NAMES.index(stage)]
+    input_fn = os.path.join(workdir, input_name)
+    output_fn = os.path.join(workdir, output_name)
+    start = time.time()
+    run_stage(stage, input_fn, output_fn)
+    seconds = time.time() - start
+    input_mb = os.path.getsize(input_fn) / (1024.0 * 1024)
+    print(json.dumps({
+        'stage': stage,
+        'seconds': seconds,
+        'peak_rss_mb': peak_rss_mb(),
+        'input_mb': input_mb,
+        'mb_per_s': input_mb / seconds,
+        'terms_per_s': nodes / seconds,
+    }))
+
+
+def git_commit():
+    try:
+        with open(os.devnull, 'w') as devnull:
+            output = subprocess.check_output(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHDIR,
+                stderr=devnull)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode('utf-8').strip()
+
+
+def read_history(fn):
+    if not os.path.exists(fn):
+        return []
+    with open(fn) as f:
+        return json.load(f)
+
+
+def write_history(fn, history):
+    tmp = fn + '.tmp'
+    with open(tmp, 'w') as out:
+        json.dump(history, out, indent=2, sort_keys=True,
+                  separators=(',', ': '))
+        out.write('\n')
+    os.rename(tmp, fn)
+
+
+def comparable(run, other):
+    return all(run[k] == other[k] for k in ('nodes', 'seed', 'python'))
+
+
+def regressions(run, history, threshold):
+    """Return (stage, previous seconds) for stages slower than before."""
+    previous = [r for r in history if comparable(run, r)]
+    if not previous:
+        return []
+    found = []
+    for stage, result in sorted(run['results'].items()):
+        before = previous[-1]['results'].get(stage)
+        if before and result['seconds'] > before['seconds'] * (1+threshold):
+            found.append((stage, before['seconds']))
+    return found
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    if args.measure:
+        return measure(args.measure, args.workdir, args.nodes)
+
+    workdir = args.workdir
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix='bench-pipeline-')
+    elif not os.path.isdir(workdir):
+        os.makedirs(workdir)
+    run = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'nodes': args.nodes,
+        'seed': args.seed,
+        'results': {},
+    }
+    try:
+        with open(os.path.join(workdir, 'pr.obo'), 'w') as out:
+            write_obo(out, args.nodes, args.seed)
+        last = max(STAGE_NAMES.index(s) for s in args.stages)
+        for stage in STAGE_NAMES[:last+1]:
+            output = subprocess.check_output([
+                sys.executable, os.path.abspath(__file__),
+                '--measure', stage, '--workdir', workdir,
+                '--nodes', str(args.nodes)])
+            result = json.loads(output.decode('utf-8'))
+            if stage not in args.stages:
+                continue
+            del result['stage']
+            run['results'][stage] = result
+            print('{:10s} {seconds:7.2f} s {terms_per_s:9.0f} terms/s '
+                  '{mb_per_s:6.1f} MB/s {peak_rss_mb:8.1f} MB peak '
+                  'RSS'.format(stage, **result))
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir)
+
+    if args.no_history:
+        return 0
+    history = read_history(args.history)
+    found = regressions(run, history, args.threshold)
+    for stage, before in found:
+        print('REGRESSION {}: {:.2f} s, previously {:.2f} s'.format(
+            stage, run['results'][stage]['seconds'], before))
+    history.append(run)
+    write_history(args.history, history)
+    return 1 if found else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
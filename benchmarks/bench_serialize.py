@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+# Benchmark write time and peak memory of serializing a compacted
+# JSON-LD document with pretty_dumps() (before) against the
+# incremental writer in compact_og.write_document(), pretty-printed
+# and as NDJSON, with and without orjson.
+
+# Each mode is run in a separate process so that peak RSS
+# (ru_maxrss) is measured independently. The increase of peak RSS
+# over that after loading the document is attributed to writing.
+
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import hashlib
+import resource
+import tempfile
+import subprocess
+
+BENCHDIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHDIR, '..', 'scripts'))
+
+from synthetic import write_obographs
+
+
+MODES = ['dumps', 'stream', 'stream-orjson', 'ndjson', 'ndjson-orjson']
+
+
+def argparser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-n', '--nodes', type=int, default=300000,
+                    help='Number of synthetic terms (default 300000)')
+    ap.add_argument('-i', '--input', metavar='FILE', default=None,
+                    help='Use existing JSON-LD file instead of synthetic')
+    ap.add_argument('--measure', choices=MODES, default=None,
+                    help=argparse.SUPPRESS)
+    return ap
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024.0 * 1024 if sys.platform == 'darwin' else 1024.0)
+
+
+def file_md5(fn):
+    h = hashlib.md5()
+    with open(fn, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def measure(mode, fn):
+    import compact_og
+    if not mode.endswith('-orjson'):
+        compact_og.orjson = None
+    elif compact_og.orjson is None:
+        print(json.dumps({ 'mode': mode, 'skipped': 'orjson not installed' }))
+        return
+    with open(fn) as f:
+        doc = json.load(f)
+    loaded_mb = peak_rss_mb()
+    fd, out_fn = tempfile.mkstemp(suffix='.jsonld')
+    try:
+        start = time.time()
+        with os.fdopen(fd, 'w') as out:
+            if mode == 'dumps':
+                print(compact_og.pretty_dumps(doc), file=out)
+            else:
+                compact_og.write_document(out, doc, mode.startswith('ndjson'))
+        seconds = time.time() - start
+        print(json.dumps({
+            'mode': mode,
+            'seconds': seconds,
+            'peak_rss_mb': peak_rss_mb(),
+            'write_rss_mb': peak_rss_mb() - loaded_mb,
+            'size_mb': os.path.getsize(out_fn) / (1024.0 * 1024),
+            'md5': file_md5(out_fn),
+        }))
+    finally:
+        os.remove(out_fn)
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    if args.measure:
+        return measure(args.measure, args.input)
+
+    fn = args.input
+    if fn is None:
+        fd, fn = tempfile.mkstemp(suffix='.jsonld')
+        with os.fdopen(fd, 'w') as out:
+            write_obographs(out, args.nodes)
+    try:
+        size = os.path.getsize(fn) / (1024.0 * 1024)
+        print('input {} ({:.1f} MB)'.format(fn, size))
+        reference = {}
+        for mode in MODES:
+            output = subprocess.check_output([
+                sys.executable, os.path.abspath(__file__),
+                '--measure', mode, '--input', fn])
+            result = json.loads(output.decode('utf-8'))
+            if 'skipped' in result:
+                print('{mode:14s} skipped: {skipped}'.format(**result))
+                continue
+            # pretty modes must match pretty_dumps(), NDJSON each other
+            kind = 'ndjson' if mode.startswith('ndjson') else 'pretty'
+            reference.setdefault(kind, result['md5'])
+            result['check'] = ('same' if reference[kind] == result['md5']
+                               else 'DIFFERENT')
+            print('{mode:14s} {seconds:7.2f} s {size_mb:7.1f} MB output '
+                  '{peak_rss_mb:8.1f} MB peak RSS ({write_rss_mb:+.1f} MB '
+                  'writing) {check}'.format(**result))
+    finally:
+        if args.input is None:
+            os.remove(fn)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+# Benchmark parsing of OBO comments and synonym lines in
+# preprocess_obo.py against the previous implementation (re.match()
+# with the pattern string on each call), and check that the results
+# are identical.
+
+# With --fuzz N, compares the two on N random lines built from the
+# tokens that are significant to the grammar (quotes, escapes,
+# brackets, braces, comment markers) and reports any differences.
+
+
+from __future__ import print_function
+
+import os
+import re
+import sys
+import time
+import random
+
+BENCHDIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHDIR, '..', 'scripts'))
+
+from preprocess_obo import parse_comment, parse_synonym_line, FormatError
+
+
+FUZZ_TOKENS = [
+    'synonym: ', '"', '\\"', '\\', ' ', '  ', '\t', 'EXACT', 'BROAD',
+    'NARROW', 'RELATED', 'EXACTLY', 'type-1', '[', ']', ', ', 'PMID:1',
+    '{', '}', 'a="b"', '!', ' ! ', 'x', '\n', u'\u00a0',
+]
+
+
+def argparser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-n', '--lines', type=int, default=200000,
+                    help='Number of synthetic lines (default 200000)')
+    ap.add_argument('-i', '--input', metavar='FILE', default=None,
+                    help='Use lines of OBO file instead of synthetic')
+    ap.add_argument('-f', '--fuzz', metavar='N', type=int, default=0,
+                    help='Compare to previous implementation on N '
+                    'random lines instead')
+    ap.add_argument('-s', '--seed', type=int, default=0,
+                    help='Random seed')
+    return ap
+
+
+def regex_parse_comment(line):
+    # parse_comment() before scanning
+    if '!' not in line:
+        return line, None
+    m = re.match(r'^((?:[^"]|"(?:\\"|[^"])*")*)(\s+\!\s.*)$', line)
+    if not m:
+        return line, None
+    else:
+        return m.groups()
+
+
+def regex_parse_synonym_line(line):
+    # parse_synonym_line() before scanning
+    m = re.match(r'^synonym: ("(?:\\"|[^"])*") (EXACT|BROAD|NARROW|RELATED) ([A-Za-z0-9_-]*) *\[(.*)\]\s*((?:\{.*\}\s*)?)$', line)
+    if not m:
+        raise FormatError('failed to parse synonym line: {}'.format(line))
+    string, scope, type_id, xrefs, qualifiers = m.groups()
+    xrefs = [ x for x in xrefs.split(', ') if x]
+    return string, scope, type_id, xrefs, qualifiers
+
+
+def synthetic_lines(n, seed=0):
+    """Return n OBO lines, about half synonyms, in the style of PRO."""
+    rnd = random.Random(seed)
+    lines = []
+    for i in range(n):
+        r = rnd.random()
+        if r < 0.3:
+            lines.append('synonym: "protein {}" EXACT PRO-short-label '
+                         '[PRO:DNx]'.format(i))
+        elif r < 0.45:
+            lines.append('synonym: "P{:05d}" RELATED [UniProtKB:P{:05d}, '
+                         'PMID:{}]'.format(i, i, i))
+        elif r < 0.5:
+            lines.append('synonym: "\\"{}\\" form" NARROW [] '
+                         '{{source="PRO"}} ! note'.format(i))
+        elif r < 0.7:
+            lines.append('is_a: PR:{:09d} ! protein {}'.format(i, i))
+        else:
+            lines.append('xref: UniProtKB:P{:05d}'.format(i))
+    return lines
+
+
+def read_lines(fn):
+    with open(fn) as f:
+        return [l.rstrip('\n') for l in f]
+
+
+def parse_all(lines, comment, synonym):
+    results = []
+    for line in lines:
+        line, _ = comment(line)
+        if line.startswith('synonym:'):
+            results.append(synonym(line))
+    return results
+
+
+def parse_or_error(parse, line):
+    try:
+        return parse(line)
+    except FormatError as e:
+        return str(e)
+
+
+def fuzz(n, seed=0):
+    """Compare to previous implementation on n random lines."""
+    rnd = random.Random(seed)
+    differences = 0
+    for i in range(n):
+        tokens = [rnd.choice(FUZZ_TOKENS)
+                  for _ in range(rnd.randint(0, 12))]
+        if rnd.random() < 0.8:
+            tokens.insert(0, 'synonym: "')
+        line = ''.join(tokens)
+        if sys.version_info[0] < 3:
+            line = line.encode('utf-8')
+        if parse_comment(line) != regex_parse_comment(line):
+            print('comment differs: {!r}'.format(line))
+            differences += 1
+        if (parse_or_error(parse_synonym_line, line) !=
+            parse_or_error(regex_parse_synonym_line, line)):
+            print('synonym differs: {!r}'.format(line))
+            differences += 1
+    print('{} random lines, {} differences'.format(n, differences))
+    return 1 if differences else 0
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    if args.fuzz:
+        return fuzz(args.fuzz, args.seed)
+
+    if args.input is not None:
+        lines = read_lines(args.input)
+    else:
+        lines = synthetic_lines(args.lines, args.seed)
+    synonyms = sum(1 for l in lines if l.startswith('synonym:'))
+    print('{} lines, {} synonyms'.format(len(lines), synonyms))
+    results = {}
+    for mode, comment, synonym in [
+            ('regex', regex_parse_comment, regex_parse_synonym_line),
+            ('current', parse_comment, parse_synonym_line)]:
+        start = time.time()
+        results[mode] = parse_all(lines, comment, synonym)
+        print('{:8s} {:7.3f} s'.format(mode, time.time() - start))
+    if results['regex'] != results['current']:
+        print('results differ')
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
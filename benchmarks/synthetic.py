@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+# Generate synthetic Protein Ontology-like data for benchmarking, as
+# OBO or as compacted OBO Graphs JSON-LD.
+
+# Terms form an is_a DAG with occasional multiple inheritance, carry
+# "Category=" comments, UniProt xrefs, synonyms and deprecation flags
+# in roughly the proportions seen in PRO.
+
+
+from __future__ import print_function
+
+import sys
+import json
+import random
+
+
+CATEGORIES = [
+    'family', 'gene', 'organism-gene', 'sequence', 'organism-sequence',
+    'modification', 'organism-modification', 'complex',
+]
+
+
+def argparser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-n', '--nodes', type=int, default=300000,
+                    help='Number of terms (default 300000, about PRO size)')
+    ap.add_argument('-s', '--seed', type=int, default=0,
+                    help='Random seed')
+    ap.add_argument('-f', '--format', choices=['obo', 'obographs'],
+                    default='obographs', help='Output format (default '
+                    'obographs)')
+    return ap
+
+
+def synthetic_terms(n, seed=0):
+    """Generate n synthetic terms as dicts.
+
+    Term i has is_a parents among the preceding terms, so the terms are
+    in topological order.
+    """
+    rnd = random.Random(seed)
+    for i in range(n):
+        term = {
+            'id': 'PR:{:09d}'.format(i),
+            'lbl': 'synthetic protein {}'.format(i),
+            'category': rnd.choice(CATEGORIES) if rnd.random() < 0.8 else None,
+            'xrefs': [],
+            'synonyms': [],
+            'parents': [],
+            'deprecated': rnd.random() < 0.02,
+        }
+        if rnd.random() < 0.6:
+            term['xrefs'].append('UniProtKB:P{:07d}'.format(i))
+        if rnd.random() < 0.02:
+            term['xrefs'].append('UniProtKB:Q{:07d}'.format(i))
+        for j in range(rnd.randint(0, 3)):
+            term['synonyms'].append('SYN{}-{}'.format(i, j))
+        if i > 0:
+            # mostly recent parents for deep chains, some multiple
+            # inheritance
+            parents = 1 if rnd.random() < 0.85 else 2
+            for _ in range(parents):
+                p = max(0, i - 1 - int(rnd.expovariate(0.1)))
+                if p not in term['parents']:
+                    term['parents'].append(p)
+        yield term
+
+
+def obographs_node(term):
+    """Return compacted OBO Graphs JSON-LD node for synthetic term."""
+    meta = {
+        'basicPropertyValues': {
+            'pred': 'hasOBONamespace',
+            'val': 'protein',
+        },
+    }
+    if term['category']:
+        meta['comments'] = 'Category={}.'.format(term['category'])
+    if term['xrefs']:
+        xrefs = [{ 'val': x } for x in term['xrefs']]
+        meta['xrefs'] = xrefs[0] if len(xrefs) == 1 else xrefs
+    if term['synonyms']:
+        synonyms = [{ 'pred': 'hasExactSynonym', 'val': s }
+                    for s in term['synonyms']]
+        meta['synonyms'] = synonyms[0] if len(synonyms) == 1 else synonyms
+    if term['deprecated']:
+        meta['deprecated'] = True
+    return {
+        'id': term['id'],
+        'lbl': term['lbl'],
+        'meta': meta,
+        'type': 'CLASS',
+    }
+
+
+def write_obographs(out, n, seed=0):
+    """Write synthetic compacted OBO Graphs JSON-LD document."""
+    terms = list(synthetic_terms(n, seed))
+    out.write('{\n  "graphs": {\n    "edges": [\n')
+    first = True
+    for term in terms:
+        for p in term['parents']:
+            if not first:
+                out.write(',\n')
+            first = False
+            out.write('      ' + json.dumps({
+                'sub': term['id'],
+                'pred': 'is_a',
+                'obj': terms[p]['id'],
+            }, sort_keys=True))
+    out.write('\n    ],\n    "id": "http://purl.obolibrary.org/obo/pr.owl",')
+    out.write('\n    "nodes": [\n')
+    for i, term in enumerate(terms):
+        if i:
+            out.write(',\n')
+        out.write('      ' + json.dumps(obographs_node(term), sort_keys=True))
+    out.write('\n    ]\n  }\n}\n')
+
+
+def write_obo(out, n, seed=0):
+    """Write synthetic OBO file with the terms of write_obographs()."""
+    terms = list(synthetic_terms(n, seed))
+    out.write('format-version: 1.2\n'
+              'data-version: synthetic\n'
+              'synonymtypedef: PRO-short-label "PRO short label" EXACT\n'
+              'ontology: pr\n')
+    for term in terms:
+        lines = ['', '[Term]', 'id: ' + term['id'], 'name: ' + term['lbl']]
+        if term['category']:
+            lines.append('comment: Category={}.'.format(term['category']))
+        for synonym in term['synonyms']:
+            lines.append('synonym: "{}" EXACT PRO-short-label '
+                         '[PRO:DNx]'.format(synonym))
+        for xref in term['xrefs']:
+            lines.append('xref: ' + xref)
+        for p in term['parents']:
+            lines.append('is_a: {} ! {}'.format(terms[p]['id'],
+                                                terms[p]['lbl']))
+        if term['deprecated']:
+            lines.append('is_obsolete: true')
+        out.write('\n'.join(lines) + '\n')
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    if args.format == 'obo':
+        write_obo(sys.stdout, args.nodes, args.seed)
+    else:
+        write_obographs(sys.stdout, args.nodes, args.seed)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,9 @@
+#!/bin/bash
+
+# Export compacted graph and ID mapping to an SQLite database.
+
+SCRIPTDIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
+
+set -eu
+
+exec python "$SCRIPTDIR/../scripts/rebuild.py" "$@" dbexport
@@ -11,7 +11,9 @@ import logging
 from collections import defaultdict
 from logging import info, warn
 
-from common import read_mapping, read_ids
+from common import read_mapping, iter_ids
+from mappingindex import MappingIndex, is_mapping_index
+from ontologydb import MappingDatabase, is_database
 
 
 logging.getLogger().setLevel(logging.INFO)
@@ -24,8 +26,10 @@ def argparser():
                     help='Echo original ID in output')
     ap.add_argument('-r', '--reverse', default=False, action='store_true',
                     help='Reverse IDs in mapping')
-    ap.add_argument('mapping', metavar='FILE', help='ID mapping')
-    ap.add_argument('ids', metavar='FILE', help='IDs to map')
+    ap.add_argument('mapping', metavar='FILE',
+                    help='ID mapping, compiled mapping or database ("-" '
+                    'for stdin)')
+    ap.add_argument('ids', metavar='FILE', help='IDs to map ("-" for stdin)')
     return ap
 
 
@@ -36,25 +40,42 @@ def to_dict(mapping):
     return dict_
 
 
+def map_id(id_, mapping, echo=False):
+    """Return output line for ID and whether it was found in mapping.
+
+    IDs not in mapping are output as-is.
+    """
+    if id_ in mapping:
+        mapped, found = ' '.join(id2 for type_, id2 in mapping[id_]), True
+    else:
+        mapped, found = id_, False
+    if echo:
+        mapped = '{}\t{}'.format(id_, mapped)
+    return mapped + '\n', found
+
+
 def main(argv):
-    args = argparser().parse_args(argv[1:])
-    ids = read_ids(args.ids)
-    mapping = read_mapping(args.mapping, args.reverse)
-    mapping = to_dict(mapping)
+    ap = argparser()
+    args = ap.parse_args(argv[1:])
+    if args.mapping == '-' and args.ids == '-':
+        ap.error('only one of FILE arguments can be "-"')
+    if args.mapping != '-' and is_mapping_index(args.mapping):
+        mapping = MappingIndex(args.mapping).view(args.reverse)
+    elif args.mapping != '-' and is_database(args.mapping):
+        mapping = MappingDatabase(args.mapping).view(args.reverse)
+    else:
+        mapping = read_mapping(args.mapping, args.reverse)
+        mapping = to_dict(mapping)
     found, missing = 0, 0
     output = sys.stdout.write
-    for id_ in ids:
-        if args.echo:
-            output('{}\t'.format(id_))
-        if id_ in mapping:
-            mapped = [id2 for type_, id2 in mapping[id_]]
+    for id_ in iter_ids(args.ids):    # stream IDs, output as we go
+        line, is_found = map_id(id_, mapping, args.echo)
+        if is_found:
             found += 1
-            output(' '.join(mapped))
         else:
             warn('no mapping for {}'.format(id_))
             missing += 1
-            output(id_)
-        output('\n')
+        output(line)
     info('found {} ids, missing {}'.format(found, missing))
 
 
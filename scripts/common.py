@@ -1,19 +1,315 @@
 from __future__ import print_function
 
+import io
+import os
 import re
+import sys
+import gzip
+import json
+import mmap
+import time
+import shutil
+import struct
+import stat
+import tempfile
+import contextlib
 
+from array import array
+from collections import OrderedDict
 from logging import info
 
+from six import PY2, iteritems
+
+from instrument import span, metrics
+
+try:
+    import zstandard    # optional, for zstd compressed files
+except ImportError:
+    zstandard = None
+
+
+# Compression formats by file name suffix and by magic bytes
+COMPRESSION_SUFFIX = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+COMPRESSION_MAGIC = {
+    'gzip': b'\x1f\x8b',
+    'zstd': b'\x28\xb5\x2f\xfd',
+}
+
+GZIP_LEVEL = 6
+
+ZSTD_LEVEL = 3
+
+# Characters collected by BatchWriter per write
+WRITE_BATCH = 1 << 20
+
+# Characters read per write when copying worker output
+COPY_BLOCK = 1 << 20
+
 
 class FormatError(Exception):
     pass
 
 
-def read_mapping(fn, reverse=False):
-    """Read ID mapping."""
+def compression_by_suffix(fn):
+    """Return compression format by file name suffix, or None."""
+    for compression, suffix in iteritems(COMPRESSION_SUFFIX):
+        if fn.endswith(suffix):
+            return compression
+    return None
+
+
+def strip_compression_suffix(fn):
+    """Return file name without compression suffix, if any."""
+    compression = compression_by_suffix(fn)
+    if compression is None:
+        return fn
+    return fn[:-len(COMPRESSION_SUFFIX[compression])]
+
+
+def _compression_of_head(head):
+    for compression, magic in iteritems(COMPRESSION_MAGIC):
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def _sniff_compression(f, fn):
+    # Compression of open binary file, read from its start if it is a
+    # regular file (and rewound), by file name suffix otherwise so that
+    # pipes are not read from
+    if not stat.S_ISREG(os.fstat(f.fileno()).st_mode):
+        return compression_by_suffix(fn)
+    compression = _compression_of_head(f.read(4))
+    f.seek(0)
+    return compression
+
+
+def compression_of(fn):
+    """Return compression format of file by its content, or None.
+
+    For files other than regular files, such as pipes, the format is
+    given by the file name suffix (see COMPRESSION_SUFFIX).
+    """
+    if not os.path.isfile(fn):
+        return compression_by_suffix(fn)
+    with open(fn, 'rb') as f:
+        return _compression_of_head(f.read(4))
+
+
+def _zstandard():
+    if zstandard is None:
+        raise ImportError('zstandard module required for zstd compression')
+    return zstandard
+
+
+class BatchWriter(object):
+    """Text output joining written strings into large writes."""
+
+    def __init__(self, out, size=WRITE_BATCH):
+        self.out = out
+        self.size = size
+        self._parts = []
+        self._length = 0
+
+    def write(self, s):
+        self._parts.append(s)
+        self._length += len(s)
+        if self._length >= self.size:
+            self._write_batch()
+
+    def _write_batch(self):
+        with span('write'):
+            self.out.write(''.join(self._parts))
+        self._parts, self._length = [], 0
+
+    def flush(self):
+        if self._parts:
+            self._write_batch()
+        with span('write'):
+            self.out.flush()
+
+
+class LruCache(object):
+    """Mapping of at most size items, evicting least recently used.
+
+    Counts hits and misses of get() and evicted items. If size is
+    None, nothing is evicted.
+    """
+
+    def __init__(self, size=None):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        try:
+            value = self._items.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self._items[key] = value    # most recently used last
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        self._items.pop(key, None)
+        self._items[key] = value
+        if self.size is not None and len(self._items) > self.size:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._items.clear()
+
+    def stats(self):
+        return '{} items, {} hits, {} misses, {} evictions'.format(
+            len(self._items), self.hits, self.misses, self.evictions)
+
+
+@contextlib.contextmanager
+def open_input(fn):
+    """Open file for reading, give stdin if fn is "-".
+
+    Files compressed with gzip or zstd are decompressed.
+    """
+    if fn == '-':
+        yield sys.stdin
+        return
+    with open(fn, 'rb') as raw:    # opened once, pipes can't be reopened
+        compression = _sniff_compression(raw, fn)
+        if compression is None:
+            f = raw
+        elif compression == 'gzip':
+            f = gzip.GzipFile(fileobj=raw, mode='rb')
+        else:
+            f = _zstandard().ZstdDecompressor().stream_reader(raw)
+            f = io.BufferedReader(f)
+        if not PY2:
+            f = io.TextIOWrapper(f)    # decode as open() does
+        try:
+            yield f
+        finally:
+            f.close()
+
+
+@contextlib.contextmanager
+def open_output(fn=None, compression=None):
+    """Open BatchWriter for file, give one for stdout if fn is None or "-".
+
+    Output is compressed with the given format, by default that of the
+    file name suffix (see COMPRESSION_SUFFIX). Compressed output does
+    not depend on the file name or time, so identical text gives an
+    identical file.
+    """
+    if fn is None or fn == '-':
+        out = BatchWriter(sys.stdout)
+        yield out
+        out.flush()
+        return
+    if compression is None:
+        compression = compression_by_suffix(fn)
+    if compression is None:
+        with open(fn, 'w') as f:
+            out = BatchWriter(f)
+            yield out
+            out.flush()
+        return
+    with open(fn, 'wb') as raw:
+        if compression == 'gzip':
+            f = gzip.GzipFile(filename='', mode='wb', fileobj=raw,
+                              compresslevel=GZIP_LEVEL, mtime=0)
+        else:
+            compressor = _zstandard().ZstdCompressor(level=ZSTD_LEVEL)
+            f = compressor.stream_writer(raw)
+        if not PY2:
+            f = io.TextIOWrapper(f)    # encode as open() does
+        out = BatchWriter(f)
+        yield out
+        out.flush()
+        f.close()
+
+
+@contextlib.contextmanager
+def open_outputs(fns):
+    """Open BatchWriters for list of files, see open_output()."""
+    if not fns:
+        yield []
+        return
+    with open_output(fns[0]) as out:
+        with open_outputs(fns[1:]) as rest:
+            yield [out] + rest
+
+
+def _process_file_job(job):
+    # Run function for file in worker process, writing to temporary
+    # files; return time and metrics
+    function, fn, tmp_fns, verbosity = job
+    metrics.reset()
+    metrics.verbosity = verbosity
+    start = time.time()
+    with open_outputs(tmp_fns) as outs:
+        function(fn, outs)
+    return (time.time() - start, metrics.spans, metrics.counters,
+            metrics.notes)
+
+
+def process_files(function, fns, outs, jobs=1):
+    """Call function(fn, outs) for each file, jobs files at a time.
+
+    With jobs > 1, files are processed in separate processes writing
+    to temporary files, which are copied to outs in the order of fns,
+    so output is identical to that of processing the files in order.
+    function must be picklable, e.g. a module-level function or a
+    functools.partial of one. The time of each file is recorded in
+    metrics.files.
+    """
+    if jobs <= 1 or len(fns) <= 1:
+        for fn in fns:
+            start = time.time()
+            function(fn, outs)
+            metrics.files[fn] = time.time() - start
+        return
+    from multiprocessing import Pool
+    tmpdir = tempfile.mkdtemp(prefix='process-files-')
+    pool = None
+    try:
+        tasks = [(function, fn, [os.path.join(tmpdir, '{}-{}'.format(i, j))
+                                 for j in range(len(outs))],
+                  metrics.verbosity) for i, fn in enumerate(fns)]
+        pool = Pool(min(jobs, len(fns)))
+        results = pool.imap(_process_file_job, tasks)
+        for (_, fn, tmp_fns, _), result in zip(tasks, results):
+            seconds, spans, counters, notes = result
+            metrics.files[fn] = seconds
+            metrics.merge(spans, counters, notes)
+            for out, tmp_fn in zip(outs, tmp_fns):
+                with open(tmp_fn) as f:
+                    for block in iter(lambda: f.read(COPY_BLOCK), ''):
+                        out.write(block)
+                os.remove(tmp_fn)
+    finally:
+        if pool is not None:
+            pool.terminate()    # idle unless a file failed
+            pool.join()
+        shutil.rmtree(tmpdir)
+
+
+def iter_mapping(fn, reverse=False):
+    """Generate (id1, type, id2) from ID mapping file."""
     read = 0
-    mapping = []
-    with open(fn) as f:
+    with open_input(fn) as f:
         for i, l in enumerate(f, start=1):
             l = l.rstrip('\n')
             f = l.split('\t')
@@ -22,21 +318,177 @@ def read_mapping(fn, reverse=False):
             id1, id_type, id2 = f
             if reverse:
                 id1, id2 = id2, id1
-            mapping.append((id1, id_type, id2))
+            yield id1, id_type, id2
             read += 1
     info('Read {} mappings from {}'.format(read, fn))
-    return mapping
 
 
-def read_ids(fn):
-    ids = list()
-    with open(fn) as f:
+def read_mapping(fn, reverse=False):
+    """Read ID mapping."""
+    return list(iter_mapping(fn, reverse))
+
+
+def iter_ids(fn):
+    """Generate IDs from file with one ID per line."""
+    read = 0
+    with open_input(fn) as f:
         for i, l in enumerate(f, start=1):
             l = l.rstrip()
             m = re.match(r'^\S+$', l)
             if not m:
                 raise FormatError('Expected ID, got {}: line {} in {}'.format(
                     l, i, fn))
-            ids.append(l)
-    info('Read {} ids from {}'.format(len(ids), fn))
-    return ids
+            yield l
+            read += 1
+    info('Read {} ids from {}'.format(read, fn))
+
+
+def read_ids(fn):
+    return list(iter_ids(fn))
+
+
+class MappedArray(object):
+    """Read-only little-endian array view on a buffer such as an mmap.
+
+    Elements are unpacked on access, so no part of the buffer is
+    copied or parsed when the array is created.
+    """
+
+    def __init__(self, buf, offset, length, typecode='i'):
+        self.buf = buf
+        self.offset = offset
+        self.length = length
+        self.typecode = typecode
+        self.struct = struct.Struct('<' + typecode)
+        self.itemsize = self.struct.size
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(self.length)
+            if step != 1:
+                return [self[j] for j in range(start, stop, step)]
+            count = max(0, stop-start)
+            return list(struct.unpack_from(
+                '<{}{}'.format(count, self.typecode),
+                self.buf, self.offset + start*self.itemsize))
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError('MappedArray index out of range')
+        return self.struct.unpack_from(
+            self.buf, self.offset + i*self.itemsize)[0]
+
+
+def array_bytes(values, typecode='i'):
+    """Return values as little-endian packed array bytes."""
+    a = array(typecode, values)
+    if sys.byteorder != 'little':
+        a.byteswap()
+    return a.tobytes() if hasattr(a, 'tobytes') else a.tostring()
+
+
+def string_pool(strings):
+    """Return (offsets, pool) for strings concatenated as UTF-8.
+
+    Strings given as bytes are assumed to be UTF-8 encoded.
+    """
+    offsets, encoded, total = [0], [], 0
+    for s in strings:
+        if not isinstance(s, bytes):
+            s = s.encode('utf-8')
+        encoded.append(s)
+        total += len(s)
+        offsets.append(total)
+    return offsets, b''.join(encoded)
+
+
+def write_sections(fn, magic, header, sections):
+    """Write binary file of sections for access with MappedFile.
+
+    sections is a list of (name, typecode, values), where values are
+    bytes for typecode 'B' and integers otherwise. Layout: magic,
+    header length (uint32), header (JSON: given header with section
+    offsets added), sections, each aligned to 8 bytes.
+    """
+    data, table = [], {}
+    for name, typecode, values in sections:
+        if typecode != 'B':
+            values = array_bytes(values, typecode)
+        data.append((name, values))
+        table[name] = [None, len(values) // struct.calcsize(typecode),
+                       typecode]
+
+    # Assign section offsets relative to the end of the header
+    offset = 0
+    for name, b in data:
+        offset += (-offset) % 8
+        table[name][0] = offset
+        offset += len(b)
+    header = dict(header, sections=table)
+    header = json.dumps(header, sort_keys=True).encode('utf-8')
+    start = len(magic) + 4 + len(header)
+    header_pad = (-start) % 8
+    with open(fn, 'wb') as f:
+        f.write(magic)
+        f.write(struct.pack('<I', len(header) + header_pad))
+        f.write(header + b' ' * header_pad)
+        written = 0
+        for name, b in data:
+            f.write(b'\0' * ((-written) % 8))
+            written += (-written) % 8
+            f.write(b)
+            written += len(b)
+
+
+def has_magic(fn, magic):
+    """Return True if file starts with magic, False otherwise.
+
+    Only regular files are checked, so pipes such as <(cat FILE) are
+    not read from and can then be read as text.
+    """
+    if not os.path.isfile(fn):
+        return False
+    with open(fn, 'rb') as f:
+        return f.read(len(magic)) == magic
+
+
+class MappedFile(object):
+    """Memory-mapped file written with write_sections().
+
+    Integer sections are available as MappedArray attributes named
+    by the section with a leading underscore, byte sections through
+    _string().
+    """
+
+    def __init__(self, fn, magic):
+        self.fn = fn
+        self._file = open(fn, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(magic)] != magic:
+            raise FormatError('unexpected file type: {}'.format(fn))
+        header_len = struct.unpack_from('<I', self._mmap, len(magic))[0]
+        start = len(magic) + 4
+        header = json.loads(self._mmap[start:start+header_len].decode('utf-8'))
+        base = start + header_len
+        self.header = header
+        self._pools = {}
+        for name, (offset, length, typecode) in header['sections'].items():
+            if typecode == 'B':
+                self._pools[name] = base + offset
+            else:
+                setattr(self, '_' + name, MappedArray(
+                    self._mmap, base + offset, length, typecode))
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+    def _bytes(self, pool, pointers, i):
+        start = self._pools[pool]
+        return self._mmap[start+pointers[i]:start+pointers[i+1]]
+
+    def _string(self, pool, pointers, i):
+        return self._bytes(pool, pointers, i).decode('utf-8')
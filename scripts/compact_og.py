@@ -2,6 +2,14 @@
 
 # Compact OBO Graphs with respect to JSON-LD context.
 
+# Output is written incrementally, as pretty-printed JSON (default) or
+# with --ndjson as newline-delimited JSON: first the compacted document
+# without the nodes and edges of its graphs, then one line for each
+# node and each edge, graph by graph. Keys are sorted in both formats.
+# Items are serialized with orjson if installed, with output identical
+# to the standard library json (items with floats are serialized with
+# json).
+
 # Known issues:
 # - The assumption that 'oboInOwl' is the base for relative IRIs fails
 #   for at least 'is_a': ('rdfs:subClassOf') and 'inverseOf' (likely
@@ -12,13 +20,23 @@
 
 from __future__ import print_function
 
+import re
 import sys
 import json
 
-from six import string_types
+from collections import defaultdict
+from functools import partial
+from six import string_types, iteritems, reraise
 from logging import warn
 
-from pyld import jsonld
+from jsonstream import iter_graph_events, STREAMED
+from common import open_input, open_output, process_files
+from instrument import add_arguments, session, span, count
+
+try:
+    import orjson    # optional, faster serialization
+except ImportError:
+    orjson = None
 
 
 # Base URL to use for OBO Graphs identifiers.
@@ -96,6 +114,17 @@ context.update({
     'pr': 'http://purl.obolibrary.org/obo/pr#',
 })
 
+# Nodes and edges per task in parallel compaction
+CHUNK_ITEMS = 2000
+
+# Placeholder for graph arrays in write_pretty()
+PLACEHOLDER = '\0{} {}'
+
+PLACEHOLDER_RE = re.compile(r'"\\u0000(\d+) (\w+)"')
+
+# Encoder output pieces per write in write_document()
+WRITE_CHUNKS = 10000
+
 # Compaction algorithm options
 options = {
     'base': baseiri,
@@ -106,10 +135,168 @@ options = {
 }
 
 
+def argparser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-j', '--jobs', type=int, default=1,
+                    help='Number of parallel processes, for files if '
+                    'several are given (default 1)')
+    ap.add_argument('-n', '--ndjson', default=False, action='store_true',
+                    help='Output newline-delimited JSON')
+    ap.add_argument('-p', '--pyld', default=False, action='store_true',
+                    help='Compact using pyld (reference implementation)')
+    ap.add_argument('files', metavar='FILE', nargs='+',
+                    help='Input OBO Graphs files')
+    return add_arguments(ap)
+
+
 def pretty_dumps(obj):
     return json.dumps(obj, sort_keys=True, indent=2, separators=(',', ': '))
 
 
+def _has_float(obj):
+    # Return True if obj contains a float at any depth
+    if isinstance(obj, float):
+        return True
+    if isinstance(obj, dict):
+        obj = obj.values()
+    elif not isinstance(obj, list):
+        return False
+    for value in obj:
+        if isinstance(value, (dict, list, float)) and _has_float(value):
+            return True
+    return False
+
+
+def json_dumps(obj, pretty=True):
+    """Return pretty_dumps(obj), or compact JSON if pretty is False.
+
+    Uses orjson if available. Its output is only used when it is ASCII,
+    as the standard library escapes other characters, and when obj has
+    no floats, which orjson formats differently (e.g. 1e16 for 1e+16).
+    """
+    if orjson is not None and not _has_float(obj):
+        option = orjson.OPT_SORT_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        try:
+            data = orjson.dumps(obj, option=option)
+        except TypeError:    # e.g. integer out of range
+            data = None
+        if data is not None and data.isascii() and b'\x7f' not in data:
+            return data.decode('ascii')
+    if pretty:
+        return pretty_dumps(obj)
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'))
+
+
+def graph_arrays(doc):
+    """Return arrays of graph items in document by (graph index, key)."""
+    graphs, arrays = doc.get('graphs', []), {}
+    for index, graph in enumerate(graphs if isinstance(graphs, list)
+                                  else [graphs]):
+        for key in STREAMED:
+            if key in graph:
+                value = graph[key]    # compactArrays
+                arrays[(index, key)] = value if isinstance(value, list) \
+                                       else [value]
+    return arrays
+
+
+def _skeleton(doc, arrays, value):
+    # Return document with graph arrays replaced by value(index, key),
+    # or removed if value is None
+    graphs = doc['graphs']
+    skeleton = []
+    for index, graph in enumerate(graphs if isinstance(graphs, list)
+                                  else [graphs]):
+        graph = dict(graph)
+        for i, key in arrays:
+            if i != index:
+                continue
+            elif value is None:
+                graph.pop(key, None)
+            else:
+                graph[key] = value(i, key)
+        skeleton.append(graph)
+    if not isinstance(graphs, list):
+        skeleton = skeleton[0]
+    return dict(doc, graphs=skeleton)
+
+
+def write_pretty(out, doc, arrays, encode=None):
+    """Write document as pretty_dumps() would, one item at a time.
+
+    The arrays map (graph index, key) to the compacted items of arrays
+    of graphs in doc["graphs"], which replace the values in the graphs.
+    The items are given as pretty_dumps() texts, or as values if encode
+    is given to serialize them.
+    """
+    if 'graphs' not in doc:
+        out.write(json_dumps(doc))
+        return
+    placeholder = lambda i, key: PLACEHOLDER.format(i, key)
+    parts = PLACEHOLDER_RE.split(pretty_dumps(_skeleton(doc, arrays,
+                                                          placeholder)))
+    for i in range(0, len(parts), 3):
+        out.write(parts[i])
+        if i + 1 == len(parts):
+            break
+        line = parts[i][parts[i].rfind('\n')+1:]
+        indent = ' ' * (len(line) - len(line.lstrip(' ')))
+        items = arrays[(int(parts[i+1]), parts[i+2])]
+        if len(items) != 1:
+            out.write('[' if items else '[]')
+            indent += '  '
+        for j, item in enumerate(items):
+            if len(items) != 1:
+                out.write(',\n' if j else '\n')
+                out.write(indent)
+            text = encode(item) if encode is not None else item
+            out.write(text.replace('\n', '\n' + indent))
+        if len(items) > 1:
+            out.write('\n' + indent[:-2] + ']')
+
+
+def write_ndjson(out, doc, arrays, encode=None):
+    """Write document as newline-delimited JSON.
+
+    The first line is the document without the graph arrays, followed
+    by a line for each node and then each edge of each graph. Arrays
+    are given as for write_pretty(), with compact JSON texts.
+    """
+    if 'graphs' not in doc:
+        out.write(json_dumps(doc, pretty=False) + '\n')
+        return
+    out.write(json_dumps(_skeleton(doc, arrays, None), pretty=False) + '\n')
+    for index, key in sorted(arrays, key=lambda a: (a[0], a[1] != 'nodes')):
+        for item in arrays[(index, key)]:
+            out.write(encode(item) if encode is not None else item)
+            out.write('\n')
+
+
+def write_document(out, doc, ndjson=False):
+    """Write compacted document as pretty JSON or NDJSON."""
+    arrays = graph_arrays(doc)
+    if ndjson:
+        encode = lambda item: json_dumps(item, pretty=False)
+        write_ndjson(out, doc, arrays, encode)
+    elif orjson is None:
+        # a single pass of the encoder is faster than one per item
+        encoder = json.JSONEncoder(sort_keys=True, indent=2,
+                                   separators=(',', ': '))
+        chunks = []
+        for chunk in encoder.iterencode(doc):
+            chunks.append(chunk)
+            if len(chunks) >= WRITE_CHUNKS:
+                out.write(''.join(chunks))
+                chunks = []
+        out.write(''.join(chunks) + '\n')
+    else:
+        write_pretty(out, doc, arrays, json_dumps)
+        out.write('\n')
+
+
 def _relativize(obj, iri_terms, base):
     # relativize() implementation
     if isinstance(obj, (string_types, int, float, bool)):
@@ -118,7 +305,7 @@ def _relativize(obj, iri_terms, base):
         for o in obj:
             _relativize(o, iri_terms, base)
     elif isinstance(obj, dict):
-        for k, v in obj.iteritems():
+        for k, v in iteritems(obj):
             if (k in iri_terms and isinstance(v, string_types) and
                 v.startswith(base)):
                 obj[k] = v[len(base):]
@@ -156,7 +343,7 @@ def relativize(obj, context, base=None):
     # http://json-ld.org/spec/latest/json-ld/#the-context .
     # Note: only checks top-level terms.
     iri_terms = set()
-    for k, v in context.iteritems():
+    for k, v in iteritems(context):
         if isinstance(v, dict) and v.get('@type') == '@id':
             iri_terms.add(k)
 
@@ -164,17 +351,296 @@ def relativize(obj, context, base=None):
     return obj
 
 
-def process(fn, out=sys.stdout):
-    with open(fn) as f:
-        d = json.load(f)
+def _expand_term(value, context):
+    # Expand term definition IRI with respect to prefixes in context
+    if isinstance(value, dict):
+        value = value.get('@id')
+    if not isinstance(value, string_types) or value.startswith('@'):
+        return None
+    if ':' in value:
+        prefix, suffix = value.split(':', 1)
+        if prefix in context and not suffix.startswith('//'):
+            return _expand_term(context[prefix], context) + suffix
+    return value
+
+
+def _flatten(items):
+    # Nested arrays are flattened and nulls dropped in JSON-LD expansion
+    for item in items:
+        if isinstance(item, list):
+            for i in _flatten(item):
+                yield i
+        elif item is not None:
+            yield item
+
+
+class Compactor(object):
+    """Compaction of OBO Graphs with respect to a fixed JSON-LD context.
+
+    Specialized alternative to jsonld.compact() followed by
+    relativize() that compacts, aliases and relativizes in a single
+    pass over the input. Produces output identical to pyld (versions
+    before 1.0, i.e. JSON-LD 1.0 compact IRI selection) for documents
+    that
+
+    - use only terms defined in the context as keys,
+    - have no relative IRI values with dot segments, queries or
+      fragments, and
+    - have no embedded contexts or other JSON-LD keywords.
+
+    Keys that are not defined in the context are dropped, as in JSON-LD
+    expansion. Keys that are not plain terms raise a ValueError.
+    """
+
+    def __init__(self, context, base=None):
+        if base is None:
+            base = context.get('@base')
+        if base is None:
+            raise ValueError('Compactor: no @base')
+        self.base = base
+        self.id_terms = set()    # aliases of '@id'
+        self.iri_terms = set()    # terms with '@type': '@id'
+        self.mappings = {}    # term to expanded IRI
+        for term, value in iteritems(context):
+            if term.startswith('@'):
+                continue
+            if value == '@id':
+                self.id_terms.add(term)
+            elif isinstance(value, dict) and value.get('@type') == '@id':
+                self.iri_terms.add(term)
+            iri = _expand_term(value, context)
+            if iri is not None:
+                self.mappings[term] = iri
+        # Index term IRIs by length for compact IRI (CURIE) selection
+        self.prefixes = {}
+        for term, iri in iteritems(self.mappings):
+            if ':' not in term:
+                self.prefixes.setdefault(iri, []).append(term)
+        self.prefix_lengths = sorted(set(len(i) for i in self.prefixes))
+
+    def expand_iri(self, value):
+        """Expand IRI value in the way JSON-LD expansion does for '@id'."""
+        if ':' not in value:
+            return self.base + value    # relative IRI
+        prefix, suffix = value.split(':', 1)
+        if prefix == '_' or suffix.startswith('//'):
+            return value    # blank node or absolute IRI
+        if prefix in self.mappings:
+            return self.mappings[prefix] + suffix
+        return value
+
+    def compact_iri(self, iri):
+        """Return shortest usable CURIE for IRI, or relative IRI."""
+        candidate = None
+        for length in self.prefix_lengths:
+            if length >= len(iri):
+                break
+            for term in self.prefixes.get(iri[:length], ()):
+                curie = term + ':' + iri[length:]
+                if (curie in self.mappings and
+                    self.mappings[curie] != iri):
+                    continue
+                if (candidate is None or len(curie) < len(candidate) or
+                    (len(curie) == len(candidate) and curie < candidate)):
+                    candidate = curie
+        if candidate is not None:
+            return candidate
+        if iri.startswith(self.base):
+            return iri[len(self.base):]
+        return iri
+
+    def compact_id(self, value):
+        """Compact '@id' value (e.g. 'id', 'sub', 'obj')."""
+        return self.compact_iri(self.expand_iri(value))
+
+    def compact_array(self, items):
+        """Return compacted items as array (compactArrays)."""
+        return items[0] if len(items) == 1 else items
+
+    def compact(self, obj):
+        """Return compacted and relativized copy of object."""
+        if isinstance(obj, list):
+            return self.compact_array([self.compact(o) for o in _flatten(obj)])
+        elif isinstance(obj, dict):
+            compacted = {}
+            for k, v in iteritems(obj):
+                if v is None:
+                    continue
+                if ':' in k or k.startswith('@'):
+                    raise ValueError('Compactor: unsupported key {}'.format(k))
+                if k not in self.mappings and k not in self.id_terms:
+                    continue    # undefined term, dropped in expansion
+                if (k in self.id_terms or k in self.iri_terms) and \
+                   isinstance(v, string_types):
+                    v = self.compact_id(v)
+                    if k in self.iri_terms and v.startswith(self.base):
+                        v = v[len(self.base):]    # relativize()
+                else:
+                    v = self.compact(v)
+                compacted[k] = v
+            return compacted
+        else:
+            return obj
+
+
+def compact_document(d, context, base):
+    """Compact and relativize OBO Graphs document."""
+    compacted = Compactor(context, base).compact(d)
+    compacted['@context'] = context
+    return compacted
+
+
+def compact_stream(f, context, base):
+    """Compact and relativize OBO Graphs document read incrementally.
+
+    Equivalent to compact_document() on the loaded document, but only
+    the compacted nodes and edges are held in memory.
+    """
+    compactor = Compactor(context, base)
+    items = dict((e, []) for e in STREAMED.values())
+    graphs, compacted = [], {}
+    for event, index, value in iter_graph_events(f):
+        if event in items:
+            for item in _flatten([value]):
+                items[event].append(compactor.compact(item))
+        elif event == 'graph':
+            graph = compactor.compact(value)
+            for key, e in iteritems(STREAMED):
+                count(key, len(items[e]))
+                if key in graph:
+                    graph[key] = compactor.compact_array(items[e])
+                items[e] = []
+            graphs.append(graph)
+        else:
+            compacted = compactor.compact(value)
+            if 'graphs' in compacted:
+                compacted['graphs'] = compactor.compact_array(graphs)
+    compacted['@context'] = context
+    return compacted
+
+
+_compactor = None    # Compactor of worker process
+
+
+_pretty = True    # format of worker output
+
+
+def _init_worker(context, base, pretty):
+    global _compactor, _pretty
+    _compactor, _pretty = Compactor(context, base), pretty
+
+
+def _compact_chunk(chunk):
+    # Return JSON texts of compacted items given as JSON
+    tag, texts = chunk
+    items = _flatten([json.loads(t) for t in texts])
+    return tag, [json_dumps(_compactor.compact(i), _pretty) for i in items]
+
+
+def _iter_chunks(f, fields):
+    # Generate ((graph index, key), texts) for nodes and edges, and
+    # store graph and document fields by graph index in fields
+    keys = dict((e, k) for k, e in iteritems(STREAMED))
+    tag, texts = None, []
+    for event, index, value in iter_graph_events(f, raw=True):
+        if event in keys:
+            if (index, keys[event]) != tag or len(texts) >= CHUNK_ITEMS:
+                if texts:
+                    yield tag, texts
+                tag, texts = (index, keys[event]), []
+            texts.append(value)
+        else:
+            fields.append((event, index, value))
+    if texts:
+        yield tag, texts
+
+
+def write_compacted_parallel(f, context, base, jobs, out=sys.stdout,
+                             ndjson=False):
+    """Compact OBO Graphs document with jobs processes and write it.
+
+    Output is identical to write_document() of compact_stream(). Nodes
+    and edges are compacted and formatted in chunks by the worker
+    processes, each of which processes the context once.
+    """
+    from multiprocessing import Pool
+    compactor = Compactor(context, base)
+    fields, arrays, errors = [], defaultdict(list), []
+    def chunks():
+        # read in the pool task thread, which does not report errors
+        try:
+            for chunk in _iter_chunks(f, fields):
+                yield chunk
+        except Exception:
+            errors.append(sys.exc_info())
+    pool = Pool(jobs, _init_worker, (context, base, not ndjson))
+    try:
+        with span('compact'):
+            for tag, texts in pool.imap(_compact_chunk, chunks()):
+                arrays[tag].extend(texts)
+                count(tag[1], len(texts))
+    finally:
+        pool.close()
+        pool.join()
+    if errors:
+        reraise(*errors[0])
+    graphs, compacted = [], {}
+    for event, index, value in fields:
+        if event == 'graph':
+            graph = compactor.compact(value)
+            for key in STREAMED:
+                if key in graph:
+                    arrays[(index, key)]    # empty unless items seen
+                else:
+                    arrays.pop((index, key), None)
+            graphs.append(graph)
+        else:
+            compacted = compactor.compact(value)
+            if 'graphs' in compacted:
+                compacted['graphs'] = compactor.compact_array(graphs)
+    compacted['@context'] = context
+    with span('serialize'):
+        if ndjson:
+            write_ndjson(out, compacted, arrays)
+        else:
+            write_pretty(out, compacted, arrays)
+            out.write('\n')
+
+
+def compact_document_pyld(d, context, base):
+    """Compact and relativize OBO Graphs document using pyld."""
+    from pyld import jsonld
     d = jsonld.compact(d, context, options)
-    d = relativize(d, context, baseiri)
-    print(pretty_dumps(d), file=out)
+    return relativize(d, context, base)
+
+
+def process(fn, out=sys.stdout, reference=False, jobs=1, ndjson=False):
+    if reference:
+        with span('load'), open_input(fn) as f:
+            d = json.load(f)
+        with span('compact'):
+            d = compact_document_pyld(d, context, baseiri)
+    elif jobs > 1:
+        return write_compacted_parallel(fn, context, baseiri, jobs, out,
+                                        ndjson)
+    else:
+        with span('compact'):    # includes reading
+            d = compact_stream(fn, context, baseiri)
+    with span('serialize'):
+        write_document(out, d, ndjson)
+
+
+def process_file(reference, jobs, ndjson, fn, outs):
+    process(fn, outs[0], reference, jobs, ndjson)
 
 
 def main(argv):
-    for fn in argv[1:]:
-        process(fn)
+    args = argparser().parse_args(argv[1:])
+    # Several files are processed in parallel, a single one in chunks
+    jobs = args.jobs if len(args.files) == 1 else 1
+    function = partial(process_file, args.pyld, jobs, args.ndjson)
+    with session(args), open_output() as out:
+        process_files(function, args.files, [out], args.jobs)
 
 
 if __name__ == '__main__':
@@ -10,7 +10,9 @@ import logging
 
 from logging import info
 
-from common import read_mapping, read_ids
+from common import iter_mapping, iter_ids
+from mappingindex import MappingIndex, is_mapping_index
+from ontologydb import MappingDatabase, is_database
 
 
 logging.getLogger().setLevel(logging.INFO)
@@ -21,27 +23,58 @@ def argparser():
     ap = argparse.ArgumentParser()
     ap.add_argument('-r', '--reverse', default=False, action='store_true',
                     help='Reverse IDs in mapping')
-    ap.add_argument('mapping', metavar='FILE', help='ID mapping')
-    ap.add_argument('ids', metavar='FILE', help='IDs to filter to')
+    ap.add_argument('mapping', metavar='FILE',
+                    help='ID mapping, compiled mapping or database ("-" '
+                    'for stdin)')
+    ap.add_argument('ids', metavar='FILE',
+                    help='IDs to filter to ("-" for stdin)')
     return ap
 
 
-def filter_mapping(mapping, ids):
-    filtered, removed = [], 0
+def iter_filtered(mapping, ids):
+    """Generate items of mapping with first ID in ids."""
+    kept, removed = 0, 0
     for id1, id_type, id2 in mapping:
         if id1 in ids:
-            filtered.append((id1, id_type, id2))
+            yield id1, id_type, id2
+            kept += 1
         else:
             removed += 1
-    info('Filtered to {} (removed {})'.format(len(filtered), removed))
+    info('Filtered to {} (removed {})'.format(kept, removed))
+
+
+def filter_mapping(mapping, ids):
+    return list(iter_filtered(mapping, ids))
+
+
+def filter_mapping_index(index, ids, reverse=False):
+    """Return rows of compiled mapping or database with first ID in ids.
+
+    Rows are returned in the order of the original mapping.
+    """
+    rows = sorted(r for id_ in ids for r in index.find(id_, reverse))
+    filtered = [index.row(r, reverse) for r in rows]
+    info('Filtered to {} (removed {})'.format(
+        len(filtered), len(index)-len(filtered)))
     return filtered
 
 
 def main(argv):
-    args = argparser().parse_args(argv[1:])
-    ids = set(read_ids(args.ids))
-    mapping = read_mapping(args.mapping, args.reverse)
-    filtered = filter_mapping(mapping, ids)
+    ap = argparser()
+    args = ap.parse_args(argv[1:])
+    if args.mapping == '-' and args.ids == '-':
+        ap.error('only one of FILE arguments can be "-"')
+    ids = set(iter_ids(args.ids))
+    if args.mapping != '-' and is_mapping_index(args.mapping):
+        index = MappingIndex(args.mapping)
+        filtered = filter_mapping_index(index, ids, args.reverse)
+    elif args.mapping != '-' and is_database(args.mapping):
+        index = MappingDatabase(args.mapping)
+        filtered = filter_mapping_index(index, ids, args.reverse)
+    else:
+        # stream mapping, only the IDs are held in memory
+        mapping = iter_mapping(args.mapping, args.reverse)
+        filtered = iter_filtered(mapping, ids)
     for m in filtered:
         print('\t'.join(m))
 
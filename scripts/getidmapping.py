@@ -6,11 +6,34 @@
 
 from __future__ import print_function
 
+import os
 import sys
 import json
 
-from collections import defaultdict
-from logging import info, warn
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, OrderedDict
+from functools import partial
+from logging import info
+
+from graphindex import GraphIndex, is_index_file, write_index
+from graphindex import category_flag, DEPRECATED
+from jsonstream import iter_graph_events
+from common import open_output, open_outputs, process_files, LruCache
+from instrument import add_arguments, session, span, count
+from instrument import note, note_warning
+
+
+# Default maximum number of items in each memo table of a graph
+CACHE_SIZE = 100000
+
+# Generalization levels of multi-level output with the values of the
+# -f and -g options that give each level
+LEVELS = OrderedDict([
+    ('exact', (False, False)),
+    ('gene', (False, True)),
+    ('family', (True, False)),
+])
 
 
 def argparser():
@@ -22,11 +45,72 @@ def argparser():
                     help='Generalize IDs to "Category=family" level')
     ap.add_argument('-g', '--generalize', default=False, action='store_true',
                     help='Generalize PRO IDs to "Category=gene" level')
+    ap.add_argument('-w', '--wide', default=False, action='store_true',
+                    help='Output TSV of UniProt ID and PRO IDs at exact, '
+                    'gene and family level')
+    ap.add_argument('-o', '--output', metavar='LEVEL=FILE', default=[],
+                    action='append', help='Write mapping generalized to '
+                    'LEVEL ({}) to FILE; repeat for several levels in '
+                    'one pass'.format(', '.join(LEVELS)))
+    ap.add_argument('--cache-size', metavar='N', type=int,
+                    default=CACHE_SIZE, help='Maximum number of items in '
+                    'each memo table of a graph (default {}); only used '
+                    'by generalization of graphs without precomputed '
+                    'ancestors, which -g, -f, -w and -o compute'.format(
+                        CACHE_SIZE))
+    ap.add_argument('-j', '--jobs', metavar='N', type=int, default=1,
+                    help='Process up to N files in parallel; output is in '
+                    'the order of the files (default 1)')
     ap.add_argument('files', metavar='FILE', nargs='+',
-                    help='Input PubTator files')
+                    help='Input OBO Graphs JSON-LD or graph index files')
+    return add_arguments(ap)
+
+
+def index_argparser():
+    import argparse
+    ap = argparse.ArgumentParser(prog='getidmapping.py index')
+    ap.add_argument('-o', '--output', metavar='FILE', default=None,
+                    help='Output index (default input with suffix .idx)')
+    ap.add_argument('file', metavar='FILE',
+                    help='Input OBO Graphs JSON-LD file')
+    return ap
+
+
+# Queries of the query subcommand: (number of IDs per query, method)
+QUERIES = {
+    'ancestors': (1, 'ancestors'),
+    'descendants': (1, 'descendants'),
+    'subclass': (2, 'is_subclass'),
+    'lca': (2, 'lowest_common_ancestors'),
+}
+
+
+def query_argparser():
+    import argparse
+    ap = argparse.ArgumentParser(prog='getidmapping.py query')
+    ap.add_argument('-c', '--category', default=None,
+                    help='Only output nodes with "Category=<category>"')
+    ap.add_argument('--cache-size', metavar='N', type=int,
+                    default=CACHE_SIZE, help='Maximum number of memoized '
+                    'ancestors (default {})'.format(CACHE_SIZE))
+    ap.add_argument('query', choices=sorted(QUERIES),
+                    help='ancestors or descendants of each ID, or for '
+                    'each pair of IDs, whether the first is a subclass of '
+                    'the second or their lowest common ancestors')
+    ap.add_argument('file', metavar='FILE',
+                    help='Input OBO Graphs JSON-LD or graph index file')
+    ap.add_argument('ids', metavar='ID', nargs='+', help='Node IDs')
     return ap
 
 
+# Node fields OboGraphNode can keep, by OBO Graphs key (categories are
+# read from comments); the ID is always kept
+NODE_FIELDS = ('lbl', 'deprecated', 'comments', 'xrefs')
+
+# Edge predicates OboGraph analyzes
+PREDICATES = ('is_a',)
+
+
 class FormatError(Exception):
     pass
 
@@ -45,11 +129,15 @@ def is_proteinontology_node(node):
 
 
 def is_deprecated(node):
+    if isinstance(node, (OboGraphNode, IndexedNode)):
+        return node.flags & DEPRECATED != 0
     meta = get_meta(node)
     return meta.get('deprecated') is True
 
 
 def get_meta(node):
+    if 'meta' not in node:
+        return {}    # e.g. referenced but undeclared class
     metas = assure_list(node['meta'])
     if len(metas) != 1:
         raise FormatError('expected one meta, got {}'.format(len(metas)))
@@ -74,8 +162,29 @@ def uniprot_ids(ids):
     return filtered
 
 
+def get_categories(meta):
+    """Return categories given as "Category=<category>." comments."""
+    prefix, categories = 'Category=', []
+    for c in assure_list(meta.get('comments', [])):
+        if c.startswith(prefix) and '.' in c:
+            categories.append(c[len(prefix):c.index('.')])
+    return categories
+
+
+def get_uniprot_ids(node):
+    if isinstance(node, OboGraphNode):
+        return list(node.xrefs)
+    elif isinstance(node, IndexedNode):
+        return node.graph.index.xrefs(node.index)
+    return uniprot_ids(get_xrefs(get_meta(node)))
+
+
 def has_category(node, category):
     """Return True if node has given category, False otherwise."""
+    if isinstance(node, OboGraphNode):
+        return node.flags & category_flag(node.categories, category) != 0
+    elif isinstance(node, IndexedNode):
+        return node.flags & node.graph.category_flag(category) != 0
     category_string = 'Category={}.'.format(category)
     meta = get_meta(node)
     for c in assure_list(meta.get('comments', [])):
@@ -84,44 +193,48 @@ def has_category(node, category):
     return False
 
 
+def _parents_ancestors(node, graph, category, ancestors):
+    # Node numbers of the ancestors of the parents of node, in order
+    numbers, seen = [], set()
+    for parent in graph.parents(node):
+        for ancestor in ancestors(parent, graph, category):
+            if ancestor.index not in seen:
+                numbers.append(ancestor.index)
+                seen.add(ancestor.index)
+    return tuple(numbers)
+
+
 def nearest_ancestors(node, graph, category):
     """Return list of nearest ancestors with given category."""
-    id_ = node['id']
-    cache = nearest_ancestors.cache[id(graph)][category]
-    if id_ not in cache:
+    analysis = graph.analysis
+    if analysis is not None and category in analysis.nearest:
+        return analysis.ancestors(node, analysis.nearest[category])
+    cache, key = graph.cache('nearest_ancestors'), (category, node.index)
+    numbers = cache.get(key)
+    if numbers is None:
         if has_category(node, category):
-            cache[id_] = [node]    # already at target level
+            numbers = (node.index,)    # already at target level
         else:
-            parents_ancestors, seen = [], set()
-            for parent in graph.parents(node):
-                for ancestor in nearest_ancestors(parent, graph, category):
-                    if ancestor['id'] not in seen:
-                        parents_ancestors.append(ancestor)
-                        seen.add(ancestor['id'])
-            cache[id_] = parents_ancestors
-    return cache[id_]
-nearest_ancestors.cache = defaultdict(lambda: defaultdict(lambda :defaultdict(list)))
+            numbers = _parents_ancestors(node, graph, category,
+                                         nearest_ancestors)
+        cache[key] = numbers
+    return [graph.node(i) for i in numbers]
 
 
 def furthest_ancestors(node, graph, category):
     """Return list of most distant ancestors with given category."""
-    id_ = node['id']
-    cache = furthest_ancestors.cache[id(graph)][category]
-    if id_ not in cache:
-        parents_ancestors, seen = [], set()
-        for parent in graph.parents(node):
-            for ancestor in furthest_ancestors(parent, graph, category):
-                if ancestor['id'] not in seen:
-                    parents_ancestors.append(ancestor)
-                    seen.add(ancestor['id'])
-        if parents_ancestors:
-            cache[id_] = parents_ancestors    # more distant in category
-        elif has_category(node, category):
-            cache[id_] = [node]    # node is most distant
-        else:
-            cache[id_] = []    # no ancestors in category
-    return cache[id_]
-furthest_ancestors.cache = defaultdict(lambda: defaultdict(lambda :defaultdict(list)))
+    analysis = graph.analysis
+    if analysis is not None and category in analysis.furthest:
+        return analysis.ancestors(node, analysis.furthest[category])
+    cache, key = graph.cache('furthest_ancestors'), (category, node.index)
+    numbers = cache.get(key)
+    if numbers is None:
+        numbers = _parents_ancestors(node, graph, category,
+                                     furthest_ancestors)
+        if not numbers and has_category(node, category):
+            numbers = (node.index,)    # node is most distant
+        cache[key] = numbers    # empty if no ancestors in category
+    return [graph.node(i) for i in numbers]
 
 
 def generalize_to_nearest(node, category, graph, options):
@@ -132,29 +245,38 @@ def generalize_to_nearest(node, category, graph, options):
     """
     generalized = nearest_ancestors(node, graph, category)
     if not generalized:
-        info('no {} ancestors: {}'.format(category, node))
+        note('no ancestors', 'no {} ancestors: {}', category, node)
         return node
     elif len(generalized) == 1:
         only = generalized[0]
         if only['id'] == node['id']:
-            info('not generalized to {}: {}'.format(category, node))
+            note('not generalized', 'not generalized to {}: {}', category,
+                 node)
         else:
-            info('generalized {} to {} {}'.format(node, category, only))
+            note('generalized', 'generalized {} to {} {}', node, category,
+                 only)
         return only
     else:
         assert(len(generalized)) > 1, 'internal error'
-        # Multiple candidates, filter out closer to root as "further"
-        by_depth = list(sorted((graph.min_depth(g), g) for g in generalized))
+        # Multiple candidates, filter out closer to root as "further".
+        # Ties are ordered by ID, as the node dicts compared in Python 2.
+        by_depth = [(graph.min_depth(g), g) for g in generalized]
+        by_depth.sort(key=lambda d: (d[0], d[1]['id']))
         max_depth = by_depth[-1][0]
         filtered = [g[1] for g in by_depth if g[0] < max_depth]
         generalized = [g[1] for g in by_depth if g[0] == max_depth]
         liststr = lambda l: ', '.join(str(i) for i in l)
         if filtered:
-            info('filtered shallower generalizations for {} -> {}, kept {}'\
-                 .format(str(node), liststr(filtered), liststr(generalized)))
+            note('filtered shallower', 'filtered shallower generalizations '
+                 'for {} -> {}, kept {}', node, liststr(filtered),
+                 liststr(generalized))
         if len(generalized) > 1:
-            warn('generalized to multiple, arbitrarily taking first: {} -> {}'\
-                 .format(str(node), liststr(generalized)))
+            note_warning('generalized to multiple', 'generalized to '
+                         'multiple, arbitrarily taking first: {} -> {}',
+                         node, liststr(generalized))
+        else:
+            note('generalized', 'generalized {} to {} {}', node, category,
+                 generalized[0])
         return generalized[0]
 
 
@@ -180,50 +302,194 @@ def generalize_to_family(node, graph, options):
     return generalize_to_nearest(node, 'family', graph, options)
 
 
-def process_node(node, graph, options):
-    meta = get_meta(node)
-    xrefs = get_xrefs(meta)
-    uids = uniprot_ids(xrefs)
-    if len(uids) > 1:
-        warn('multiple UniProt IDs for {}: {}'.format(node['id'], uids))
+def generalize(node, graph, family, gene, options):
+    """Return node generalized as with options -f (family) and -g."""
     orig, generalized = node, False
-    if options.family:
+    if family:
         node = generalize_to_family(node, graph, options)
-        generalized = node is not orig
-    if options.generalize and not generalized:
+        generalized = node['id'] != orig['id']
+    if gene and not generalized:
         node = generalize_to_gene(node, graph, options)
-        generalized = node is not orig
+    return node
+
+
+def node_uniprot_ids(node):
+    uids = get_uniprot_ids(node)
+    if len(uids) > 1:
+        note_warning('multiple UniProt IDs', 'multiple UniProt IDs for '
+                     '{}: {}', node['id'], uids)
+    return uids
+
+
+def process_node(node, graph, options, out=sys.stdout):
+    uids = node_uniprot_ids(node)
+    node = generalize(node, graph, options.family, options.generalize,
+                      options)
     for uid in uids:
-        print('{}\tPRO\t{}'.format(uid, node['id']))
+        out.write('{}\tPRO\t{}\n'.format(uid, node['id']))
 
 
-class OboGraphNode(dict):
-    """Node in OBO Graph"""
+def process_node_levels(node, graph, options, levels, out=sys.stdout):
+    """Output mappings of node generalized to several levels.
 
-    def __init__(self, *args, **argv):
-        dict.__init__(self, *args, **argv)
+    levels maps names in LEVELS to outputs for the mapping at that
+    level, or to None for columns of a TSV line written to out with
+    the UniProt ID followed by the PRO IDs at those levels.
+    """
+    uids = node_uniprot_ids(node)
+    ids = OrderedDict()
+    for level, (family, gene) in LEVELS.items():
+        if level in levels:
+            ids[level] = generalize(node, graph, family, gene, options)['id']
+    columns = [ids[level] for level in ids if levels[level] is None]
+    for uid in uids:
+        for level, id_ in ids.items():
+            if levels[level] is not None:
+                levels[level].write('{}\tPRO\t{}\n'.format(uid, id_))
+        if columns:
+            out.write('\t'.join([uid] + columns) + '\n')
+
+
+class OboGraphNode(object):
+    """Node in OBO Graph, supports the OBO Graphs node 'id' and 'lbl'.
+
+    Only the information needed for ID mapping is kept: flags for
+    deprecation and categories (numbered in the list categories, shared
+    by the nodes of a graph) and UniProt IDs, not the node meta, and of
+    that only the NODE_FIELDS the graph was read with. The index is the
+    position of the node in its graph.
+    """
+
+    __slots__ = ('id', 'lbl', 'flags', 'xrefs', 'index', 'categories')
+
+    def __init__(self, id_, lbl=None, flags=0, xrefs=(), index=None,
+                 categories=()):
+        self.id = id_
+        self.lbl = lbl
+        self.flags = flags
+        self.xrefs = xrefs
+        self.index = index
+        self.categories = categories
+
+    @classmethod
+    def from_dict(cls, node, fields=NODE_FIELDS, categories=None):
+        """Return OboGraphNode for OBO Graphs node dict.
+
+        Only the given NODE_FIELDS are read, the others are left empty.
+        Categories are numbered in the given list, extended with those
+        not yet in it.
+        """
+        meta = get_meta(node)
+        flags, xrefs = 0, ()
+        if categories is None:
+            categories = []
+        if 'deprecated' in fields and meta.get('deprecated') is True:
+            flags = DEPRECATED
+        if 'comments' in fields:
+            for category in get_categories(meta):
+                if category not in categories:
+                    categories.append(category)
+                flags |= category_flag(categories, category)
+        if 'xrefs' in fields:
+            xrefs = tuple(uniprot_ids(get_xrefs(meta)))
+        lbl = node.get('lbl') if 'lbl' in fields else None
+        return cls(node['id'], lbl, flags, xrefs, categories=categories)
+
+    def __getitem__(self, key):
+        if key == 'id':
+            return self.id
+        elif key == 'lbl' and self.lbl is not None:
+            return self.lbl
+        raise KeyError(key)
 
     def __str__(self):
         return '{} ({})'.format(self['id'], self['lbl'])
 
 
-class OboGraph(dict):
-    """OBO Graph"""
+class IsaQueries(object):
+    """Subsumption queries on a graph, answered by its IsaClosure.
+
+    The closure is computed on the first query.
+    """
+
+    _closure = None
+
+    def closure(self):
+        if self._closure is None:
+            self._closure = IsaClosure(self)
+        return self._closure
+
+    def ancestors(self, node):
+        return self.closure().ancestors(node)
+
+    def descendants(self, node):
+        return self.closure().descendants(node)
+
+    def is_subclass(self, node, ancestor):
+        return self.closure().is_subclass(node, ancestor)
+
+    def lowest_common_ancestors(self, node1, node2):
+        return self.closure().lowest_common_ancestors(node1, node2)
+
+
+class GraphCaches(object):
+    """Memo tables of a graph, by name.
+
+    Each table is an LruCache of at most cache_size items. Tables
+    belong to the graph and are freed with it; store node numbers
+    (see node()) rather than nodes in them.
+    """
+
+    cache_size = CACHE_SIZE
+    _caches = None
+
+    def cache(self, name):
+        if self._caches is None:
+            self._caches = {}
+        if name not in self._caches:
+            self._caches[name] = LruCache(self.cache_size)
+        return self._caches[name]
+
+    def caches(self):
+        """Return list of (name, LruCache) pairs."""
+        return sorted((self._caches or {}).items())
+
+
+class OboGraph(dict, IsaQueries, GraphCaches):
+    """OBO Graph
+
+    Nodes and is_a edges are analyzed on first use. Graphs read with
+    read() may keep only some node fields and edge predicates.
+    """
+
+    fields = NODE_FIELDS
+    predicates = PREDICATES
 
     def __init__(self, *args, **argv):
         dict.__init__(self, *args, **argv)
         # lazy init
         self._node_by_id = None
         self._is_a = None
+        self._edges = None    # (sub, obj) of is_a edges while reading
         self._min_depth = {}
+        self._node_list = None
+        self._strings = None    # for interning IDs while reading
+        self.analysis = None    # DagAnalysis, if any
+        self.categories = []    # numbered for OboGraphNode flags
+
+    def node(self, i):
+        if self._node_list is None:
+            self._analyze_nodes()
+        return self._node_list[i]
 
     def nodes(self):
-        for node in assure_list(self.get('nodes', [])):
-            yield OboGraphNode(node)
+        if self._node_list is None:
+            self._analyze_nodes()
+        return iter(self._node_list)
 
     def get_node(self, id_):
         if self._node_by_id is None:
-            self_analyze()
+            self._analyze()
         return self._node_by_id[id_]
 
     def parents(self, node):
@@ -234,6 +500,8 @@ class OboGraph(dict):
 
     def min_depth(self, node):
         """Return length of shortest path from node to root."""
+        if self.analysis is not None:
+            return self.analysis.min_depth(node)
         if self._is_a is None:
             self._analyze()
         id_ = node['id']
@@ -247,50 +515,588 @@ class OboGraph(dict):
         return self._min_depth[id_]
 
     def _analyze(self):
-        self._analyze_nodes()
+        if self._node_list is None:
+            self._analyze_nodes()
+        if 'is_a' not in self.predicates:
+            raise ValueError('graph read without is_a edges')
+        if self._edges is not None:    # read incrementally
+            self._is_a = defaultdict(list)
+            for sub, obj in self._edges:
+                self._is_a[sub].append(obj)
+            self._edges = None
+            return
+        self._strings = dict((id_, id_) for id_ in self._node_by_id)
         self._analyze_edges()
+        self._strings = None
 
     def _analyze_nodes(self):
-        self._node_by_id = {}
-        for node in self.nodes():
-            id_ = node['id']
-            if id_ in self._node_by_id:
-                raise FormatError('duplicate id {}'.format(id_))
-            self._node_by_id[id_] = node
+        self._node_by_id, self._node_list = {}, []
+        for node in assure_list(self.get('nodes', [])):
+            self._add_node(node)
 
     def _analyze_edges(self):
         self._is_a = defaultdict(list)
         edges = assure_list(self.get('edges', []))
         for edge in edges:
-            sub, pred, obj = edge['sub'], edge['pred'], edge['obj']
-            if pred == 'is_a':
-                self._is_a[sub].append(obj)
+            self._add_edge(edge)
 
+    def _intern(self, s):
+        # Share one string object between node and edge references
+        if self._strings is None:
+            return s
+        return self._strings.setdefault(s, s)
 
-def process_graph(graph, options):
-    graph = OboGraph(graph)
-    for node in graph.nodes():
-        if not is_proteinontology_node(node):
-            info('skipping non-PRO node: {}'.format(node['id']))
+    def _add_node(self, node):
+        node = OboGraphNode.from_dict(node, self.fields, self.categories)
+        node.id = self._intern(node.id)
+        if node.id in self._node_by_id:
+            raise FormatError('duplicate id {}'.format(node.id))
+        node.index = len(self._node_list)
+        self._node_by_id[node.id] = node
+        self._node_list.append(node)
+
+    def _add_edge(self, edge):
+        sub, pred, obj = edge['sub'], edge['pred'], edge['obj']
+        if pred == 'is_a':
+            self._is_a[self._intern(sub)].append(self._intern(obj))
+
+    @classmethod
+    def read(cls, fn, fields=NODE_FIELDS, predicates=PREDICATES):
+        """Generate graphs read incrementally from OBO Graphs file.
+
+        Only the node table is built, keeping the given NODE_FIELDS of
+        nodes, and the edges with the given PREDICATES are kept for
+        analysis on the first parents() call; the document is not
+        loaded in full. Without predicates, edges are not decoded.
+        """
+        for predicate in predicates:
+            if predicate not in PREDICATES:
+                raise ValueError('unsupported predicate: {}'.format(predicate))
+        skip = () if predicates else ('edge',)
+        graph = None
+        for event, index, value in iter_graph_events(fn, skip=skip):
+            if event == 'document':
+                continue
+            if graph is None:
+                graph = cls()
+                graph.fields, graph.predicates = fields, predicates
+                graph._node_by_id = {}
+                graph._node_list = []
+                if predicates:
+                    graph._edges = []
+                    graph._strings = {}
+                edges = 0
+            if event == 'node':
+                graph._add_node(value)
+            elif event == 'edge':
+                if value['pred'] in predicates:
+                    graph._edges.append((graph._intern(value['sub']),
+                                         graph._intern(value['obj'])))
+                edges += 1
+            else:
+                graph.update(value)    # other graph fields
+                graph._strings = None
+                count('edges', edges)
+                yield graph
+                graph = None
+
+
+class IndexedNode(object):
+    """Node in graph index, supports the OboGraphNode 'id' and 'lbl'."""
+
+    __slots__ = ('graph', 'index', 'flags')
+
+    def __init__(self, graph, index):
+        self.graph = graph
+        self.index = index
+        self.flags = graph.index.flags(index)
+
+    def __getitem__(self, key):
+        if key == 'id':
+            return self.graph.index.node_id(self.index)
+        elif key == 'lbl':
+            return self.graph.index.label(self.index)
+        raise KeyError(key)
+
+    def __str__(self):
+        return '{} ({})'.format(self['id'], self['lbl'])
+
+
+class IndexedOboGraph(IsaQueries, GraphCaches):
+    """OBO Graph backed by a memory-mapped graph index."""
+
+    def __init__(self, fn):
+        self.index = GraphIndex(fn)
+        self._nodes = {}
+        self._category_flags = {}
+        self._min_depth = {}
+        self.analysis = None    # DagAnalysis, if any
+
+    def node(self, i):
+        if i not in self._nodes:
+            self._nodes[i] = IndexedNode(self, i)
+        return self._nodes[i]
+
+    def nodes(self):
+        for i in range(len(self.index)):
+            yield self.node(i)
+
+    def get_node(self, id_):
+        i = self.index.find(id_)
+        if i is None:
+            raise KeyError(id_)
+        return self.node(i)
+
+    def parents(self, node):
+        return [self.node(p) for p in self.index.parents(node.index)]
+
+    def category_flag(self, category):
+        if category not in self._category_flags:
+            self._category_flags[category] = category_flag(
+                self.index.categories, category)
+        return self._category_flags[category]
+
+    def min_depth(self, node):
+        """Return length of shortest path from node to root."""
+        if self.analysis is not None:
+            return self.analysis.min_depth(node)
+        i = node.index
+        if i not in self._min_depth:
+            parents = self.parents(node)
+            if not parents:
+                self._min_depth[i] = 0    # root
+            else:
+                self._min_depth[i] = 1 + min(
+                    self.min_depth(p) for p in parents)
+        return self._min_depth[i]
+
+
+def _merge(tuples):
+    # Return ordered union of tuples, sharing the tuple if only one is
+    # non-empty
+    merged, seen = (), None
+    for t in tuples:
+        if not t:
             continue
-        if is_deprecated(node) and not options.include_deprecated:
-            info('skipping deprecated: {}'.format(node['id']))
+        elif not merged:
+            merged = t
             continue
-        process_node(node, graph, options)
+        if seen is None:
+            seen, merged = set(merged), list(merged)
+        for i in t:
+            if i not in seen:
+                seen.add(i)
+                merged.append(i)
+    return tuple(merged)
+
+
+def topological_order(parents):
+    """Return node numbers ordered so that parents precede children."""
+    remaining = array('i', (len(p) for p in parents))
+    children = [[] for _ in parents]
+    for child, parent_list in enumerate(parents):
+        for parent in parent_list:
+            children[parent].append(child)
+    order = [i for i, c in enumerate(remaining) if c == 0]
+    for i in order:    # extended while iterating
+        for child in children[i]:
+            remaining[child] -= 1
+            if remaining[child] == 0:
+                order.append(child)
+    if len(order) != len(parents):
+        raise FormatError('is_a cycle in graph')
+    return order
+
+
+class DagAnalysis(object):
+    """Depths and category ancestors of all nodes in the is_a DAG.
+
+    Computed in one pass over the nodes in topological order without
+    recursion. Ancestors are stored as tuples of node numbers in the
+    order nearest_ancestors() and furthest_ancestors() give them, with
+    tuples shared between nodes where they do not differ.
+    """
+
+    def __init__(self, graph, categories):
+        self.nodes = list(graph.nodes())
+        self.index = dict((n['id'], i) for i, n in enumerate(self.nodes))
+        parents = [[self.index[p['id']] for p in graph.parents(n)]
+                   for n in self.nodes]
+        order = topological_order(parents)
+        self.depth = array('i', [0]) * len(self.nodes)
+        for i in order:
+            if parents[i]:
+                self.depth[i] = 1 + min(self.depth[p] for p in parents[i])
+        node_categories = [
+            set(c for c in categories if has_category(n, c))
+            for n in self.nodes
+        ]
+        self.nearest, self.furthest = {}, {}
+        for category in categories:
+            nearest = [()] * len(self.nodes)
+            furthest = [()] * len(self.nodes)
+            for i in order:
+                has = category in node_categories[i]
+                if has:
+                    nearest[i] = (i,)    # already at target level
+                else:
+                    nearest[i] = _merge(nearest[p] for p in parents[i])
+                furthest[i] = _merge(furthest[p] for p in parents[i])
+                if not furthest[i] and has:
+                    furthest[i] = (i,)    # node is most distant
+            self.nearest[category] = nearest
+            self.furthest[category] = furthest
+
+    def min_depth(self, node):
+        return self.depth[self.index[node['id']]]
+
+    def ancestors(self, node, table):
+        return [self.nodes[i] for i in table[self.index[node['id']]]]
+
+
+class IsaClosure(object):
+    """Transitive closure of the is_a DAG for subsumption queries.
+
+    Nodes are numbered in postorder of a depth-first spanning forest,
+    and the descendants of each node are stored as the intervals of
+    numbers they cover (Agrawal et al. 1989). For tree-like graphs
+    most nodes have a single interval, so is_subclass() is a binary
+    search over few intervals and descendants() are read off the
+    intervals. Ancestors are found through the parents and memoized
+    in the 'ancestors' cache of the graph.
+    """
+
+    def __init__(self, graph):
+        self.nodes = list(graph.nodes())
+        self.index = dict((n['id'], i) for i, n in enumerate(self.nodes))
+        n = len(self.nodes)
+        parents = [[self.index[p['id']] for p in graph.parents(node)]
+                   for node in self.nodes]
+        children = [[] for _ in range(n)]
+        for child, parent_list in enumerate(parents):
+            for parent in parent_list:
+                children[parent].append(child)
+        self._parent_ptr, self._parent_idx = array('i', [0]), array('i')
+        for parent_list in parents:
+            self._parent_idx.extend(parent_list)
+            self._parent_ptr.append(len(self._parent_idx))
+        self._ancestors = graph.cache('ancestors')
+        self._number(children, [i for i in range(n) if not parents[i]])
+        self._label(children)
+
+    def _number(self, children, roots):
+        # Number nodes in postorder, with low[i] the lowest number in
+        # the spanning tree of node i
+        n = len(self.nodes)
+        self._post, self._low = array('i', [-1]) * n, array('i', [0]) * n
+        self._by_post = array('i', [0]) * n
+        state, count = bytearray(n), 0    # 1 on stack, 2 done
+        for root in roots:
+            state[root] = 1
+            self._low[root] = count
+            stack = [(root, iter(children[root]))]
+            while stack:
+                i, pending = stack[-1]
+                for child in pending:
+                    if state[child] == 0:
+                        state[child] = 1
+                        self._low[child] = count
+                        stack.append((child, iter(children[child])))
+                        break
+                    elif state[child] == 1:
+                        raise FormatError('is_a cycle in graph')
+                else:
+                    stack.pop()
+                    state[i] = 2
+                    self._post[i], self._by_post[count] = count, i
+                    count += 1
+        if count != n:
+            raise FormatError('is_a cycle in graph')
+
+    def _label(self, children):
+        # Store merged descendant intervals of nodes as ranges of
+        # _start and _end; postorder puts children before parents
+        n = len(self.nodes)
+        self._first, self._count = array('i', [0]) * n, array('i', [0]) * n
+        self._start, self._end = array('i'), array('i')
+        for i in self._by_post:
+            low, post = self._low[i], self._post[i]
+            intervals = [(low, post)]
+            for child in children[i]:
+                first = self._first[child]
+                for k in range(first, first + self._count[child]):
+                    start, end = self._start[k], self._end[k]
+                    if start < low or end > post:    # outside tree
+                        intervals.append((start, end))
+            if len(intervals) > 1:
+                intervals = _merge_intervals(intervals)
+            self._first[i], self._count[i] = len(self._start), len(intervals)
+            for start, end in intervals:
+                self._start.append(start)
+                self._end.append(end)
+
+    def _subsumes(self, j, i):
+        # Return True if node number i is j or its descendant
+        post, first = self._post[i], self._first[j]
+        k = bisect_right(self._start, post, first,
+                         first + self._count[j]) - 1
+        return k >= first and self._end[k] >= post
+
+    def _ancestor_numbers(self, i):
+        found = self._ancestors.get(i)
+        if found is None:
+            found, pending = [], [i]
+            seen = set(pending)
+            for j in pending:    # extended while iterating
+                for k in range(self._parent_ptr[j], self._parent_ptr[j+1]):
+                    p = self._parent_idx[k]
+                    if p not in seen:
+                        seen.add(p)
+                        found.append(p)
+                        pending.append(p)
+            found = tuple(found)
+            self._ancestors[i] = found
+        return found
+
+    def is_subclass(self, node, ancestor):
+        """Return True if node is ancestor or its is_a descendant."""
+        return self._subsumes(self.index[ancestor['id']],
+                              self.index[node['id']])
+
+    def ancestors(self, node):
+        """Return is_a ancestors of node, nearest first."""
+        i = self.index[node['id']]
+        return [self.nodes[j] for j in self._ancestor_numbers(i)]
+
+    def descendants(self, node):
+        """Return is_a descendants of node in postorder."""
+        i = self.index[node['id']]
+        found = []
+        first = self._first[i]
+        for k in range(first, first + self._count[i]):
+            for post in range(self._start[k], self._end[k] + 1):
+                j = self._by_post[post]
+                if j != i:
+                    found.append(self.nodes[j])
+        return found
+
+    def lowest_common_ancestors(self, node1, node2):
+        """Return common ancestors of nodes with no common descendant.
+
+        The nodes themselves count as their ancestors, so that the
+        result for a node and its descendant is the node. Results are
+        in graph order.
+        """
+        i, j = self.index[node1['id']], self.index[node2['id']]
+        common = set((i,) + self._ancestor_numbers(i))
+        common.intersection_update((j,) + self._ancestor_numbers(j))
+        # lowest if its intervals contain no other common ancestor
+        posts, lowest = sorted(self._post[c] for c in common), []
+        for c in common:
+            first, contained = self._first[c], 0
+            for k in range(first, first + self._count[c]):
+                contained += (bisect_right(posts, self._end[k]) -
+                              bisect_left(posts, self._start[k]))
+            if contained == 1:
+                lowest.append(c)
+        return [self.nodes[c] for c in sorted(lowest)]
+
+
+def _merge_intervals(intervals):
+    # Return sorted list of intervals merging overlapping and adjacent
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def generalization_categories(options, levels=None):
+    """Return categories that generalization with options refers to.
+
+    If levels is given, return those of generalization to the levels.
+    """
+    if levels is None:
+        flags = [(options.family, options.generalize)]
+    else:
+        flags = [LEVELS[level] for level in levels]
+    categories = []
+    if any(family for family, gene in flags):
+        categories.append('family')
+    if any(gene for family, gene in flags):
+        categories.extend(['gene', 'organism-gene'])
+    return categories
+
+
+def index_graph(graph, fn):
+    """Write graph index for OBO Graph to file."""
+    if not isinstance(graph, OboGraph):
+        graph = OboGraph(graph)
+    if graph._is_a is None:
+        graph._analyze()
+    ids, labels, flags, parents, xrefs = [], [], [], [], []
+    node_index = {}
+    for node in graph.nodes():
+        node_index[node.id] = len(ids)
+        ids.append(node.id)
+        labels.append(node.lbl or '')
+        flags.append(node.flags)    # numbered as in graph.categories
+        xrefs.append(node.xrefs)
+    for id_ in ids:
+        parent_ids = graph._is_a.get(id_, [])
+        for p in parent_ids:
+            if p not in node_index:
+                raise FormatError('is_a parent not in graph: {}'.format(p))
+        parents.append([node_index[p] for p in parent_ids])
+    write_index(fn, ids, labels, flags, parents, xrefs, graph.categories)
+
+
+def index_main(argv):
+    args = index_argparser().parse_args(argv[1:])
+    output = args.output
+    if output is None:
+        output = os.path.splitext(args.file)[0] + '.idx'
+    graphs = list(OboGraph.read(args.file))
+    if len(graphs) != 1:
+        raise FormatError('expected one graph, got {}'.format(len(graphs)))
+    index_graph(graphs[0], output)
+
+
+def read_graph(fn):
+    """Return the graph of OBO Graphs or graph index file."""
+    if is_index_file(fn):
+        return IndexedOboGraph(fn)
+    graphs = list(OboGraph.read(fn))
+    if len(graphs) != 1:
+        raise FormatError('expected one graph, got {}'.format(len(graphs)))
+    return graphs[0]
+
+
+def query_main(argv):
+    ap = query_argparser()
+    args = ap.parse_args(argv[1:])
+    count, method = QUERIES[args.query]
+    if len(args.ids) % count != 0:
+        ap.error('{} takes pairs of IDs'.format(args.query))
+    graph = read_graph(args.file)
+    graph.cache_size = args.cache_size
+    try:
+        nodes = [graph.get_node(id_) for id_ in args.ids]
+    except KeyError as e:
+        ap.error('not in graph: {}'.format(e.args[0]))
+    query = getattr(graph, method)
+    with open_output() as out:
+        for i in range(0, len(nodes), count):
+            query_nodes = nodes[i:i+count]
+            ids = [n['id'] for n in query_nodes]
+            result = query(*query_nodes)
+            if isinstance(result, bool):
+                out.write('\t'.join(ids + [str(result).lower()]) + '\n')
+                continue
+            for node in result:
+                if (args.category is None or
+                        has_category(node, args.category)):
+                    out.write('\t'.join(ids + [node['id']]) + '\n')
+
+
+def process_graph(graph, options, out=sys.stdout, reuse=None, levels=None):
+    """Output ID mapping for nodes in graph.
+
+    If reuse is given, nodes with IDs in it are not processed, and the
+    output given for the ID in reuse is written instead. If levels is
+    given, output mappings at several levels in one pass (see
+    process_node_levels()); reuse is not supported with levels.
+    """
+    if not isinstance(graph, (OboGraph, IndexedOboGraph)):
+        graph = OboGraph(graph)
+    if levels is not None and reuse is not None:
+        raise ValueError('reuse not supported for multiple levels')
+    categories = generalization_categories(options, levels)
+    if categories:
+        with span('analyze'):
+            graph.analysis = DagAnalysis(graph, categories)
+    with span('generalize'):
+        nodes = 0
+        for node in graph.nodes():
+            nodes += 1
+            if not is_proteinontology_node(node):
+                note('skipped non-PRO', 'skipping non-PRO node: {}',
+                     node['id'])
+                continue
+            if is_deprecated(node) and not options.include_deprecated:
+                note('skipped deprecated', 'skipping deprecated: {}',
+                     node['id'])
+                continue
+            if reuse is not None and node['id'] in reuse:
+                out.write(reuse[node['id']])
+                continue
+            if levels is not None:
+                process_node_levels(node, graph, options, levels, out)
+            else:
+                process_node(node, graph, options, out)
+    count('nodes', nodes)
+    for name, cache in graph.caches():
+        info('{} cache: {}'.format(name, cache.stats()))
+        count('{} cache hits'.format(name), cache.hits)
+        count('{} cache misses'.format(name), cache.misses)
+
+
+def process(fn, options, out=sys.stdout, levels=None):
+    if is_index_file(fn):
+        graphs = iter([IndexedOboGraph(fn)])
+    elif generalization_categories(options, levels):
+        graphs = OboGraph.read(fn)
+    else:
+        # exact IDs: no labels (used in messages), categories or edges
+        graphs = OboGraph.read(fn, ('deprecated', 'xrefs'), ())
+    while True:
+        with span('load'):
+            graph = next(graphs, None)    # read incrementally
+        if graph is None:
+            break
+        graph.cache_size = options.cache_size
+        process_graph(graph, options, out, levels=levels)
 
 
-def process(fn, options):
-    with open(fn) as f:
-        data = json.load(f)
-    graphs = assure_list(data['graphs'])
-    for graph in graphs:
-        process_graph(graph, options)
+def process_file(options, levels, fn, outs):
+    # Process with output outs[0] and list of levels output to outs[1:],
+    # or to wide TSV columns with options.wide
+    if options.wide:
+        levels = OrderedDict((level, None) for level in levels)
+    elif levels:
+        levels = OrderedDict(zip(levels, outs[1:]))
+    process(fn, options, outs[0], levels or None)
 
 
 def main(argv):
-    args = argparser().parse_args(argv[1:])
-    for fn in args.files:
-        process(fn, args)
+    if len(argv) > 1 and argv[1] == 'index':
+        return index_main(argv[1:])
+    elif len(argv) > 1 and argv[1] == 'query':
+        return query_main(argv[1:])
+    ap = argparser()
+    args = ap.parse_args(argv[1:])
+    if args.wide or args.output:
+        if args.family or args.generalize:
+            ap.error('-f and -g cannot be combined with -w or -o')
+        elif args.wide and args.output:
+            ap.error('only one of -w and -o can be given')
+    outputs = OrderedDict()    # level to file name
+    for spec in args.output:
+        level, sep, fn = spec.partition('=')
+        if level not in LEVELS or not sep or not fn:
+            ap.error('expected LEVEL=FILE with LEVEL one of {}: {}'.format(
+                ', '.join(LEVELS), spec))
+        elif level in outputs or fn in outputs.values():
+            ap.error('level or file given twice: {}'.format(spec))
+        outputs[level] = fn
+    levels = list(LEVELS) if args.wide else list(outputs)
+    function = partial(process_file, args, levels)
+    with session(args), open_output() as out, \
+            open_outputs(list(outputs.values())) as level_outs:
+        process_files(function, args.files, [out] + level_outs, args.jobs)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+# Persistent binary index of an OBO Graph for memory-mapped access.
+
+# The index stores nodes under integer IDs (their position in the
+# graph) with the node ID and label strings in string pools, per-node
+# flags (deprecated, categories) as a bitmask, the is_a parent and
+# child adjacency in CSR (compressed sparse row) form, and the UniProt
+# xrefs of each node. All arrays are little-endian 32-bit integers
+# accessed through mmap, so opening an index does not parse or copy
+# it.
+
+# File layout:
+#   MAGIC (8 bytes)
+#   header length (uint32)
+#   header (JSON: node count, categories, section offsets)
+#   sections, each aligned to 8 bytes
+
+
+from __future__ import print_function
+
+from logging import info
+
+from common import MappedFile, write_sections, string_pool, has_magic
+
+
+MAGIC = b'PRGIDX01'
+
+DEPRECATED = 1    # flag bit for deprecated nodes; categories follow
+
+MAX_CATEGORIES = 30
+
+
+class FormatError(Exception):
+    pass
+
+
+def is_index_file(fn):
+    """Return True if the file is a graph index, False otherwise."""
+    return has_magic(fn, MAGIC)
+
+
+def category_flag(categories, category):
+    """Return flag bit for category, or 0 if not in categories."""
+    try:
+        return 1 << (categories.index(category) + 1)
+    except ValueError:
+        return 0
+
+
+def _csr(lists):
+    # Return (pointers, indices) for list of lists of integers
+    pointers, indices = [0], []
+    for l in lists:
+        indices.extend(l)
+        pointers.append(len(indices))
+    return pointers, indices
+
+
+def write_index(fn, ids, labels, flags, parents, xrefs, categories):
+    """Write graph index.
+
+    ids, labels, flags, parents and xrefs are lists indexed by node
+    number; parents contains lists of node numbers and xrefs lists of
+    strings.
+    """
+    if len(categories) > MAX_CATEGORIES:
+        raise FormatError('too many categories: {}'.format(len(categories)))
+    n = len(ids)
+    children = [[] for _ in range(n)]
+    for child, parent_list in enumerate(parents):
+        for parent in parent_list:
+            children[parent].append(child)
+    id_ptr, id_pool = string_pool(ids)
+    lbl_ptr, lbl_pool = string_pool(labels)
+    xref_ptr, xref_strings = _csr(xrefs)
+    xref_str_ptr, xref_pool = string_pool(xref_strings)
+    parent_ptr, parent_idx = _csr(parents)
+    child_ptr, child_idx = _csr(children)
+    encoded = [i.encode('utf-8') for i in ids]
+    id_order = sorted(range(n), key=lambda i: encoded[i])
+
+    sections = [
+        ('id_ptr', 'i', id_ptr),
+        ('ids', 'B', id_pool),
+        ('lbl_ptr', 'i', lbl_ptr),
+        ('lbls', 'B', lbl_pool),
+        ('flags', 'i', flags),
+        ('parent_ptr', 'i', parent_ptr),
+        ('parent_idx', 'i', parent_idx),
+        ('child_ptr', 'i', child_ptr),
+        ('child_idx', 'i', child_idx),
+        ('xref_ptr', 'i', xref_ptr),
+        ('xref_str_ptr', 'i', xref_str_ptr),
+        ('xrefs', 'B', xref_pool),
+        ('id_order', 'i', id_order),
+    ]
+    write_sections(fn, MAGIC, {
+        'nodes': n,
+        'categories': categories,
+    }, sections)
+    info('Wrote index of {} nodes to {}'.format(n, fn))
+
+
+class GraphIndex(MappedFile):
+    """Memory-mapped graph index."""
+
+    def __init__(self, fn):
+        MappedFile.__init__(self, fn, MAGIC)
+        self.categories = self.header['categories']
+        self._size = self.header['nodes']
+
+    def __len__(self):
+        return self._size
+
+    def node_id(self, i):
+        return self._string('ids', self._id_ptr, i)
+
+    def label(self, i):
+        return self._string('lbls', self._lbl_ptr, i)
+
+    def flags(self, i):
+        return self._flags[i]
+
+    def parents(self, i):
+        return self._parent_idx[self._parent_ptr[i]:self._parent_ptr[i+1]]
+
+    def children(self, i):
+        return self._child_idx[self._child_ptr[i]:self._child_ptr[i+1]]
+
+    def xrefs(self, i):
+        return [self._string('xrefs', self._xref_str_ptr, j) for j in
+                range(self._xref_ptr[i], self._xref_ptr[i+1])]
+
+    def find(self, id_):
+        """Return integer ID of node with given ID, or None if none."""
+        lo, hi = 0, self._size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.node_id(self._id_order[mid]) < id_:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._size and self.node_id(self._id_order[lo]) == id_:
+            return self._id_order[lo]
+        return None
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+
+# Serve ID mapping lookups over HTTP.
+
+# Loads an ID mapping once and answers batched lookups with the same
+# output as applyidmap.py, avoiding re-reading the mapping for each
+# list of IDs. The mapping is reloaded when the file changes.
+
+# Usage: POST IDs, one per line, to /map (optional query parameters
+# echo=1 and reverse=1 correspond to applyidmap.py --echo and
+# --reverse). The response body is the applyidmap.py output, with
+# counts of found and missing IDs in the X-Found and X-Missing
+# headers. GET /status returns information on the loaded mapping as
+# JSON.
+
+
+from __future__ import print_function
+
+import os
+import re
+import sys
+import json
+import time
+import logging
+import threading
+
+from logging import info, warn
+
+from six import PY2
+from six.moves.BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from six.moves.socketserver import ThreadingMixIn, UnixStreamServer
+from six.moves.urllib.parse import urlparse, parse_qs
+
+from common import read_mapping, FormatError
+from applyidmap import to_dict, map_id
+
+
+logging.getLogger().setLevel(logging.INFO)
+
+
+ID_RE = re.compile(r'^\S+$')
+
+
+def argparser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-H', '--host', default='127.0.0.1',
+                    help='Host to listen on (default 127.0.0.1)')
+    ap.add_argument('-p', '--port', type=int, default=8765,
+                    help='Port to listen on (default 8765)')
+    ap.add_argument('-s', '--socket', metavar='PATH', default=None,
+                    help='Listen on Unix socket instead of host and port')
+    ap.add_argument('-i', '--interval', type=float, default=5.0,
+                    help='Seconds between checks for changed mapping')
+    ap.add_argument('mapping', metavar='FILE', help='ID mapping')
+    return ap
+
+
+def file_stamp(fn):
+    st = os.stat(fn)
+    return (st.st_mtime, st.st_size, st.st_ino)
+
+
+class MappingStore(object):
+    """ID mapping loaded in memory, reloaded when the file changes.
+
+    Lookups use the dicts current at the start of the request; a
+    reload replaces them without blocking lookups. A changed file is
+    only reloaded once it has remained unchanged for one check, so
+    that a file being written is not loaded. If the changed file
+    cannot be read, the previous mapping remains in use.
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.stamp = None
+        self.forward = None
+        self.reverse = None
+        self.loaded = None
+        self.reloads = 0
+        self._pending = None    # stamp of changed file at last check
+        self._failed = None    # stamp of file that failed to load
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        stamp = file_stamp(self.fn)
+        mapping = read_mapping(self.fn)
+        forward = to_dict(mapping)
+        reverse = to_dict((id2, t, id1) for id1, t, id2 in mapping)
+        with self._lock:
+            self.forward, self.reverse = forward, reverse
+            self.stamp, self.loaded = stamp, time.time()
+
+    def check(self):
+        """Reload mapping if the file has changed."""
+        try:
+            stamp = file_stamp(self.fn)
+            if stamp in (self.stamp, self._failed):
+                return False
+            elif stamp != self._pending:
+                self._pending = stamp    # wait for file to settle
+                return False
+            self.load()
+        except (OSError, IOError, FormatError) as e:
+            warn('failed to reload {}: {}'.format(self.fn, e))
+            self._failed = self._pending
+            return False
+        self.reloads += 1
+        info('reloaded {}'.format(self.fn))
+        return True
+
+    def watch(self, interval):
+        """Start daemon thread checking for changes every interval."""
+        def run():
+            while True:
+                time.sleep(interval)
+                self.check()
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def lookup(self, ids, echo=False, reverse=False):
+        """Return (output, found, missing) for list of IDs."""
+        mapping = self.reverse if reverse else self.forward
+        lines, found = [], 0
+        for id_ in ids:
+            line, is_found = map_id(id_, mapping, echo)
+            lines.append(line)
+            found += is_found
+        return ''.join(lines), found, len(ids)-found
+
+    def status(self):
+        return {
+            'mapping': self.fn,
+            'ids': len(self.forward),
+            'reverse_ids': len(self.reverse),
+            'loaded': self.loaded,
+            'reloads': self.reloads,
+        }
+
+
+def parse_ids(text):
+    """Return list of IDs from text with one ID per line."""
+    ids = []
+    for i, l in enumerate(text.splitlines(), start=1):
+        l = l.rstrip()
+        if not ID_RE.match(l):
+            raise FormatError('Expected ID, got {}: line {}'.format(l, i))
+        ids.append(l)
+    return ids
+
+
+def is_true(value):
+    return value.lower() in ('1', 'true', 'yes')
+
+
+class MappingRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'    # keep-alive
+    disable_nagle_algorithm = True    # avoid delayed ACK stalls
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/status':
+            self.respond(200, json.dumps(self.server.store.status()),
+                         'application/json')
+        else:
+            self.respond(404, 'not found\n')
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        if url.path != '/map':
+            return self.respond(404, 'not found\n')
+        query = parse_qs(url.query)
+        echo = is_true(query.get('echo', ['0'])[0])
+        reverse = is_true(query.get('reverse', ['0'])[0])
+        try:
+            ids = parse_ids(body if PY2 else body.decode('utf-8'))
+        except (FormatError, UnicodeDecodeError) as e:
+            return self.respond(400, '{}\n'.format(e))
+        output, found, missing = self.server.store.lookup(ids, echo, reverse)
+        self.respond(200, output, headers={
+            'X-Found': found,
+            'X-Missing': missing,
+        })
+
+    def respond(self, code, text, content_type='text/plain',
+                headers=None):
+        data = text if PY2 else text.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', '{}; charset=utf-8'.format(
+            content_type))
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in sorted((headers or {}).items()):
+            self.send_header(key, str(value))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return str(self.client_address[0]) if self.client_address else '-'
+
+    def log_message(self, format, *args):
+        pass    # no per-request logging
+
+
+class UnixMappingRequestHandler(MappingRequestHandler):
+
+    disable_nagle_algorithm = False    # TCP option, fails on Unix sockets
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(store, host='127.0.0.1', port=8765, socket_path=None):
+    """Return server answering lookups from MappingStore."""
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path,
+                                         UnixMappingRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), MappingRequestHandler)
+    server.store = store
+    return server
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    store = MappingStore(args.mapping)
+    store.watch(args.interval)
+    server = make_server(store, args.host, args.port, args.socket)
+    if args.socket is not None:
+        info('serving {} on {}'.format(args.mapping, args.socket))
+    else:
+        info('serving {} on {}:{}'.format(args.mapping, args.host,
+                                          server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket is not None:
+            os.remove(args.socket)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
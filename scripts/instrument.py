@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+
+# Instrumentation of the pipeline scripts: timing spans for phases,
+# counters, rate-limited logging of per-item messages, cProfile
+# output and a JSON metrics report.
+
+# Scripts add the options with add_arguments() and run their work in
+# "with session(args):". Library code records into the module-level
+# Metrics with span(), count() and note(), which is cheap when no
+# session is active. Spans include the time of spans nested in them.
+# Counts made in multiprocessing workers are not recorded, except in
+# workers of common.process_files(), which also records the time of
+# each input file.
+
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import logging
+import contextlib
+
+from collections import OrderedDict
+from logging import info
+
+try:
+    import resource    # optional, for peak memory (Unix only)
+except ImportError:
+    resource = None
+
+
+# Number of messages logged for each note() key unless verbosity is 2
+NOTE_LIMIT = 10
+
+
+def add_arguments(ap):
+    """Add instrumentation options to argparse.ArgumentParser."""
+    ap.add_argument('-v', '--verbose', default=0, action='count',
+                    help='Log per-item messages: the first {} of each '
+                    'kind with -v, all with -vv'.format(NOTE_LIMIT))
+    ap.add_argument('--profile', metavar='FILE', default=None,
+                    help='Write cProfile statistics to FILE (read with '
+                    '"python -m pstats FILE")')
+    ap.add_argument('--metrics', metavar='FILE', default=None,
+                    help='Write JSON report of phase times and counts '
+                    'to FILE')
+    return ap
+
+
+class Metrics(object):
+    """Timing spans, counters and per-item messages of a run."""
+
+    def __init__(self):
+        self.verbosity = 0
+        self.reset()
+
+    def reset(self):
+        self.start = time.time()
+        self.spans = OrderedDict()    # name to [seconds, calls]
+        self.counters = OrderedDict()
+        self.notes = OrderedDict()    # key to [level, logged]
+        self.files = OrderedDict()    # input file to seconds
+
+    @contextlib.contextmanager
+    def span(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.time() - start)
+
+    def add_time(self, name, seconds, calls=1):
+        if name not in self.spans:
+            self.spans[name] = [0.0, 0]
+        self.spans[name][0] += seconds
+        self.spans[name][1] += calls
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, spans, counters, notes):
+        """Add metrics recorded elsewhere, e.g. in a worker process."""
+        for name, (seconds, calls) in spans.items():
+            self.add_time(name, seconds, calls)
+        for name, n in counters.items():
+            self.count(name, n)
+        for key, (level, logged) in notes.items():
+            self.notes.setdefault(key, [level, 0])[1] += logged
+
+    def note(self, level, key, message, *args):
+        """Count message under key, log it if verbosity allows.
+
+        The message is formatted with args only if logged. At
+        verbosity 0 only the first NOTE_LIMIT warnings of each key are
+        logged, at 1 the first NOTE_LIMIT of each key, at 2 all.
+        """
+        n = self.counters.get(key, 0) + 1
+        self.counters[key] = n
+        if key not in self.notes:
+            self.notes[key] = [level, 0]
+        if self.verbosity < 2:
+            if n > NOTE_LIMIT:
+                return
+            if self.verbosity == 0 and level < logging.WARNING:
+                return
+        self.notes[key][1] += 1
+        logging.log(level, message.format(*args))
+
+    def summarize(self):
+        """Log counts of messages that were not all logged and file times."""
+        for key, (level, logged) in self.notes.items():
+            n = self.counters[key]
+            if logged < n:
+                logging.log(level, '{}: {} messages, {} not logged'.format(
+                    key, n, n - logged))
+        for fn, seconds in self.files.items():
+            info('{}: {:.1f} s'.format(fn, seconds))
+
+    def report(self):
+        """Return metrics as dict for JSON output."""
+        report = OrderedDict()
+        report['script'] = os.path.basename(sys.argv[0])
+        report['seconds'] = time.time() - self.start
+        if resource is not None:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            report['cpu_seconds'] = usage.ru_utime + usage.ru_stime
+            # ru_maxrss is in kilobytes on Linux and bytes on macOS
+            scale = 1024.0 * 1024 if sys.platform == 'darwin' else 1024.0
+            report['peak_rss_mb'] = usage.ru_maxrss / scale
+        report['spans'] = OrderedDict(
+            (name, OrderedDict([('seconds', s), ('calls', c)]))
+            for name, (s, c) in self.spans.items())
+        report['counters'] = self.counters
+        if self.files:
+            report['files'] = self.files
+        return report
+
+    def write_report(self, fn):
+        with open(fn, 'w') as out:
+            json.dump(self.report(), out, indent=2, separators=(',', ': '))
+            out.write('\n')
+
+
+metrics = Metrics()
+
+
+def span(name):
+    """Return context manager adding its time to span name."""
+    return metrics.span(name)
+
+
+def count(name, n=1):
+    metrics.count(name, n)
+
+
+def note(key, message, *args):
+    """Count per-item info message, log it if verbosity allows."""
+    metrics.note(logging.INFO, key, message, *args)
+
+
+def note_warning(key, message, *args):
+    """Count per-item warning, log it if verbosity allows."""
+    metrics.note(logging.WARNING, key, message, *args)
+
+
+@contextlib.contextmanager
+def session(args):
+    """Instrument run with options added by add_arguments()."""
+    metrics.reset()
+    metrics.verbosity = args.verbose
+    if args.verbose:
+        logging.getLogger().setLevel(logging.INFO)
+    profiler = None
+    if args.profile is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield metrics
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            info('wrote profile to {}'.format(args.profile))
+        metrics.summarize()
+        if args.metrics is not None:
+            metrics.write_report(args.metrics)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+# Incremental reader for OBO Graphs JSON documents.
+
+# Walks the top-level "graphs" and the "nodes" and "edges" of each
+# graph as an event stream, decoding one node or edge at a time with
+# the standard library JSON decoder. The whole document is never held
+# in memory, only the item being decoded and a read buffer.
+
+# Handles both plain OBO Graphs JSON and JSON-LD compacted with
+# compactArrays, where single-item arrays (e.g. "graphs") are given
+# as the item itself.
+
+
+from __future__ import print_function
+
+import re
+import json
+
+from six import string_types
+
+from common import open_input
+
+
+# Keys of graph objects whose items are streamed
+STREAMED = {
+    'nodes': 'node',
+    'edges': 'edge',
+}
+
+CHUNK_SIZE = 1 << 16
+
+WHITESPACE = re.compile(r'\s*')
+
+
+class FormatError(Exception):
+    pass
+
+
+class _Reader(object):
+    """Buffered reader decoding JSON values from a file incrementally."""
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, size=None):
+        # Drop consumed input and read more, return False at EOF
+        if self.eof:
+            return False
+        chunk = self.f.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return next non-whitespace character, or None at EOF."""
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return None
+
+    def expect(self, chars):
+        c = self.peek()
+        if c is None or c not in chars:
+            raise FormatError('expected one of "{}", got {}'.format(
+                chars, 'EOF' if c is None else '"{}"'.format(c)))
+        self.pos += 1
+        return c
+
+    def value(self, raw=False):
+        """Decode and return the next JSON value.
+
+        If raw is True, return the JSON text of the value instead.
+        """
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                # Incomplete value; read geometrically more to avoid
+                # quadratic redecoding of large values.
+                if not self._fill(size):
+                    raise
+                size *= 2
+                continue
+            # A number or literal ending at the end of the buffer may
+            # continue in the next chunk.
+            if end == len(self.buf) and self._fill():
+                continue
+            if raw:
+                value = self.buf[self.pos:end]
+            self.pos = end
+            return value
+
+    def items(self, close):
+        """Generate positions of items of array or object until close."""
+        first = True
+        while True:
+            if self.peek() == close:
+                self.pos += 1
+                return
+            if not first:
+                self.expect(',')
+            first = False
+            yield
+
+    def key(self):
+        key = self.value()
+        self.expect(':')
+        return key
+
+
+def _iter_values(reader, raw=False):
+    # Generate items of array, or the single value if not an array
+    if reader.peek() == '[':
+        reader.pos += 1
+        for _ in reader.items(']'):
+            yield reader.value(raw)
+    else:
+        yield reader.value(raw)
+
+
+def _iter_graph(reader, index, raw=False, skip=()):
+    # Generate events for graph object, reading past items of events
+    # in skip
+    reader.expect('{')
+    fields = {}
+    for _ in reader.items('}'):
+        key = reader.key()
+        if key not in STREAMED:
+            fields[key] = reader.value()
+            continue
+        # streamed arrays are replaced with empty lists in graph fields
+        fields[key] = []
+        if reader.peek() == 'n':
+            fields[key] = reader.value()    # null
+            continue
+        if STREAMED[key] in skip:
+            for _ in _iter_values(reader, True):
+                pass
+            continue
+        for item in _iter_values(reader, raw):
+            yield STREAMED[key], index, item
+    yield 'graph', index, fields
+
+
+def iter_graph_events(f, raw=False, skip=()):
+    """Generate (event, graph index, value) from OBO Graphs document.
+
+    Events are 'node' and 'edge' for each node and edge, 'graph' at the
+    end of each graph with a dict of its other fields (streamed
+    fields are given as empty lists), and finally 'document' with a
+    dict of the other top-level fields. Nodes and edges are generated
+    in document order. If raw is True, nodes and edges are given as
+    JSON text. Node and edge events in skip are not generated.
+    """
+    if isinstance(f, string_types):    # assume filename
+        with open_input(f) as fp:
+            for event in iter_graph_events(fp, raw, skip):
+                yield event
+        return
+
+    reader = _Reader(f)
+    reader.expect('{')
+    fields, index = {}, 0
+    for _ in reader.items('}'):
+        key = reader.key()
+        if key != 'graphs':
+            fields[key] = reader.value()
+            continue
+        fields[key] = []
+        if reader.peek() == '[':
+            reader.pos += 1
+            for _ in reader.items(']'):
+                for event in _iter_graph(reader, index, raw, skip):
+                    yield event
+                index += 1
+        else:
+            for event in _iter_graph(reader, index, raw, skip):
+                yield event
+            index += 1
+    if reader.peek() is not None:
+        raise FormatError('trailing data after document')
+    yield 'document', None, fields
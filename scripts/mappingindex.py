@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+# Compiled binary ID mapping for memory-mapped lookup.
+
+# Stores the rows of an ID mapping (e.g. pr-idmapping.dat) as integer
+# references into a pool of unique strings, together with the row
+# numbers sorted by the first and by the second ID. IDs are looked up
+# in either direction by binary search, so opening the mapping takes
+# constant time regardless of its size. Rows are kept in the order of
+# the original file, and rows for the same ID are found in that order.
+
+# File layout: see common.write_sections().
+
+
+from __future__ import print_function
+
+import os
+import sys
+
+from logging import info
+
+from six import PY2
+
+from common import read_mapping, MappedFile, write_sections, string_pool
+from common import has_magic
+
+
+MAGIC = b'PRIDMAP1'
+
+
+def argparser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-o', '--output', metavar='FILE', default=None,
+                    help='Output file (default input with suffix .idx)')
+    ap.add_argument('mapping', metavar='FILE', help='ID mapping')
+    return ap
+
+
+def _utf8(s):
+    # Return UTF-8 bytes for native or unicode string
+    return s if isinstance(s, bytes) else s.encode('utf-8')
+
+
+def is_mapping_index(fn):
+    """Return True if the file is a compiled ID mapping."""
+    return has_magic(fn, MAGIC)
+
+
+def write_mapping_index(fn, mapping):
+    """Write compiled ID mapping for list of (id1, type, id2)."""
+    strings, string_index = [], {}
+    def intern(s):
+        if s not in string_index:
+            string_index[s] = len(strings)
+            strings.append(s)
+        return string_index[s]
+    columns = ([], [], [])
+    for row in mapping:
+        for column, s in zip(columns, row):
+            column.append(intern(s))
+    encoded = [_utf8(s) for s in strings]
+    str_ptr, str_pool = string_pool(encoded)
+    id1, types, id2 = columns
+    # sort is stable, rows with equal IDs remain in file order
+    fwd_order = sorted(range(len(id1)), key=lambda r: encoded[id1[r]])
+    rev_order = sorted(range(len(id2)), key=lambda r: encoded[id2[r]])
+    write_sections(fn, MAGIC, { 'rows': len(id1) }, [
+        ('str_ptr', 'i', str_ptr),
+        ('strs', 'B', str_pool),
+        ('id1', 'i', id1),
+        ('type', 'i', types),
+        ('id2', 'i', id2),
+        ('fwd_order', 'i', fwd_order),
+        ('rev_order', 'i', rev_order),
+    ])
+    info('Wrote compiled mapping of {} rows to {}'.format(len(id1), fn))
+
+
+class MappingIndex(MappedFile):
+    """Memory-mapped compiled ID mapping."""
+
+    def __init__(self, fn):
+        MappedFile.__init__(self, fn, MAGIC)
+        self._size = self.header['rows']
+        info('Opened compiled mapping of {} rows from {}'.format(self._size, fn))
+
+    def __len__(self):
+        return self._size
+
+    def _str(self, i):
+        # native strings, as given by read_mapping()
+        s = self._bytes('strs', self._str_ptr, i)
+        return s if PY2 else s.decode('utf-8')
+
+    def row(self, r, reverse=False):
+        """Return row number r as (id1, type, id2)."""
+        id1, id2 = self._str(self._id1[r]), self._str(self._id2[r])
+        if reverse:
+            id1, id2 = id2, id1
+        return id1, self._str(self._type[r]), id2
+
+    def rows(self, reverse=False):
+        """Generate rows in file order."""
+        for r in range(self._size):
+            yield self.row(r, reverse)
+
+    def find(self, id_, reverse=False):
+        """Return row numbers with given first ID, in file order.
+
+        If reverse is True, return rows with given second ID.
+        """
+        if reverse:
+            order, column = self._rev_order, self._id2
+        else:
+            order, column = self._fwd_order, self._id1
+        key = _utf8(id_)
+        key_at = lambda i: self._bytes('strs', self._str_ptr, column[order[i]])
+        lo, hi = 0, self._size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        rows = []
+        while lo < self._size and key_at(lo) == key:
+            rows.append(order[lo])
+            lo += 1
+        return rows
+
+    def view(self, reverse=False):
+        return MappingView(self, reverse)
+
+
+class MappingView(object):
+    """Read-only dict-like view of a compiled mapping.
+
+    Maps IDs to lists of (type, id2) as applyidmap.to_dict() does.
+    """
+
+    def __init__(self, index, reverse=False):
+        self.index = index
+        self.reverse = reverse
+
+    def __contains__(self, id_):
+        return bool(self.index.find(id_, self.reverse))
+
+    def __getitem__(self, id_):
+        rows = self.index.find(id_, self.reverse)
+        if not rows:
+            raise KeyError(id_)
+        return [self.index.row(r, self.reverse)[1:] for r in rows]
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    output = args.output
+    if output is None:
+        output = os.path.splitext(args.mapping)[0] + '.idx'
+    write_mapping_index(output, read_mapping(args.mapping))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
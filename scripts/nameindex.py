@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+
+# Lookup index of PRO term names for normalizing entity mentions.
+
+# Indexes the labels and exact, related and broad synonyms of the
+# terms in a compacted OBO Graph by normalized name: lowercase, with
+# runs of whitespace as one space and Greek letters spelled out in
+# Latin (e.g. "TNF-\u03b1" and "tnf-Alpha" both as "tnf-alpha"). The
+# normalized names are stored sorted as UTF-8, so names are found by
+# binary search both exactly and by prefix, and the index is
+# memory-mapped rather than loaded.
+
+# File layout: see common.write_sections().
+
+# Usage:
+#   nameindex.py [-o INDEX] GRAPH    write index for compacted graph
+#   nameindex.py lookup INDEX [FILE]    look up mentions, one per line
+
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import logging
+
+from bisect import bisect_left
+from logging import info
+
+from six import PY2, text_type
+
+from common import MappedFile, write_sections, string_pool, has_magic
+from common import open_input, open_output, LruCache
+from jsonstream import iter_graph_events
+from getidmapping import get_meta, is_proteinontology_node, is_deprecated
+from ontologydb import node_synonyms
+
+
+logging.getLogger().setLevel(logging.INFO)
+
+
+MAGIC = b'PRNAMES1'
+
+# Kinds of names, in order of preference among matches
+NAME_TYPES = ['label', 'EXACT', 'RELATED', 'BROAD']
+
+GREEK_LETTERS = [
+    'alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'eta', 'theta',
+    'iota', 'kappa', 'lambda', 'mu', 'nu', 'xi', 'omicron', 'pi', 'rho',
+    'sigma', 'tau', 'upsilon', 'phi', 'chi', 'psi', 'omega',
+]
+
+
+def _greek_table():
+    # Map Greek letters (and the micro sign) to names for translate()
+    table = { 0xb5: u'mu', 0x3c2: u'sigma' }    # final sigma
+    for i, name in enumerate(GREEK_LETTERS):
+        name = text_type(name)
+        offset = i if i < 17 else i + 1    # no capital final sigma
+        table[0x391 + offset] = table[0x3b1 + offset] = name
+    return table
+
+
+GREEK_TABLE = _greek_table()
+
+# Cached lookups in batch mode
+LOOKUP_CACHE_SIZE = 100000
+
+
+def argparser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-d', '--include-deprecated', default=False,
+                    action='store_true', help='Include deprecated terms')
+    ap.add_argument('-o', '--output', metavar='FILE', default=None,
+                    help='Output file (default input with suffix .names)')
+    ap.add_argument('graph', metavar='FILE',
+                    help='Compacted OBO Graphs JSON-LD file')
+    return ap
+
+
+def lookup_argparser():
+    import argparse
+    ap = argparse.ArgumentParser(prog='nameindex.py lookup')
+    ap.add_argument('-p', '--prefix', default=False, action='store_true',
+                    help='Match names starting with the mention')
+    ap.add_argument('-l', '--limit', metavar='N', type=int, default=10,
+                    help='Maximum number of matches per mention with -p '
+                    '(default 10)')
+    ap.add_argument('index', metavar='INDEX', help='Name index file')
+    ap.add_argument('mentions', metavar='FILE', nargs='?', default='-',
+                    help='Mentions, one per line (default stdin)')
+    return ap
+
+
+def normalize(name):
+    """Return name lowercased, with Greek letters and spaces folded."""
+    if isinstance(name, bytes):
+        name = name.decode('utf-8')
+    return u' '.join(name.translate(GREEK_TABLE).lower().split())
+
+
+def _utf8(s):
+    return normalize(s).encode('utf-8')
+
+
+def is_name_index(fn):
+    """Return True if the file is a name index."""
+    return has_magic(fn, MAGIC)
+
+
+def node_names(node):
+    """Generate (type, name) for names of OBO Graphs node to index."""
+    if node.get('lbl'):
+        yield 'label', node['lbl']
+    for scope, synonym, type_ in node_synonyms(get_meta(node)):
+        if scope in NAME_TYPES:
+            yield scope, synonym
+
+
+def write_name_index(fn, graph_fn, include_deprecated=False):
+    """Write name index for terms in compacted OBO Graphs file."""
+    ids, names, entries = [], [], []
+    for event, index, value in iter_graph_events(graph_fn):
+        if event != 'node' or not is_proteinontology_node(value):
+            continue
+        if is_deprecated(value) and not include_deprecated:
+            continue
+        for type_, name in node_names(value):
+            key = _utf8(name)
+            if key:
+                entries.append((key, NAME_TYPES.index(type_), len(ids),
+                                len(names)))
+                names.append(name)
+        ids.append(value['id'])
+    entries.sort()    # by name, then type and term order
+    keys, key_entries = [], []
+    for i, entry in enumerate(entries):
+        if not keys or keys[-1] != entry[0]:
+            keys.append(entry[0])
+            key_entries.append(i)
+    key_entries.append(len(entries))
+    key_ptr, key_pool = string_pool(keys)
+    id_ptr, id_pool = string_pool(ids)
+    name_ptr, name_pool = string_pool(names)
+    write_sections(fn, MAGIC, { 'keys': len(keys) }, [
+        ('key_ptr', 'i', key_ptr),
+        ('key_strs', 'B', key_pool),
+        ('key_entries', 'i', key_entries),
+        ('entry_type', 'b', [e[1] for e in entries]),
+        ('entry_term', 'i', [e[2] for e in entries]),
+        ('entry_name', 'i', [e[3] for e in entries]),
+        ('id_ptr', 'i', id_ptr),
+        ('id_strs', 'B', id_pool),
+        ('name_ptr', 'i', name_ptr),
+        ('name_strs', 'B', name_pool),
+    ])
+    info('Wrote index of {} names ({} distinct) of {} terms to {}'.format(
+        len(entries), len(keys), len(ids), fn))
+
+
+class _Keys(object):
+    # Sorted normalized names as a sequence of bytes for bisect
+    def __init__(self, index):
+        self.index = index
+
+    def __len__(self):
+        return self.index._size
+
+    def __getitem__(self, i):
+        return self.index._bytes('key_strs', self.index._key_ptr, i)
+
+
+class NameIndex(MappedFile):
+    """Memory-mapped name index."""
+
+    def __init__(self, fn):
+        MappedFile.__init__(self, fn, MAGIC)
+        self._size = self.header['keys']
+        self._keys = _Keys(self)
+
+    def __len__(self):
+        return self._size
+
+    def _str(self, pool, pointers, i):
+        s = self._bytes(pool, pointers, i)
+        return s if PY2 else s.decode('utf-8')    # native strings
+
+    def _matches(self, k):
+        # Return (id, type, name) for entries of key number k
+        matches = []
+        for e in range(self._key_entries[k], self._key_entries[k+1]):
+            matches.append((
+                self._str('id_strs', self._id_ptr, self._entry_term[e]),
+                NAME_TYPES[self._entry_type[e]],
+                self._str('name_strs', self._name_ptr, self._entry_name[e])))
+        return matches
+
+    def find(self, mention):
+        """Return (id, type, name) for names equal to mention.
+
+        Names are compared normalized (see normalize()). Labels come
+        first, then synonyms by type.
+        """
+        key = _utf8(mention)
+        k = bisect_left(self._keys, key)
+        if k < self._size and self._keys[k] == key:
+            return self._matches(k)
+        return []
+
+    def find_prefix(self, mention, limit=None):
+        """Return (id, type, name) for names starting with mention.
+
+        Matches are ordered by normalized name, at most limit of them.
+        An empty mention matches nothing.
+        """
+        key = _utf8(mention)
+        if not key:
+            return []
+        start = bisect_left(self._keys, key)
+        end = bisect_left(self._keys, key + b'\xff', start)    # not UTF-8
+        matches = []
+        for k in range(start, end):
+            matches.extend(self._matches(k))
+            if limit is not None and len(matches) >= limit:
+                return matches[:limit]
+        return matches
+
+
+def lookup_main(argv):
+    args = lookup_argparser().parse_args(argv[1:])
+    index = NameIndex(args.index)
+    if args.prefix:
+        find = lambda m: index.find_prefix(m, args.limit)
+    else:
+        find = index.find
+    cache = LruCache(LOOKUP_CACHE_SIZE)    # mentions tend to repeat
+    mentions, matched = 0, 0
+    start = time.time()
+    with open_input(args.mentions) as f, open_output() as out:
+        for line in f:
+            mention = line.rstrip('\r\n')
+            matches = cache.get(mention)
+            if matches is None:
+                matches = find(mention)
+                cache[mention] = matches
+            mentions += 1
+            if matches:
+                matched += 1
+            else:
+                out.write(mention + '\t\t\t\n')
+            for id_, type_, name in matches:
+                out.write('\t'.join((mention, id_, type_, name)) + '\n')
+    seconds = time.time() - start
+    info('Looked up {} mentions ({} matched) in {:.1f} s, {:.0f} '
+         'mentions/s; cache: {}'.format(mentions, matched, seconds,
+                                        mentions / max(seconds, 1e-6),
+                                        cache.stats()))
+
+
+def main(argv):
+    if len(argv) > 1 and argv[1] == 'lookup':
+        return lookup_main(argv[1:])
+    args = argparser().parse_args(argv[1:])
+    output = args.output
+    if output is None:
+        output = os.path.splitext(args.graph)[0] + '.names'
+    write_name_index(output, args.graph, args.include_deprecated)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
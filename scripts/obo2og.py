@@ -0,0 +1,640 @@
+#!/usr/bin/env python
+
+# Convert data in OBO format to OBO Graphs JSON.
+
+# Streaming replacement for the OBO Graphs `ogger` tool covering the
+# subset of the OBO to OWL mapping used in the Protein Ontology. The
+# input is read stanza by stanza and nodes are written out as they are
+# converted; edges and axioms are spooled to temporary files and
+# appended once all nodes have been written, so memory use does not
+# grow with the size of the input. The IDs of declared and referenced
+# classes are likewise spooled, in sorted runs that are merged to find
+# the referenced classes that are not declared.
+
+# Differences to `ogger` output:
+# - Nodes and edges are written in input order rather than sorted by
+#   IRI, except for nodes of undeclared classes, which follow the
+#   others sorted by IRI.
+# - Only the OBO tags appearing in PRO receive special treatment;
+#   other tags are mapped to oboInOwl annotations (basicPropertyValues)
+#   as in the OBO to OWL mapping.
+
+# Written for OBO format 1.4 (May 2012 draft)
+# (see owlcollab.github.io/oboformat/doc/obo-syntax.html)
+
+
+from __future__ import print_function
+
+import sys
+import json
+import heapq
+import tempfile
+
+from logging import info, warn
+
+from preprocess_obo import parse_comment, parse_synonym_line
+from common import open_input, open_output
+
+
+def argparser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-o', '--output', metavar='FILE', default=None,
+                    help='Output file, compressed by suffix .gz or .zst '
+                    '(default stdout)')
+    ap.add_argument('files', metavar='FILE', nargs='+',
+                    help='Input OBO files')
+    return ap
+
+
+class FormatError(Exception):
+    pass
+
+
+# Number of IDs SortedSpool keeps in memory
+SPOOL_RUN = 1 << 17
+
+
+obobase = 'http://purl.obolibrary.org/obo/'
+oboinowl = 'http://www.geneontology.org/formats/oboInOwl#'
+rdfs = 'http://www.w3.org/2000/01/rdf-schema#'
+
+# Synonym scope to OBO Graphs synonym predicate
+synonym_pred = {
+    'EXACT': 'hasExactSynonym',
+    'BROAD': 'hasBroadSynonym',
+    'NARROW': 'hasNarrowSynonym',
+    'RELATED': 'hasRelatedSynonym',
+}
+
+# OBO tags mapped to basicPropertyValues with a specific predicate.
+# Unknown tags default to oboInOwl:<tag>.
+property_tag_pred = {
+    'alt_id': oboinowl+'hasAlternativeId',
+    'namespace': oboinowl+'hasOBONamespace',
+    'replaced_by': obobase+'IAO_0100001',
+    'consider': oboinowl+'consider',
+    'created_by': oboinowl+'created_by',
+    'creation_date': oboinowl+'creation_date',
+}
+
+# Header tags mapped to graph basicPropertyValues
+header_tag_pred = {
+    'format-version': oboinowl+'hasOBOFormatVersion',
+    'date': oboinowl+'date',
+    'saved-by': oboinowl+'saved-by',
+    'auto-generated-by': oboinowl+'auto-generated-by',
+    'default-namespace': oboinowl+'default-namespace',
+    'remark': rdfs+'comment',
+}
+
+# Tags that have no representation in OBO Graphs
+ignored_tags = set([
+    'id', 'is_anonymous', 'builtin', 'union_of', 'disjoint_from',
+    'is_transitive', 'is_symmetric', 'is_reflexive', 'is_cyclic',
+    'is_functional', 'is_inverse_functional', 'is_metadata_tag',
+    'is_class_level', 'transitive_over', 'holds_over_chain',
+    'equivalent_to_chain', 'disjoint_over',
+])
+
+OBO_ESCAPES = {
+    'n': '\n',
+    't': '\t',
+    'W': ' ',
+}
+
+
+def unescape(s):
+    """Resolve OBO backslash escapes in string."""
+    if '\\' not in s:
+        return s    # fast for typical case
+    chars, i = [], 0
+    while i < len(s):
+        c = s[i]
+        if c == '\\' and i+1 < len(s):
+            i += 1
+            c = OBO_ESCAPES.get(s[i], s[i])
+        chars.append(c)
+        i += 1
+    return ''.join(chars)
+
+
+def parse_quoted(s):
+    """Parse OBO QuotedString at start of string.
+
+    Return the unescaped string and the remainder following the
+    closing quote.
+    """
+    if not s.startswith('"'):
+        raise FormatError('expected quoted string: {}'.format(s))
+    i = 1
+    while i < len(s):
+        if s[i] == '\\':
+            i += 2
+        elif s[i] == '"':
+            return unescape(s[1:i]), s[i+1:].lstrip()
+        else:
+            i += 1
+    raise FormatError('unterminated quoted string: {}'.format(s))
+
+
+def split_xrefs(s):
+    """Split OBO XrefList contents into xref IDs."""
+    xrefs, start, quoted, i = [], 0, False, 0
+    while i <= len(s):
+        if i == len(s) or (s[i] == ',' and not quoted):
+            xref = s[start:i].strip()
+            if xref:
+                xrefs.append(unescape(xref.split()[0]))
+            start = i + 1
+        elif s[i] == '\\':
+            i += 1
+        elif s[i] == '"':
+            quoted = not quoted
+        i += 1
+    return xrefs
+
+
+def parse_xref_list(s):
+    """Parse OBO XrefList ("[...]") at start of string."""
+    s = s.strip()
+    if not s.startswith('['):
+        return []
+    end = s.rfind(']')
+    if end < 0:
+        raise FormatError('unterminated xref list: {}'.format(s))
+    return split_xrefs(s[1:end])
+
+
+def strip_qualifiers(value):
+    """Remove trailing qualifier block ("{...}"), if any."""
+    value = value.rstrip()
+    if value.endswith('}') and '{' in value:
+        value = value[:value.rindex('{')].rstrip()
+    return value
+
+
+def parse_tag_value(line):
+    """Parse OBO tag-value pair line, return (tag, value)."""
+    line, comment = parse_comment(line)    # remove comment, if any
+    if ':' not in line:
+        raise FormatError('failed to parse tag-value pair: {}'.format(line))
+    tag, value = line.split(':', 1)
+    return tag.strip(), value.strip()
+
+
+def read_stanzas(f, types=None):
+    """Generate (stanza type, [(tag, value, line), ...]) from OBO file.
+
+    The header frame is generated with stanza type None. If types is
+    given, only stanzas of the given types are parsed and generated.
+    """
+    stanza_type, clauses = None, []
+    for line in f:
+        if line.startswith('['):
+            if types is None or stanza_type in types:
+                yield stanza_type, clauses
+            stanza_type, clauses = line.strip()[1:-1], []
+            continue
+        if types is not None and stanza_type not in types:
+            continue
+        line = line.rstrip('\r\n')
+        if not line.strip() or line.startswith('!'):
+            continue
+        tag, value = parse_tag_value(line)
+        clauses.append((tag, value, line))
+    if types is None or stanza_type in types:
+        yield stanza_type, clauses
+
+
+def expand_shorthand(id_, xrefs):
+    """Return ID that shorthand Typedef ID is translated to.
+
+    Follows the OBO to OWL mapping: a Typedef with a non-prefixed ID
+    is identified by its xref, with RO and BFO xrefs preferred.
+    """
+    expanded = None
+    for xref in xrefs:
+        if xref == id_ or ':' not in xref:
+            continue
+        if expanded is None:
+            expanded = xref
+        elif (xref.startswith(('RO:', 'BFO:')) and
+              not expanded.startswith(('RO:', 'BFO:'))):
+            expanded = xref
+    return expanded
+
+
+def read_shorthands(fn):
+    """Return mapping from shorthand Typedef IDs to expanded IDs."""
+    shorthands = {}
+    with open_input(fn) as f:
+        for stanza_type, clauses in read_stanzas(f, ('Typedef',)):
+            values = clause_values(clauses)
+            id_ = values.get('id', [None])[0]
+            if id_ is None or ':' in id_:
+                continue
+            expanded = expand_shorthand(id_, values.get('xref', []))
+            if expanded is not None:
+                shorthands[id_] = expanded
+    return shorthands
+
+
+def clause_values(clauses):
+    values = {}
+    for tag, value, line in clauses:
+        values.setdefault(tag, []).append(strip_qualifiers(value))
+    return values
+
+
+class IriMapper(object):
+    """Map OBO identifiers to IRIs following the OBO to OWL mapping."""
+
+    def __init__(self, ontology, shorthands):
+        self.ontology = ontology
+        self.shorthands = shorthands
+
+    def __call__(self, id_):
+        id_ = self.shorthands.get(id_, id_)
+        if id_.startswith(('http://', 'https://')):
+            return id_
+        elif ':' in id_:
+            prefix, local = id_.split(':', 1)
+            return '{}{}_{}'.format(obobase, prefix, local)
+        else:
+            return '{}{}#{}'.format(obobase, self.ontology, id_)
+
+
+def convert_header(clauses, iri):
+    """Return (graph ID, graph meta, header nodes, header edges)."""
+    values = clause_values(clauses)
+    ontology = values.get('ontology', [iri.ontology])[0]
+    graph_id = '{}{}.owl'.format(obobase, ontology)
+    meta, properties, nodes, edges = {}, [], [], []
+    if 'data-version' in values:
+        meta['version'] = '{}{}/{}/{}.owl'.format(
+            obobase, ontology, values['data-version'][0], ontology)
+    for tag, value, line in clauses:
+        if tag in header_tag_pred:
+            properties.append({
+                'pred': header_tag_pred[tag],
+                'val': unescape(value)
+            })
+        elif tag == 'subsetdef':
+            id_, rest = value.split(None, 1)
+            description, rest = parse_quoted(rest)
+            nodes.append({
+                'id': iri(id_),
+                'type': 'PROPERTY',
+                'meta': { 'comments': [description] },
+            })
+            edges.append({
+                'sub': iri(id_),
+                'pred': 'subPropertyOf',
+                'obj': oboinowl+'SubsetProperty',
+            })
+        elif tag == 'synonymtypedef':
+            id_, rest = value.split(None, 1)
+            description, rest = parse_quoted(rest)
+            nodes.append({
+                'id': iri(id_),
+                'type': 'PROPERTY',
+                'lbl': description,
+            })
+            edges.append({
+                'sub': iri(id_),
+                'pred': 'subPropertyOf',
+                'obj': oboinowl+'SynonymTypeProperty',
+            })
+    if properties:
+        meta['basicPropertyValues'] = properties
+    return graph_id, meta, nodes, edges
+
+
+def convert_synonym(line, iri):
+    line, comment = parse_comment(line)    # remove comment, if any
+    string, scope, type_id, xrefs, qualifiers = parse_synonym_line(line)
+    synonym = {
+        'pred': synonym_pred[scope],
+        'val': parse_quoted(string)[0],
+    }
+    xrefs = [unescape(x.split()[0]) for x in xrefs if x.strip()]
+    if xrefs:
+        synonym['xrefs'] = xrefs
+    return synonym
+
+
+def convert_stanza(stanza_type, clauses, iri):
+    """Convert OBO stanza to OBO Graphs node, edges and axioms.
+
+    Return (node, edges, axioms), where axioms is a list of
+    (graph key, axiom) pairs.
+    """
+    values = clause_values(clauses)
+    if 'id' not in values:
+        raise FormatError('missing id in [{}] stanza'.format(stanza_type))
+    id_ = iri(values['id'][0])
+    is_typedef = stanza_type == 'Typedef'
+    node = { 'id': id_, 'type': 'PROPERTY' if is_typedef else 'CLASS' }
+    meta, edges, axioms = {}, [], []
+    if iri.shorthands.get(values['id'][0]):
+        meta['basicPropertyValues'] = [{
+            'pred': oboinowl+'shorthand',
+            'val': values['id'][0],
+        }]
+    genus_ids, restrictions = [], []
+    domains, ranges = [], []
+    for tag, value, line in clauses:
+        if tag in ignored_tags:
+            pass
+        elif tag == 'name':
+            node['lbl'] = unescape(value)
+        elif tag == 'def':
+            val, rest = parse_quoted(value)
+            definition = { 'val': val }
+            xrefs = parse_xref_list(rest)
+            if xrefs:
+                definition['xrefs'] = xrefs
+            meta['definition'] = definition
+        elif tag == 'comment':
+            meta.setdefault('comments', []).append(unescape(value))
+        elif tag == 'subset':
+            meta.setdefault('subsets', []).append(
+                iri(strip_qualifiers(value)))
+        elif tag == 'xref':
+            xref = strip_qualifiers(value).split()[0]
+            meta.setdefault('xrefs', []).append({ 'val': unescape(xref) })
+        elif tag == 'synonym':
+            meta.setdefault('synonyms', []).append(convert_synonym(line, iri))
+        elif tag == 'is_obsolete':
+            if strip_qualifiers(value) == 'true':
+                meta['deprecated'] = True
+        elif tag == 'is_a':
+            edges.append({
+                'sub': id_,
+                'pred': 'subPropertyOf' if is_typedef else 'is_a',
+                'obj': iri(strip_qualifiers(value).split()[0]),
+            })
+        elif tag == 'relationship':
+            rel, target = strip_qualifiers(value).split()[:2]
+            edges.append({ 'sub': id_, 'pred': iri(rel), 'obj': iri(target) })
+        elif tag == 'inverse_of':
+            edges.append({
+                'sub': id_,
+                'pred': 'inverseOf',
+                'obj': iri(strip_qualifiers(value).split()[0]),
+            })
+        elif tag == 'intersection_of':
+            parts = strip_qualifiers(value).split()
+            if len(parts) == 1:
+                genus_ids.append(iri(parts[0]))
+            else:
+                restrictions.append({
+                    'propertyId': iri(parts[0]),
+                    'fillerId': iri(parts[1]),
+                })
+        elif tag == 'equivalent_to':
+            axioms.append(('equivalentNodesSets', {
+                'representativeNodeId': id_,
+                'nodeIds': [id_, iri(strip_qualifiers(value).split()[0])],
+            }))
+        elif tag == 'domain':
+            domains.append(iri(strip_qualifiers(value).split()[0]))
+        elif tag == 'range':
+            ranges.append(iri(strip_qualifiers(value).split()[0]))
+        elif tag == 'property_value':
+            pred, rest = strip_qualifiers(value).split(None, 1)
+            if rest.startswith('"'):
+                val, rest = parse_quoted(rest)
+            else:
+                val = rest.split()[0]
+            meta.setdefault('basicPropertyValues', []).append({
+                'pred': iri(pred),
+                'val': val,
+            })
+        else:
+            pred = property_tag_pred.get(tag, oboinowl+tag)
+            meta.setdefault('basicPropertyValues', []).append({
+                'pred': pred,
+                'val': unescape(strip_qualifiers(value)),
+            })
+    if genus_ids or restrictions:
+        axioms.append(('logicalDefinitionAxioms', {
+            'definedClassId': id_,
+            'genusIds': genus_ids,
+            'restrictions': restrictions,
+        }))
+    if domains or ranges:
+        axioms.append(('domainRangeAxioms', {
+            'predicateId': id_,
+            'domainClassIds': domains,
+            'rangeClassIds': ranges,
+        }))
+    if meta:
+        node['meta'] = meta
+    return node, edges, axioms
+
+
+def referenced_classes(edges, axioms):
+    """Return IDs of classes referenced in Term edges and axioms."""
+    referenced = [e['obj'] for e in edges]
+    for key, axiom in axioms:
+        if key == 'logicalDefinitionAxioms':
+            referenced.extend(axiom['genusIds'])
+            referenced.extend(r['fillerId'] for r in axiom['restrictions'])
+    return referenced
+
+
+class SortedSpool(object):
+    """Strings spooled to temporary files in sorted runs.
+
+    At most run_size strings are kept in memory. Iteration gives the
+    distinct strings in sorted order. Strings must not contain newlines.
+    """
+
+    def __init__(self, run_size=SPOOL_RUN):
+        self.run_size = run_size
+        self.runs, self.pending = [], set()
+
+    def add(self, s):
+        self.pending.add(s)
+        if len(self.pending) >= self.run_size:
+            self._write_run()
+
+    def _write_run(self):
+        run = tempfile.TemporaryFile('w+')
+        for s in sorted(self.pending):
+            run.write(s + '\n')
+        run.seek(0)
+        self.runs.append(run)
+        self.pending = set()
+
+    def __iter__(self):
+        runs = [(line.rstrip('\n') for line in run) for run in self.runs]
+        last = None
+        for s in heapq.merge(sorted(self.pending), *runs):
+            if s != last:
+                yield s
+            last = s
+
+    def close(self):
+        for run in self.runs:
+            run.close()
+        self.runs, self.pending = [], set()
+
+
+def undeclared(declared, referenced):
+    """Generate strings in sorted iterable referenced not in declared."""
+    declared = iter(declared)
+    current = next(declared, None)
+    for id_ in referenced:
+        while current is not None and current < id_:
+            current = next(declared, None)
+        if current != id_:
+            yield id_
+
+
+class JsonArrayWriter(object):
+    """Write JSON array items to a file one item per line."""
+
+    def __init__(self, out):
+        self.out = out
+        self.count = 0
+
+    def write(self, item):
+        self.write_raw(json.dumps(item, sort_keys=True))
+
+    def write_raw(self, text):
+        """Write item given as JSON text on one line."""
+        if self.count:
+            self.out.write(',\n')
+        self.out.write(text)
+        self.count += 1
+
+
+class OboGraphWriter(object):
+    """Incremental writer for single-graph OBO Graphs JSON documents.
+
+    Nodes are written directly to the output. Edges and axioms are
+    spooled to temporary files and written when the graph is closed.
+    """
+
+    spooled = [
+        'edges',
+        'equivalentNodesSets',
+        'logicalDefinitionAxioms',
+        'domainRangeAxioms',
+        'propertyChainAxioms',
+    ]
+
+    def __init__(self, out, graph_id, meta):
+        self.out = out
+        self.spools = {}
+        for key in self.spooled:
+            self.spools[key] = JsonArrayWriter(tempfile.TemporaryFile('w+'))
+        out.write('{\n"graphs": [ {\n')
+        out.write('"id": {},\n'.format(json.dumps(graph_id)))
+        out.write('"meta": {},\n'.format(json.dumps(meta, sort_keys=True)))
+        out.write('"nodes": [\n')
+        self.nodes = JsonArrayWriter(out)
+
+    def add_node(self, node):
+        self.nodes.write(node)
+
+    def add(self, key, item):
+        self.spools[key].write(item)
+
+    def add_raw(self, key, text):
+        """Add node ('nodes') or spooled item given as JSON text."""
+        if key == 'nodes':
+            self.nodes.write_raw(text)
+        else:
+            self.spools[key].write_raw(text)
+
+    def close(self):
+        self.out.write('\n]')
+        for key in self.spooled:
+            spool = self.spools[key].out
+            self.out.write(',\n"{}": [\n'.format(key))
+            spool.seek(0)
+            for chunk in iter(lambda: spool.read(1 << 16), ''):
+                self.out.write(chunk)
+            spool.close()
+            self.out.write('\n]')
+        self.out.write('\n} ]\n}\n')
+        info('Wrote {} nodes and {} edges'.format(
+            self.nodes.count, self.spools['edges'].count))
+
+
+def read_items(f):
+    """Generate (key, JSON text) for items in OboGraphWriter output.
+
+    Items of the graph nodes and spooled arrays are generated in file
+    order without decoding them. Only supports files written by
+    OboGraphWriter, which writes one item per line.
+    """
+    key = None
+    for line in f:
+        line = line.rstrip('\n')
+        if key is None:
+            if line.startswith('"') and line.endswith('": ['):
+                key = line[1:-4]
+        elif line in (']', '],'):
+            key = None
+        elif line:
+            yield key, line[:-1] if line.endswith(',') else line
+
+
+def process(fn, out=sys.stdout):
+    # First pass over Typedefs, which follow the Terms that refer to
+    # them, to resolve shorthand relation IDs.
+    shorthands = read_shorthands(fn)
+    with open_input(fn) as f:
+        stanzas = read_stanzas(f)
+        header_type, header = next(stanzas)
+        ontology = clause_values(header).get('ontology', [None])[0]
+        if ontology is None:
+            warn('no ontology tag in header of {}'.format(fn))
+        iri = IriMapper(ontology, shorthands)
+        graph_id, meta, nodes, edges = convert_header(header, iri)
+        writer = OboGraphWriter(out, graph_id, meta)
+        for node in nodes:
+            writer.add_node(node)
+        for edge in edges:
+            writer.add('edges', edge)
+        # Classes referenced but not declared in a stanza are included
+        # as nodes as in the OWL signature.
+        declared, referenced = SortedSpool(), SortedSpool()
+        for stanza_type, clauses in stanzas:
+            if stanza_type not in ('Term', 'Typedef'):
+                warn('skipping [{}] stanza'.format(stanza_type))
+                continue
+            node, edges, axioms = convert_stanza(stanza_type, clauses, iri)
+            writer.add_node(node)
+            declared.add(node['id'])
+            for edge in edges:
+                writer.add('edges', edge)
+            if stanza_type == 'Term':
+                for id_ in referenced_classes(edges, axioms):
+                    referenced.add(id_)
+            for key, axiom in axioms:
+                writer.add(key, axiom)
+        for id_ in undeclared(declared, referenced):
+            writer.add_node({ 'id': id_, 'type': 'CLASS' })
+        declared.close()
+        referenced.close()
+        writer.close()
+
+
+def main(argv):
+    ap = argparser()
+    args = ap.parse_args(argv[1:])
+    if args.output is not None and len(args.files) > 1:
+        ap.error('only one input file can be given with -o')
+    with open_output(args.output) as out:
+        for fn in args.files:
+            process(fn, out)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
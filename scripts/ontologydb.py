@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+
+# Export a compacted OBO Graph and its ID mapping to an SQLite database.
+
+# Tables (node numbers are the order of nodes in the graph):
+#   nodes(node, id, label, deprecated)
+#   categories(node, category)    from "Category=" comments
+#   synonyms(node, scope, synonym, type)    scope EXACT, BROAD, ...
+#   xrefs(node, xref)
+#   edges(sub, obj)    is_a edges by node number
+#   closure(descendant, ancestor)    all proper is_a ancestors
+#   mapping(id1, type, id2)    ID mapping rows in file order (rowid)
+# with indexes for lookups by ID, category, xref and in both
+# directions of edges, closure and mapping.
+
+# The database is written in one transaction with indexes created
+# after the bulk inserts, and is left in WAL mode, in which readers
+# sharing the file do not block each other or a writer. MappingDatabase
+# supports the lookups of mappingindex.MappingIndex, so applyidmap.py
+# and filteridmap.py accept the database in place of a mapping.
+
+
+from __future__ import print_function
+
+import os
+import sys
+import sqlite3
+
+from logging import info, warn
+
+from six import PY2
+
+from common import iter_mapping, has_magic
+from jsonstream import iter_graph_events
+from getidmapping import get_meta, get_categories, get_xrefs, assure_list
+
+
+MAGIC = b'SQLite format 3\x00'
+
+SCHEMA = """
+CREATE TABLE nodes (
+  node INTEGER PRIMARY KEY,
+  id TEXT NOT NULL,
+  label TEXT,
+  deprecated INTEGER NOT NULL
+);
+CREATE TABLE categories (node INTEGER NOT NULL, category TEXT NOT NULL);
+CREATE TABLE synonyms (
+  node INTEGER NOT NULL,
+  scope TEXT,
+  synonym TEXT NOT NULL,
+  type TEXT
+);
+CREATE TABLE xrefs (node INTEGER NOT NULL, xref TEXT NOT NULL);
+CREATE TABLE edges (sub INTEGER NOT NULL, obj INTEGER NOT NULL);
+CREATE TABLE closure (
+  descendant INTEGER NOT NULL,
+  ancestor INTEGER NOT NULL,
+  PRIMARY KEY (descendant, ancestor)
+) WITHOUT ROWID;
+CREATE TABLE mapping (id1 TEXT NOT NULL, type TEXT, id2 TEXT NOT NULL);
+"""
+
+INDEXES = """
+CREATE UNIQUE INDEX nodes_id ON nodes (id);
+CREATE INDEX categories_category ON categories (category, node);
+CREATE INDEX categories_node ON categories (node);
+CREATE INDEX synonyms_node ON synonyms (node);
+CREATE INDEX xrefs_xref ON xrefs (xref);
+CREATE INDEX xrefs_node ON xrefs (node);
+CREATE INDEX edges_sub ON edges (sub);
+CREATE INDEX edges_obj ON edges (obj);
+CREATE INDEX closure_ancestor ON closure (ancestor, descendant);
+CREATE INDEX mapping_id1 ON mapping (id1);
+CREATE INDEX mapping_id2 ON mapping (id2);
+"""
+
+SYNONYM_SCOPES = {
+    'hasExactSynonym': 'EXACT',
+    'hasBroadSynonym': 'BROAD',
+    'hasNarrowSynonym': 'NARROW',
+    'hasRelatedSynonym': 'RELATED',
+}
+
+SYNONYM_TYPE_PREFIX = 'synonymtype:'    # see preprocess_obo.py
+
+
+def argparser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-m', '--mapping', metavar='FILE', default=None,
+                    help='ID mapping to include (e.g. pr-idmapping.dat)')
+    ap.add_argument('-o', '--output', metavar='FILE', default=None,
+                    help='Output file (default input with suffix .sqlite)')
+    ap.add_argument('graph', metavar='FILE',
+                    help='Compacted OBO Graphs JSON-LD file')
+    return ap
+
+
+def is_database(fn):
+    """Return True if the file is an SQLite database."""
+    return has_magic(fn, MAGIC)
+
+
+def connect(fn):
+    conn = sqlite3.connect(fn)
+    if PY2:
+        conn.text_factory = str    # native strings, as read_mapping()
+    return conn
+
+
+def node_synonyms(meta):
+    """Generate (scope, synonym, type) for synonyms in node meta."""
+    for synonym in assure_list(meta.get('synonyms', [])):
+        type_ = None
+        for xref in assure_list(synonym.get('xrefs', [])):
+            if xref.startswith(SYNONYM_TYPE_PREFIX):
+                type_ = xref[len(SYNONYM_TYPE_PREFIX):]
+        yield SYNONYM_SCOPES.get(synonym.get('pred')), synonym['val'], type_
+
+
+def insert_graph(conn, fn):
+    """Insert nodes and node data of graph, return is_a parent lists."""
+    number, edges = {}, []
+    nodes, categories, synonyms, xrefs = [], [], [], []
+    for event, index, value in iter_graph_events(fn):
+        if event == 'node':
+            i = number.setdefault(value['id'], len(number))
+            if i != len(nodes):
+                warn('duplicate node {}, skipping'.format(value['id']))
+                continue
+            meta = get_meta(value)
+            nodes.append((i, value['id'], value.get('lbl'),
+                          meta.get('deprecated') is True))
+            categories.extend((i, c) for c in get_categories(meta))
+            synonyms.extend((i,) + s for s in node_synonyms(meta))
+            xrefs.extend((i, x) for x in get_xrefs(meta))
+        elif event == 'edge' and value['pred'] == 'is_a':
+            edges.append((value['sub'], value['obj']))    # nodes may follow
+    conn.executemany('INSERT INTO nodes VALUES (?, ?, ?, ?)', nodes)
+    conn.executemany('INSERT INTO categories VALUES (?, ?)', categories)
+    conn.executemany('INSERT INTO synonyms VALUES (?, ?, ?, ?)', synonyms)
+    conn.executemany('INSERT INTO xrefs VALUES (?, ?)', xrefs)
+    parents, missing = [[] for _ in nodes], 0
+    for sub, obj in edges:
+        if sub in number and obj in number:
+            parents[number[sub]].append(number[obj])
+        else:
+            missing += 1
+    if missing:
+        warn('skipped {} is_a edges with undeclared nodes'.format(missing))
+    conn.executemany('INSERT INTO edges VALUES (?, ?)', (
+        (i, p) for i, parent_list in enumerate(parents)
+        for p in parent_list))
+    info('Inserted {} nodes and {} is_a edges'.format(
+        len(nodes), len(edges) - missing))
+    return parents
+
+
+def closure_rows(parents):
+    """Generate (descendant, ancestor) for all is_a ancestors."""
+    for i in range(len(parents)):
+        pending, seen = list(parents[i]), set(parents[i])
+        while pending:
+            j = pending.pop()
+            yield i, j
+            for p in parents[j]:
+                if p not in seen:
+                    seen.add(p)
+                    pending.append(p)
+
+
+def write_database(fn, graph_fn, mapping_fn=None):
+    """Write SQLite database for graph and optional ID mapping."""
+    for path in (fn, fn + '-wal', fn + '-shm', fn + '-journal'):
+        if os.path.exists(path):
+            os.remove(path)
+    conn = connect(fn)
+    try:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=OFF')    # file renamed when done
+        conn.executescript(SCHEMA)
+        with conn:    # one transaction
+            parents = insert_graph(conn, graph_fn)
+            conn.executemany('INSERT INTO closure VALUES (?, ?)',
+                             closure_rows(parents))
+            if mapping_fn is not None:
+                conn.executemany('INSERT INTO mapping VALUES (?, ?, ?)',
+                                 iter_mapping(mapping_fn))
+        conn.executescript(INDEXES)
+        conn.execute('ANALYZE')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    finally:
+        conn.close()
+    info('Wrote database {}'.format(fn))
+
+
+class MappingDatabase(object):
+    """ID mapping in an SQLite database, with lookups as MappingIndex."""
+
+    def __init__(self, fn):
+        self.conn = connect(fn)
+        self.conn.execute('PRAGMA query_only=ON')
+        self._size = self.conn.execute(
+            'SELECT count(*) FROM mapping').fetchone()[0]
+        info('Opened mapping of {} rows from {}'.format(self._size, fn))
+
+    def __len__(self):
+        return self._size
+
+    def row(self, r, reverse=False):
+        """Return row number r as (id1, type, id2)."""
+        id1, type_, id2 = self.conn.execute(
+            'SELECT id1, type, id2 FROM mapping WHERE rowid = ?',
+            (r,)).fetchone()
+        return (id2, type_, id1) if reverse else (id1, type_, id2)
+
+    def find(self, id_, reverse=False):
+        """Return numbers of rows with first ID id_ in file order."""
+        column = 'id2' if reverse else 'id1'
+        return [r for r, in self.conn.execute(
+            'SELECT rowid FROM mapping WHERE {} = ? ORDER BY rowid'.format(
+                column), (id_,))]
+
+    def view(self, reverse=False):
+        return MappingDatabaseView(self, reverse)
+
+
+class MappingDatabaseView(object):
+    """Read-only dict-like view of a mapping database.
+
+    Maps IDs to lists of (type, id2) as applyidmap.to_dict() does.
+    """
+
+    def __init__(self, database, reverse=False):
+        self.conn = database.conn
+        key, value = ('id2', 'id1') if reverse else ('id1', 'id2')
+        self.query = ('SELECT type, {} FROM mapping WHERE {} = ? '
+                      'ORDER BY rowid'.format(value, key))
+        self._last = (None, None)    # "in" is followed by lookup
+
+    def __contains__(self, id_):
+        return bool(self._find(id_))
+
+    def __getitem__(self, id_):
+        found = self._find(id_)
+        if not found:
+            raise KeyError(id_)
+        return found
+
+    def _find(self, id_):
+        if self._last[0] != id_:
+            found = [tuple(r) for r in self.conn.execute(self.query, (id_,))]
+            self._last = (id_, found)
+        return self._last[1]
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    output = args.output
+    if output is None:
+        output = os.path.splitext(args.graph)[0] + '.sqlite'
+    write_database(output, args.graph, args.mapping)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
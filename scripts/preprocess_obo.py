@@ -12,10 +12,39 @@
 
 from __future__ import print_function
 
+import os
+import io
 import sys
 import re
 
-from six import string_types
+from six import string_types, PY2, StringIO
+
+from common import open_input, open_output, compression_of
+from instrument import add_arguments, session, span, count
+
+
+# Number of shards per job in parallel processing, more than one for
+# load balancing
+SHARDS_PER_JOB = 4
+
+STANZA_HEADER_RE = re.compile(br'^\[[^\]]+\]\s*$')
+
+COMMENT_RE = re.compile(r'^((?:[^"]|"(?:\\"|[^"])*")*)(\s+\!\s.*)$')
+
+SYNONYM_RE = re.compile(r'^synonym: ("(?:\\"|[^"])*") (EXACT|BROAD|NARROW|RELATED) ([A-Za-z0-9_-]*) *\[(.*)\]\s*((?:\{.*\}\s*)?)$')
+
+
+def argparser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-j', '--jobs', type=int, default=1,
+                    help='Number of parallel processes (default 1)')
+    ap.add_argument('-o', '--output', metavar='FILE', default=None,
+                    help='Output file, compressed by suffix .gz or .zst '
+                    '(default stdout)')
+    ap.add_argument('files', metavar='FILE', nargs='+',
+                    help='Input OBO files')
+    return add_arguments(ap)
 
 
 class FormatError(Exception):
@@ -29,11 +58,21 @@ def parse_comment(line):
     # (http://owlcollab.github.io/oboformat/doc/obo-syntax.html#2.3)
     if '!' not in line:
         return line, None    # fast for typical case
-    m = re.match(r'^((?:[^"]|"(?:\\"|[^"])*")*)(\s+\!\s.*)$', line)
-    if not m:
-        return line, None    # no comment
-    else:
-        return m.groups()
+    if '\\' in line or '\n' in line:
+        m = COMMENT_RE.match(line)    # escapes make quoting ambiguous
+        return m.groups() if m else (line, None)
+    # Without escapes, text before the comment is quoted strings and
+    # unquoted text, i.e. has an even number of quotes. As COMMENT_RE,
+    # take the last '!' that qualifies, with one space before it.
+    end = len(line)
+    while True:
+        i = line.rfind('!', 0, end)
+        if i < 1:
+            return line, None    # no comment
+        if (line[i-1].isspace() and line[i+1:i+2].isspace() and
+            line.count('"', 0, i-1) % 2 == 0):
+            return line[:i-1], line[i-1:]
+        end = i
 
 
 def parse_synonym_line(line):
@@ -44,7 +83,7 @@ def parse_synonym_line(line):
     # (http://owlcollab.github.io/oboformat/doc/obo-syntax.html#3.3)
     # "Each clause can also have zero or more comma-separated tag-value
     # trailing qualifiers between a '{' and a '}'"
-    m = re.match(r'^synonym: ("(?:\\"|[^"])*") (EXACT|BROAD|NARROW|RELATED) ([A-Za-z0-9_-]*) *\[(.*)\]\s*((?:\{.*\}\s*)?)$', line)
+    m = SYNONYM_RE.match(line)
     if not m:
         raise FormatError('failed to parse synonym line: {}'.format(line))
 
@@ -70,25 +109,103 @@ def process_synonym_line(line, out):
     if type_id:
         xrefs.append('synonymtype:{}'.format(type_id))
     line = format_synonym_line(string, scope, type_id, xrefs, qualifiers)
-    print(line, file=out)
+    out.write(line + '\n')
 
 
 def process_file(f, out=sys.stdout):
+    """Process OBO file, return numbers of lines and synonym lines."""
     if isinstance(f, string_types):    # assume filename
-        with open(f) as fp:
-            return process_file(fp)
+        with open_input(f) as fp:
+            return process_file(fp, out)
 
+    lines, synonyms = 0, 0
     for line in f:
-        line = line.rstrip('\n')
+        lines += 1
         if line.startswith('synonym:'):
-            process_synonym_line(line, out)
+            process_synonym_line(line.rstrip('\n'), out)
+            synonyms += 1
+        elif line.endswith('\n'):
+            out.write(line)    # default to unmodified output
         else:
-            print(line, file=out)    # default to unmodified output
+            out.write(line + '\n')
+    return lines, synonyms
+
+
+def shard_ranges(fn, shards):
+    """Return (start, end) byte ranges splitting file into shards.
+
+    Shards other than the first start at a stanza header line such as
+    "[Term]", so each holds only whole stanzas. Fewer shards are
+    returned for files with few stanzas.
+    """
+    size = os.path.getsize(fn)
+    offsets = [0]
+    with open(fn, 'rb') as f:
+        for i in range(1, shards):
+            target = size * i // shards
+            if target <= offsets[-1]:
+                continue
+            f.seek(target - 1)
+            f.readline()    # to start of line at or after target
+            while True:
+                offset, line = f.tell(), f.readline()
+                if not line or STANZA_HEADER_RE.match(line):
+                    break
+            if offsets[-1] < offset < size:
+                offsets.append(offset)
+    offsets.append(size)
+    return list(zip(offsets[:-1], offsets[1:]))
+
+
+def process_shard(shard):
+    """Process byte range of file, return output as string and counts."""
+    fn, start, end = shard
+    with open(fn, 'rb') as f:
+        f.seek(start)
+        data = f.read(end-start)
+    f = io.BytesIO(data)
+    if not PY2:
+        f = io.TextIOWrapper(f)    # decode as open() does
+    out = StringIO()
+    counts = process_file(f, out)
+    return out.getvalue(), counts
+
+
+def process_file_parallel(fn, jobs, out=sys.stdout):
+    """Process file in shards with jobs processes.
+
+    Output is written in the original order and is identical to that
+    of process_file(), as are the returned counts.
+    """
+    from multiprocessing import Pool
+    shards = [(fn, start, end) for start, end in
+              shard_ranges(fn, jobs * SHARDS_PER_JOB)]
+    pool = Pool(jobs)
+    lines, synonyms = 0, 0
+    try:
+        for output, counts in pool.imap(process_shard, shards):
+            out.write(output)
+            lines, synonyms = lines + counts[0], synonyms + counts[1]
+    finally:
+        pool.close()
+        pool.join()
+    return lines, synonyms
 
 
 def main(argv):
-    for fn in argv[1:]:
-        process_file(fn, sys.stdout)
+    args = argparser().parse_args(argv[1:])
+    with session(args), open_output(args.output) as out:
+        for fn in args.files:
+            with span('process'):
+                # shards are byte ranges of a regular file, compressed
+                # input and pipes are read serially
+                if (args.jobs > 1 and os.path.isfile(fn) and
+                    compression_of(fn) is None):
+                    lines, synonyms = process_file_parallel(fn, args.jobs, out)
+                else:
+                    lines, synonyms = process_file(fn, out)
+            count('lines', lines)
+            count('synonyms', synonyms)
 
 
 if __name__ == '__main__':
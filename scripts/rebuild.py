@@ -0,0 +1,500 @@
+#!/usr/bin/env python
+
+# Incremental build driver for the data pipeline.
+
+# Runs the pipeline stages in order. Each stage processes the files
+# in its input directory one file per job, with jobs run in parallel.
+# Scripts that run several processes themselves (-j) are given the
+# number of processes divided between the jobs running at a time.
+# A job is skipped when its output exists and its fingerprint is
+# unchanged from the last successful run. The fingerprint covers the
+# content hash of the input, the content of the script and the local
+# modules it imports, the options and the Python version, so touched
+# but unchanged inputs are skipped and changed scripts are rerun.
+# Outputs are written to temporary files and renamed on success.
+
+# Fingerprints and input hashes are kept in data/rebuild-state.json.
+
+# With --compress, the intermediate preprocessed OBO and OBO Graphs
+# files are written compressed (e.g. data/preprocessed/pr.obo.gz),
+# and read by the following stages as any other input.
+
+# With --incremental, a copy of each source is kept in data/previous
+# after a successful run, and the outputs for a changed source are
+# updated from those of the previous copy with updaterelease.py when
+# possible, falling back to running the stages otherwise.
+
+
+from __future__ import print_function
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import subprocess
+
+from logging import info, warn
+
+from common import COMPRESSION_SUFFIX, strip_compression_suffix
+
+
+logging.getLogger().setLevel(logging.INFO)
+
+
+SCRIPTDIR = os.path.dirname(os.path.abspath(__file__))
+
+DATADIR = os.path.normpath(os.path.join(SCRIPTDIR, '..', 'data'))
+
+STATE_FILE = os.path.join(DATADIR, 'rebuild-state.json')
+
+PREVIOUS_DIR = os.path.join(DATADIR, 'previous')
+
+SOURCES = [
+    'http://purl.obolibrary.org/obo/pr.obo',
+]
+
+IMPORT_RE = re.compile(r'^\s*(?:from\s+(\w+)\s+import|import\s+(\w+))', re.M)
+
+
+def argparser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-j', '--jobs', type=int, default=default_jobs(),
+                    help='Number of parallel jobs (default number of cores)')
+    ap.add_argument('-f', '--force', default=False, action='store_true',
+                    help='Rerun jobs even if fingerprint is unchanged')
+    ap.add_argument('-n', '--dry-run', default=False, action='store_true',
+                    help='Only report jobs that would be run')
+    ap.add_argument('-i', '--incremental', default=False, action='store_true',
+                    help='Update outputs for changed sources incrementally')
+    ap.add_argument('-z', '--compress', choices=sorted(COMPRESSION_SUFFIX),
+                    default=None, help='Compress intermediate files')
+    ap.add_argument('--download', default=False, action='store_true',
+                    help='Download sources even if they exist')
+    ap.add_argument('stages', metavar='STAGE', nargs='*',
+                    help='Stages to run (default all: {})'.format(
+                        ', '.join(s.name for s in STAGES)))
+    return ap
+
+
+def default_jobs():
+    try:
+        from multiprocessing import cpu_count
+        return cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def file_digest(fn):
+    h = hashlib.sha1()
+    with open(fn, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def script_modules(script):
+    """Return script and local modules it imports, recursively."""
+    modules, pending = set(), [script]
+    while pending:
+        name = pending.pop()
+        if name in modules:
+            continue
+        modules.add(name)
+        with open(os.path.join(SCRIPTDIR, name)) as f:
+            source = f.read()
+        for m in IMPORT_RE.finditer(source):
+            module = (m.group(1) or m.group(2)) + '.py'
+            if os.path.exists(os.path.join(SCRIPTDIR, module)):
+                pending.append(module)
+    return sorted(modules)
+
+
+class State(object):
+    """Fingerprints of outputs and cached content hashes of files."""
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.outputs, self.hashes = {}, {}
+        if os.path.exists(fn):
+            with open(fn) as f:
+                data = json.load(f)
+            self.outputs, self.hashes = data['outputs'], data['hashes']
+
+    def digest(self, fn):
+        """Return content hash of file, cached by size and mtime."""
+        st = os.stat(fn)
+        key = os.path.relpath(fn, DATADIR)
+        cached = self.hashes.get(key)
+        if cached and cached[:2] == [st.st_size, st.st_mtime]:
+            return cached[2]
+        digest = file_digest(fn)
+        self.hashes[key] = [st.st_size, st.st_mtime, digest]
+        return digest
+
+    def is_current(self, output, fingerprint):
+        key = os.path.relpath(output, DATADIR)
+        return (os.path.exists(output) and os.path.getsize(output) > 0 and
+                self.outputs.get(key) == fingerprint)
+
+    def set(self, output, fingerprint):
+        self.outputs[os.path.relpath(output, DATADIR)] = fingerprint
+
+    def save(self):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.fn))
+        with os.fdopen(fd, 'w') as f:
+            json.dump({ 'outputs': self.outputs, 'hashes': self.hashes },
+                      f, sort_keys=True, indent=1)
+        os.rename(tmp, self.fn)
+
+
+class Job(object):
+    """Command generating one output file."""
+
+    def __init__(self, stage, input_, output, command, stdout=True,
+                 jobs_option=None):
+        self.stage = stage
+        self.input = input_
+        self.output = output
+        self.command = command    # with None for output filename
+        self.stdout = stdout    # output written to stdout
+        self.jobs_option = jobs_option    # option for processes to use
+        self.jobs = 1    # set by run_stage()
+        self.fingerprint = None
+
+    def run(self):
+        """Run command, return elapsed seconds."""
+        start = time.time()
+        outdir = os.path.dirname(self.output)
+        # same suffix as output for scripts compressing by suffix
+        fd, tmp = tempfile.mkstemp(dir=outdir, prefix='.tmp-',
+                                   suffix='-' + os.path.basename(self.output))
+        try:
+            command = [tmp if a is None else a for a in self.command]
+            if self.jobs_option is not None:
+                command[2:2] = [self.jobs_option, str(self.jobs)]
+            with os.fdopen(fd, 'w') as out:
+                subprocess.check_call(command,
+                                      stdout=out if self.stdout else None)
+            os.chmod(tmp, 0o644)
+            os.rename(tmp, self.output)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return time.time() - start
+
+
+def run_job(job):
+    return job, job.run()
+
+
+class Stage(object):
+    """Pipeline stage running script on each input file."""
+
+    def __init__(self, name, indir, suffix, outdir, out_suffix, script,
+                 options=(), output_option=None, jobs_option=None,
+                 intermediate=False):
+        self.name = name
+        self.indir = os.path.join(DATADIR, indir)
+        self.suffix = suffix
+        self.outdir = os.path.join(DATADIR, outdir)
+        self.out_suffix = out_suffix
+        self.script = script
+        self.options = list(options)
+        self.output_option = output_option    # None for stdout
+        self.jobs_option = jobs_option    # script option for parallelism
+        self.intermediate = intermediate    # output may be compressed
+        self.compression = None    # set for intermediate with --compress
+
+    def inputs(self):
+        if not os.path.isdir(self.indir):
+            return []
+        return sorted(os.path.join(self.indir, fn)
+                      for fn in os.listdir(self.indir)
+                      if strip_compression_suffix(fn).endswith(self.suffix)
+                      and not fn.startswith('.'))
+
+    def output(self, input_):
+        base = os.path.basename(strip_compression_suffix(input_))
+        output = os.path.join(self.outdir,
+                              base[:-len(self.suffix)] + self.out_suffix)
+        if self.compression is not None:
+            output += COMPRESSION_SUFFIX[self.compression]
+        return output
+
+    def stale_outputs(self, output):
+        """Return existing outputs other than output for same input."""
+        if not self.intermediate:
+            return []
+        base = strip_compression_suffix(output)
+        variants = [base] + [base + s for s in COMPRESSION_SUFFIX.values()]
+        return [fn for fn in variants if fn != output and os.path.exists(fn)]
+
+    def jobs(self, state, args):
+        for input_ in self.inputs():
+            command = [sys.executable, os.path.join(SCRIPTDIR, self.script)]
+            command.extend(self.options)
+            if self.output_option is not None:
+                command.extend([self.output_option, None])
+            command.append(input_)
+            job = Job(self, input_, self.output(input_), command,
+                      self.output_option is None, self.jobs_option)
+            job.fingerprint = self.fingerprint(state, input_)
+            yield job
+
+    def fingerprint(self, state, input_):
+        scripts = dict((m, file_digest(os.path.join(SCRIPTDIR, m)))
+                       for m in script_modules(self.script))
+        data = {
+            'stage': self.name,
+            'input': state.digest(input_),
+            'scripts': scripts,
+            'options': self.options,
+            'python': '{}.{}'.format(*sys.version_info[:2]),
+        }
+        data = json.dumps(data, sort_keys=True).encode('utf-8')
+        return hashlib.sha1(data).hexdigest()
+
+
+class DownloadStage(Stage):
+    """Download sources that do not exist locally."""
+
+    def __init__(self, name, outdir, urls):
+        Stage.__init__(self, name, outdir, '', outdir, '', None)
+        self.urls = urls
+
+    def jobs(self, state, args):
+        for url in self.urls:
+            output = os.path.join(self.outdir, os.path.basename(url))
+            if os.path.exists(output) and not args.download:
+                info('{} exists, skipping download'.format(output))
+                continue
+            yield Job(self, url, output, ['wget', '-O', None, url], False)
+
+
+class DatabaseStage(Stage):
+    """Export each compacted graph with its ID mapping to a database.
+
+    The mapping is the output of mapping_stage for the same graph and
+    is part of the fingerprint.
+    """
+
+    def __init__(self, name, indir, suffix, outdir, out_suffix, script,
+                 mapping_stage):
+        Stage.__init__(self, name, indir, suffix, outdir, out_suffix,
+                       script, output_option='-o')
+        self.mapping_stage = mapping_stage
+
+    def mapping(self, input_):
+        return get_stage(self.mapping_stage).output(input_)
+
+    def inputs(self):
+        inputs = []
+        for input_ in Stage.inputs(self):
+            if os.path.exists(self.mapping(input_)):
+                inputs.append(input_)
+            else:
+                warn('{}: no mapping {}, skipping {}'.format(
+                    self.name, self.mapping(input_), input_))
+        return inputs
+
+    def jobs(self, state, args):
+        for job in Stage.jobs(self, state, args):
+            job.command[-1:-1] = ['-m', self.mapping(job.input)]
+            yield job
+
+    def fingerprint(self, state, input_):
+        data = '{} {}'.format(Stage.fingerprint(self, state, input_),
+                              state.digest(self.mapping(input_)))
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class LinkStage(Stage):
+    """Link outputs to the top-level directory for convenience."""
+
+    def __init__(self, name, indir, suffix, linkdir):
+        Stage.__init__(self, name, indir, suffix, linkdir, suffix, None)
+
+    def jobs(self, state, args):
+        for input_ in self.inputs():
+            link = self.output(input_)
+            if os.path.lexists(link):
+                continue
+            info('Linking {} to {}'.format(link, input_))
+            if not args.dry_run:
+                os.symlink(os.path.abspath(input_), link)
+        return iter(())
+
+
+STAGES = [
+    DownloadStage('download', 'original-data', SOURCES),
+    Stage('preprocess', 'original-data', '.obo', 'preprocessed', '.obo',
+          'preprocess_obo.py', output_option='-o', jobs_option='-j',
+          intermediate=True),
+    Stage('ogconvert', 'preprocessed', '.obo', 'obographs', '.og',
+          'obo2og.py', output_option='-o', intermediate=True),
+    Stage('ogcompact', 'obographs', '.og', 'compacted', '.jsonld',
+          'compact_og.py', jobs_option='-j'),
+    Stage('idmap', 'compacted', '.jsonld', 'idmappings', '-idmapping.dat',
+          'getidmapping.py', options=['-g']),
+    Stage('idmapindex', 'idmappings', '-idmapping.dat', 'idmappings',
+          '-idmapping.idx', 'mappingindex.py', output_option='-o'),
+    DatabaseStage('dbexport', 'compacted', '.jsonld', 'databases',
+                  '.sqlite', 'ontologydb.py', 'idmap'),
+    LinkStage('linkcomplete', 'idmappings', '.dat', '..'),
+]
+
+
+# Stages whose outputs updaterelease.py updates, in order
+INCREMENTAL_STAGES = ['preprocess', 'ogconvert', 'ogcompact', 'idmap']
+
+
+def get_stage(name):
+    return [s for s in STAGES if s.name == name][0]
+
+
+def chain_outputs(state, source):
+    """Return outputs of INCREMENTAL_STAGES for source if all current."""
+    outputs, input_ = [], source
+    for stage in [get_stage(n) for n in INCREMENTAL_STAGES]:
+        output = stage.output(input_)
+        if not state.is_current(output, stage.fingerprint(state, input_)):
+            return None
+        outputs.append(output)
+        input_ = output
+    return outputs
+
+
+def update_incrementally(state, args):
+    """Update outputs of changed sources, return number updated."""
+    stages = [get_stage(n) for n in INCREMENTAL_STAGES]
+    updated = 0
+    for source in stages[0].inputs():
+        previous = os.path.join(PREVIOUS_DIR, os.path.basename(source))
+        if (not os.path.exists(previous) or
+                state.digest(previous) == state.digest(source)):
+            continue
+        # outputs must be current for the previous copy of the source
+        outputs = chain_outputs(state, previous)
+        if outputs is None:
+            info('incremental: outputs not current for {}'.format(previous))
+            continue
+        info('incremental: {} -> {}'.format(source, ', '.join(outputs)))
+        if args.dry_run:
+            continue
+        command = [sys.executable, os.path.join(SCRIPTDIR, 'updaterelease.py')]
+        command.extend(get_stage('idmap').options)
+        for option, output in zip(['-p', '-o', '-c', '-m'], outputs):
+            command.extend([option, output])
+        command.extend([previous, source])
+        status = subprocess.call(command)
+        if status != 0:
+            warn('incremental update of {} failed ({}), running stages'.format(
+                source, status))
+            continue
+        input_ = source
+        for stage, output in zip(stages, outputs):
+            state.set(output, stage.fingerprint(state, input_))
+            input_ = output
+        state.save()
+        updated += 1
+    return updated
+
+
+def save_previous(state):
+    """Keep copies of sources whose outputs are current."""
+    if not os.path.isdir(PREVIOUS_DIR):
+        os.makedirs(PREVIOUS_DIR)
+    for source in get_stage(INCREMENTAL_STAGES[0]).inputs():
+        previous = os.path.join(PREVIOUS_DIR, os.path.basename(source))
+        if chain_outputs(state, source) is None or (
+                os.path.exists(previous) and
+                state.digest(previous) == state.digest(source)):
+            continue
+        fd, tmp = tempfile.mkstemp(dir=PREVIOUS_DIR, prefix='.tmp-')
+        os.close(fd)
+        shutil.copyfile(source, tmp)
+        os.rename(tmp, previous)
+        info('saved {} as {}'.format(source, previous))
+
+
+def run_stage(stage, state, args):
+    """Run jobs of stage, return (run, skipped, seconds)."""
+    from multiprocessing.pool import ThreadPool
+    start = time.time()
+    if not os.path.isdir(stage.outdir) and not args.dry_run:
+        os.makedirs(stage.outdir)
+    pending, skipped = [], 0
+    for job in stage.jobs(state, args):
+        if (job.fingerprint is not None and not args.force and
+                state.is_current(job.output, job.fingerprint)):
+            info('{}: {} is up to date'.format(stage.name, job.output))
+            skipped += 1
+        else:
+            info('{}: {} -> {}'.format(stage.name, job.input, job.output))
+            pending.append(job)
+    if pending and not args.dry_run:
+        # divide the processes between the jobs running at a time
+        workers = max(1, min(args.jobs, len(pending)))
+        for job in pending:
+            job.jobs = max(1, args.jobs // workers)
+        pool = ThreadPool(workers)
+        try:
+            for job, seconds in pool.imap_unordered(run_job, pending):
+                info('{}: wrote {} in {:.1f} s'.format(
+                    stage.name, job.output, seconds))
+                for fn in stage.stale_outputs(job.output):
+                    info('{}: removing {}'.format(stage.name, fn))
+                    os.remove(fn)    # e.g. uncompressed before --compress
+                if job.fingerprint is not None:
+                    state.set(job.output, job.fingerprint)
+                    state.save()
+        finally:
+            pool.close()
+            pool.join()
+    return len(pending), skipped, time.time() - start
+
+
+def main(argv):
+    ap = argparser()
+    args = ap.parse_args(argv[1:])
+    for name in args.stages:
+        if name not in [s.name for s in STAGES]:
+            ap.error('unknown stage {}'.format(name))
+    if args.incremental and args.stages:
+        ap.error('--incremental applies to all stages')
+    if not os.path.isdir(DATADIR):
+        os.makedirs(DATADIR)
+    for stage in STAGES:
+        if stage.intermediate:
+            stage.compression = args.compress
+    state = State(STATE_FILE)
+    timings = []
+    for stage in STAGES:
+        if args.stages and stage.name not in args.stages:
+            continue
+        if args.incremental and stage.name == INCREMENTAL_STAGES[0]:
+            start = time.time()
+            updated = update_incrementally(state, args)
+            timings.append(('incremental', updated, 0, time.time() - start))
+        info('Running stage {}'.format(stage.name))
+        run, skipped, seconds = run_stage(stage, state, args)
+        timings.append((stage.name, run, skipped, seconds))
+        info('Completed stage {} in {:.1f} s ({} run, {} up to date)'.format(
+            stage.name, seconds, run, skipped))
+    if args.incremental and not args.dry_run:
+        save_previous(state)
+    if not args.dry_run:
+        state.save()    # input hashes
+    for name, run, skipped, seconds in timings:
+        print('{:15s} {:8.1f} s {:4d} run {:4d} up to date'.format(
+            name, seconds, run, skipped), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
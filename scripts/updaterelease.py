@@ -0,0 +1,607 @@
+#!/usr/bin/env python
+
+# Update pipeline outputs for a new PRO release incrementally.
+
+# Compares the OBO file of the new release to that of the previous
+# release stanza by stanza, and updates the preprocessed OBO, OBO
+# Graphs, compacted JSON-LD and ID mapping files generated from the
+# previous release. Only the changed terms are preprocessed, converted
+# and compacted, and only the changed terms and their is_a descendants
+# (in either release) are mapped again, as generalization depends
+# only on the ancestors of a term. Everything else is copied from the
+# previous outputs, which must have been generated from the previous
+# release with the current scripts.
+
+# The result is identical to running the pipeline on the new release
+# (see --verify). Changes to the header other than to the ontology,
+# subsetdef and synonymtypedef clauses (e.g. to data-version) only
+# replace the graph ID and meta. Changes to those clauses or to stanzas
+# other than [Term] stanzas require a full rebuild, which is reported
+# with exit status 3.
+
+# The OBO files are read a stanza at a time, keeping only a digest of
+# each stanza of the previous release, and the compacted JSON-LD is
+# read a node and edge at a time with jsonstream.
+
+
+from __future__ import print_function
+
+import os
+import re
+import sys
+import json
+import hashlib
+import logging
+import tempfile
+import subprocess
+
+from collections import defaultdict
+from logging import info, warn
+
+from six import StringIO, iteritems
+
+from preprocess_obo import process_file
+from obo2og import read_stanzas, read_shorthands, clause_values
+from obo2og import parse_tag_value, strip_qualifiers, read_items
+from obo2og import IriMapper, OboGraphWriter, convert_header, convert_stanza
+from obo2og import referenced_classes, SortedSpool, undeclared
+from compact_og import Compactor, context, baseiri, pretty_dumps
+from compact_og import write_pretty, json_dumps
+from getidmapping import OboGraph, process_graph, assure_list
+from getidmapping import is_proteinontology_node, is_deprecated
+from getidmapping import get_uniprot_ids
+from common import open_input, open_output
+from jsonstream import iter_graph_events
+
+
+logging.getLogger().setLevel(logging.INFO)
+
+
+NOT_INCREMENTAL = 3    # exit status if a full rebuild is required
+
+# Axioms written by obo2og and the field identifying their stanza
+AXIOM_ID_FIELD = {
+    'equivalentNodesSets': 'representativeNodeId',
+    'logicalDefinitionAxioms': 'definedClassId',
+    'domainRangeAxioms': 'predicateId',
+}
+
+# Header clauses that the conversion of stanzas or the header nodes
+# and edges depend on
+STRUCTURAL_HEADER_TAGS = ('ontology', 'subsetdef', 'synonymtypedef')
+
+ID_LINE_RE = re.compile(r'^[ \t]*id[ \t]*:.*$', re.M)
+
+# Indentation of graph array items by pretty_dumps()
+ITEM_INDENT = ' ' * 6
+
+SCRIPTDIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def argparser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-d', '--include-deprecated', default=False,
+                    action='store_true', help='Include deprecated terms')
+    ap.add_argument('-f', '--family', default=False, action='store_true',
+                    help='Generalize IDs to "Category=family" level')
+    ap.add_argument('-g', '--generalize', default=False, action='store_true',
+                    help='Generalize PRO IDs to "Category=gene" level')
+    ap.add_argument('-p', '--preprocessed', metavar='FILE', required=True,
+                    help='Preprocessed OBO of previous release')
+    ap.add_argument('-o', '--obographs', metavar='FILE', required=True,
+                    help='OBO Graphs JSON of previous release')
+    ap.add_argument('-c', '--compacted', metavar='FILE', required=True,
+                    help='Compacted JSON-LD of previous release')
+    ap.add_argument('-m', '--mapping', metavar='FILE', required=True,
+                    help='ID mapping of previous release')
+    ap.add_argument('--verify', default=False, action='store_true',
+                    help='Compare result to full rebuild')
+    ap.add_argument('previous', metavar='OLD', help='OBO of previous release')
+    ap.add_argument('release', metavar='NEW', help='OBO of new release')
+    return ap
+
+
+class NotIncremental(Exception):
+    """Raised when outputs cannot be updated incrementally."""
+    pass
+
+
+class Stanza(object):
+    """OBO stanza as unparsed text and its digest.
+
+    The text may be dropped (set to None) to keep only the digest.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.type = text.split('\n', 1)[0].strip()[1:-1]
+        self.id = None
+        m = ID_LINE_RE.search(text)
+        if m:
+            self.id = strip_qualifiers(parse_tag_value(m.group(0))[1])
+        data = text if isinstance(text, bytes) else text.encode('utf-8')
+        self.digest = hashlib.sha1(data).digest()
+
+
+def iter_stanzas(fn):
+    """Generate the header text and then Stanzas of OBO file.
+
+    The file is read a line at a time. Stanzas start at lines starting
+    with '[', as in read_stanzas().
+    """
+    with open_input(fn) as f:
+        lines, header = [], True
+        for line in f:
+            if line.startswith('['):
+                yield ''.join(lines) if header else Stanza(''.join(lines))
+                lines, header = [], False
+            lines.append(line)
+        yield ''.join(lines) if header else Stanza(''.join(lines))
+
+
+def split_stanzas(fn, previous=None):
+    """Return (header, stanzas, index by ID) for OBO file.
+
+    Stanza texts are dropped if previous is None, otherwise only those
+    of stanzas identical to the ones in previous (an index by ID).
+    """
+    stanzas = iter_stanzas(fn)
+    header, stanza_list, index = next(stanzas), [], {}
+    for stanza in stanzas:
+        if stanza.id is None or stanza.id in index:
+            raise NotIncremental('missing or duplicate ID {} in {}'.format(
+                stanza.id, fn))
+        old = previous.get(stanza.id) if previous is not None else None
+        if previous is None or (old is not None and
+                                old.digest == stanza.digest):
+            stanza.text = None
+        stanza_list.append(stanza)
+        index[stanza.id] = stanza
+    return header, stanza_list, index
+
+
+def changed_stanzas(old, new):
+    """Return IDs of added, removed and changed stanzas."""
+    changed = set()
+    for id_, stanza in iteritems(new):
+        if id_ not in old or old[id_].digest != stanza.digest:
+            changed.add(id_)
+    changed.update(id_ for id_ in old if id_ not in new)
+    for id_ in changed:
+        for stanza in (old.get(id_), new.get(id_)):
+            if stanza is not None and stanza.type != 'Term':
+                raise NotIncremental('changed [{}] {}'.format(
+                    stanza.type, id_))
+    return changed
+
+
+def header_clauses(header):
+    return next(read_stanzas(header.splitlines(True)))[1]
+
+
+def check_header(old_header, new_header):
+    """Raise NotIncremental if the header changed in structural clauses."""
+    structural = lambda clauses: [(tag, value) for tag, value, line in clauses
+                                  if tag in STRUCTURAL_HEADER_TAGS]
+    old = structural(header_clauses(old_header))
+    new = structural(header_clauses(new_header))
+    if old != new:
+        tags = set(t for t, v in set(old).symmetric_difference(new))
+        raise NotIncremental('changed {} clauses in header'.format(
+            ', '.join(sorted(tags or STRUCTURAL_HEADER_TAGS))))
+
+
+def write_preprocessed(fn, previous_fn, header, stanzas, previous_stanzas,
+                       changed):
+    """Write preprocessed OBO, reusing unchanged stanzas of previous_fn.
+
+    The stanzas of previous_fn, preprocessed previous_stanzas, are read
+    as the new stanzas need them, which is a stanza at a time when both
+    are in the same order. The texts of changed stanzas are replaced
+    with their preprocessed texts.
+    """
+    stanzas_read = iter_stanzas(previous_fn)
+    next(stanzas_read)    # previous header
+    expected = iter(previous_stanzas)
+    pending = {}    # texts read ahead of the stanza needed
+
+    def read_next():
+        # Read next stanza of previous_fn to pending, False at the end
+        stanza, old = next(stanzas_read, None), next(expected, None)
+        if stanza is None and old is None:
+            return False
+        elif stanza is None or old is None or stanza.id != old.id:
+            raise NotIncremental('stanzas of {} do not match the previous '
+                                 'release'.format(previous_fn))
+        pending[stanza.id] = stanza.text
+        return True
+
+    with open_output(fn) as out:
+        out.write(header)
+        for stanza in stanzas:
+            if stanza.id in changed:
+                stanza.text = preprocess_text(stanza.text)
+                out.write(stanza.text)
+                continue
+            while stanza.id not in pending:
+                if not read_next():
+                    raise NotIncremental('{} not in {}'.format(
+                        stanza.id, previous_fn))
+            out.write(pending.pop(stanza.id))
+    while read_next():    # check the rest, e.g. removed stanzas
+        pending.clear()
+
+
+def preprocess_text(text):
+    out = StringIO()
+    process_file(text.splitlines(True), out)
+    return out.getvalue()
+
+
+def is_converted(stanza):
+    return stanza.type in ('Term', 'Typedef')
+
+
+class StanzaItems(object):
+    """Items generated from a stanza in OBO Graphs and JSON-LD."""
+
+    def __init__(self):
+        self.og = defaultdict(list)    # key to JSON texts
+        self.compacted = defaultdict(list)    # key to (value, text)
+        self.edges = []    # decoded edges
+        self.axioms = []    # decoded (key, axiom)
+
+
+def read_obographs_items(fn, stanzas, iri, header_counts):
+    """Return header items and StanzaItems by ID for OBO Graphs file.
+
+    Items are assigned to stanzas in the order obo2og writes them.
+    """
+    decoder = json.JSONDecoder()
+    items = defaultdict(list)
+    with open_input(fn) as f:
+        for key, text in read_items(f):
+            items[key].append(text)
+    if items['propertyChainAxioms']:
+        raise NotIncremental('unexpected propertyChainAxioms')
+    header = dict((k, items[k][:n]) for k, n in iteritems(header_counts))
+    keys = ['edges'] + list(AXIOM_ID_FIELD)
+    decoded = dict((k, [json.loads(t) for t in items[k]]) for k in keys)
+    by_id, positions = {}, defaultdict(int, header_counts)
+    converted = [s for s in stanzas if is_converted(s)]
+    nodes = items['nodes']
+    if len(nodes) < header_counts['nodes'] + len(converted):
+        raise NotIncremental('node count mismatch in {}'.format(fn))
+    for i, stanza in enumerate(converted):
+        text = nodes[header_counts['nodes'] + i]
+        iri_ = iri(stanza.id)
+        if (not text.startswith('{"id": ') or
+            decoder.raw_decode(text, 7)[0] != iri_):
+            raise NotIncremental('node mismatch for {} in {}'.format(
+                stanza.id, fn))
+        stanza_items = StanzaItems()
+        stanza_items.og['nodes'].append(text)
+        for key in keys:
+            field = 'sub' if key == 'edges' else AXIOM_ID_FIELD[key]
+            start = end = positions[key]
+            while end < len(decoded[key]) and \
+                  decoded[key][end].get(field) == iri_:
+                end += 1
+            stanza_items.og[key] = items[key][start:end]
+            if key == 'edges':
+                stanza_items.edges = decoded[key][start:end]
+            else:
+                stanza_items.axioms.extend(
+                    (key, a) for a in decoded[key][start:end])
+            positions[key] = end
+        by_id[stanza.id] = stanza_items
+    for key in keys:
+        if positions[key] != len(items[key]):
+            raise NotIncremental('unassigned {} in {}'.format(key, fn))
+    referenced = nodes[header_counts['nodes'] + len(converted):]
+    return header, by_id, len(referenced)
+
+
+def item_text(raw):
+    # Return pretty_dumps() text of graph array item from its JSON text
+    # in pretty_dumps() output
+    return raw.replace('\n' + ITEM_INDENT, '\n')
+
+
+def read_compacted_items(fn, stanzas, header, by_id, referenced):
+    """Return document and header items of compacted JSON-LD.
+
+    Compacted items correspond one to one to the OBO Graphs items and
+    are assigned to stanzas as (value, text). The text is the
+    pretty_dumps() text of a node or edge as found in the file, or None
+    for other items and single-item arrays. The document is returned
+    with its graph, whose nodes and edges are given as lists.
+    """
+    items, doc, graph = defaultdict(list), None, None
+    for event, index, value in iter_graph_events(fn, raw=True):
+        if index:
+            raise NotIncremental('expected one graph in {}'.format(fn))
+        if event in ('node', 'edge'):
+            items[event + 's'].append((json.loads(value), item_text(value)))
+        elif event == 'graph':
+            graph = value
+        else:
+            doc = value
+    if graph is None:
+        raise NotIncremental('expected one graph in {}'.format(fn))
+    for key in ('nodes', 'edges'):
+        if len(items[key]) == 1:
+            items[key] = [(items[key][0][0], None)]    # not indented
+        graph[key] = [v for v, t in items[key]]
+    for key in AXIOM_ID_FIELD:
+        items[key] = [(v, None) for v in assure_list(graph.get(key, []))]
+    doc['graphs'] = graph
+    counts = defaultdict(int)
+    for key, texts in iteritems(header):
+        counts[key] += len(texts)
+    for stanza_items in by_id.values():
+        for key, texts in iteritems(stanza_items.og):
+            counts[key] += len(texts)
+    counts['nodes'] += referenced
+    for key in ['nodes', 'edges'] + list(AXIOM_ID_FIELD):
+        if len(items[key]) != counts[key]:
+            raise NotIncremental('{} count mismatch in {}'.format(key, fn))
+    header_items, positions = {}, defaultdict(int)
+    for key, texts in iteritems(header):
+        header_items[key] = items[key][:len(texts)]
+        positions[key] = len(texts)
+    for stanza in stanzas:
+        if not is_converted(stanza):
+            continue
+        stanza_items = by_id[stanza.id]
+        for key, texts in iteritems(stanza_items.og):
+            start = positions[key]
+            stanza_items.compacted[key] = items[key][start:start+len(texts)]
+            positions[key] = start + len(texts)
+    return doc, header_items
+
+
+class Update(object):
+    """Incremental update of pipeline outputs for a new release."""
+
+    def __init__(self, args):
+        self.args = args
+        self.compactor = Compactor(context, baseiri)
+
+    def run(self, outputs):
+        """Write updated outputs to files given as dict by type."""
+        args = self.args
+        old_header, old_stanzas, old_index = split_stanzas(args.previous)
+        new_header, new_stanzas, new_index = split_stanzas(args.release,
+                                                           old_index)
+        check_header(old_header, new_header)
+        changed = changed_stanzas(old_index, new_index)
+        info('{} of {} stanzas changed'.format(len(changed), len(new_stanzas)))
+
+        # Preprocessed OBO
+        pre_header = preprocess_text(new_header)
+        write_preprocessed(outputs['preprocessed'], args.preprocessed,
+                           pre_header, new_stanzas, old_stanzas, changed)
+
+        # OBO Graphs and compacted JSON-LD, with graph ID and meta from
+        # the new header
+        shorthands = read_shorthands(args.preprocessed)    # Typedefs as before
+        clauses = header_clauses(pre_header)
+        ontology = clause_values(clauses).get('ontology', [None])[0]
+        iri = IriMapper(ontology, shorthands)
+        graph_id, meta, header_nodes, header_edges = convert_header(
+            clauses, iri)
+        header_counts = { 'nodes': len(header_nodes),
+                          'edges': len(header_edges) }
+        header, by_id, referenced = read_obographs_items(
+            args.obographs, old_stanzas, iri, header_counts)
+        doc, header_compacted = read_compacted_items(
+            args.compacted, old_stanzas, header, by_id, referenced)
+        old_graph = doc['graphs']
+        compacted = self.write_obographs(
+            outputs['obographs'], graph_id, meta, new_stanzas, iri, changed,
+            header, header_compacted, by_id)
+        new_graph = dict(doc['graphs'])
+        graph_fields = self.compactor.compact({ 'id': graph_id, 'meta': meta })
+        for key in ('id', 'meta'):
+            new_graph.pop(key, None)
+            if key in graph_fields:
+                new_graph[key] = graph_fields[key]
+        for key, items in iteritems(compacted):
+            values = [value for value, text in items]
+            new_graph[key] = self.compactor.compact_array(values)
+        doc['graphs'] = new_graph
+        with open_output(outputs['compacted']) as out:
+            write_pretty(out, doc, dict(
+                ((0, key), [json_dumps(v) if t is None else t
+                            for v, t in items])
+                for key, items in iteritems(compacted)))
+            out.write('\n')
+
+        # ID mapping
+        changed_ids = set(self.compactor.compact_id(iri(id_))
+                          for id_ in changed)
+        self.write_mapping(outputs['mapping'], old_graph, new_graph,
+                           changed_ids)
+
+    def compact(self, item):
+        return self.compactor.compact(item), None
+
+    def write_obographs(self, fn, graph_id, meta, stanzas, iri, changed,
+                        header, header_compacted, by_id):
+        """Write OBO Graphs as obo2og would, return compacted items.
+
+        Compacted items are returned as (value, text) by key, with text
+        None for new items.
+        """
+        compacted = defaultdict(list)
+        with open_output(fn) as out:
+            writer = OboGraphWriter(out, graph_id, meta)
+            for key, texts in iteritems(header):
+                for text in texts:
+                    writer.add_raw(key, text)
+                compacted[key].extend(header_compacted[key])
+            declared, referenced = SortedSpool(), SortedSpool()
+            for stanza in stanzas:
+                if not is_converted(stanza):
+                    warn('skipping [{}] stanza'.format(stanza.type))
+                    continue
+                if stanza.id in changed:
+                    lines = stanza.text.splitlines(True)
+                    clauses = list(read_stanzas(lines))[-1][1]
+                    node, edges, axioms = convert_stanza(
+                        stanza.type, clauses, iri)
+                    writer.add_node(node)
+                    compacted['nodes'].append(self.compact(node))
+                    for edge in edges:
+                        writer.add('edges', edge)
+                        compacted['edges'].append(self.compact(edge))
+                    for key, axiom in axioms:
+                        writer.add(key, axiom)
+                        compacted[key].append(self.compact(axiom))
+                else:
+                    stanza_items = by_id[stanza.id]
+                    for key in ['nodes', 'edges'] + list(AXIOM_ID_FIELD):
+                        for text in stanza_items.og.get(key, []):
+                            writer.add_raw(key, text)
+                        compacted[key].extend(stanza_items.compacted[key])
+                    edges, axioms = stanza_items.edges, stanza_items.axioms
+                declared.add(iri(stanza.id))
+                if stanza.type == 'Term':
+                    for id_ in referenced_classes(edges, axioms):
+                        referenced.add(id_)
+            for id_ in undeclared(declared, referenced):    # as obo2og
+                node = { 'id': id_, 'type': 'CLASS' }
+                writer.add_node(node)
+                compacted['nodes'].append(self.compact(node))
+            declared.close()
+            referenced.close()
+            writer.close()
+        for key in OboGraphWriter.spooled:
+            compacted.setdefault(key, [])
+        return compacted
+
+    def write_mapping(self, fn, old_graph, new_graph, changed):
+        """Write ID mapping, reusing rows of unaffected nodes.
+
+        Graphs are given as compacted JSON-LD graph objects.
+        """
+        options = self.args
+        with open_input(options.mapping) as f:
+            rows = f.readlines()
+        previous, i = {}, 0
+        for node in assure_list(old_graph.get('nodes', [])):
+            if not is_proteinontology_node(node):
+                continue
+            if is_deprecated(node) and not options.include_deprecated:
+                continue
+            uids = get_uniprot_ids(node)
+            for uid in uids:
+                if i >= len(rows) or not rows[i].startswith(uid + '\t'):
+                    raise NotIncremental('{} does not match graph'.format(
+                        options.mapping))
+                i += 1
+            previous[node['id']] = ''.join(rows[i-len(uids):i])
+        if i != len(rows):
+            raise NotIncremental('{} does not match graph'.format(
+                options.mapping))
+        affected = set(changed)
+        for graph in (old_graph, new_graph):
+            affected.update(descendants(graph, changed))
+        reuse = dict((id_, text) for id_, text in iteritems(previous)
+                     if id_ not in affected)
+        info('mapping {} affected terms'.format(len(affected)))
+        with open_output(fn) as out:
+            process_graph(OboGraph(new_graph), options, out, reuse)
+
+
+def descendants(graph, ids):
+    """Return IDs of is_a descendants of given IDs in graph."""
+    children = defaultdict(list)
+    for edge in assure_list(graph.get('edges', [])):
+        if edge['pred'] == 'is_a':
+            children[edge['obj']].append(edge['sub'])
+    found, pending = set(), list(ids)
+    while pending:
+        for child in children.get(pending.pop(), []):
+            if child not in found:
+                found.add(child)
+                pending.append(child)
+    return found
+
+
+def full_rebuild(args, outputs):
+    """Run the pipeline scripts on the new release."""
+    options = [o for o, v in (('-d', args.include_deprecated),
+                              ('-f', args.family),
+                              ('-g', args.generalize)) if v]
+    steps = [
+        ('preprocessed', ['preprocess_obo.py'], args.release),
+        ('obographs', ['obo2og.py'], outputs['preprocessed']),
+        ('compacted', ['compact_og.py'], outputs['obographs']),
+        ('mapping', ['getidmapping.py'] + options, outputs['compacted']),
+    ]
+    for name, command, input_ in steps:
+        command[0] = os.path.join(SCRIPTDIR, command[0])
+        with open(outputs[name], 'w') as out:
+            subprocess.check_call([sys.executable] + command + [input_],
+                                  stdout=out)
+
+
+def same_contents(fn1, fn2):
+    # compare decompressed contents
+    with open_input(fn1) as f1, open_input(fn2) as f2:
+        while True:
+            b1, b2 = f1.read(1 << 20), f2.read(1 << 20)
+            if b1 != b2:
+                return False
+            elif not b1:
+                return True
+
+
+def main(argv):
+    args = argparser().parse_args(argv[1:])
+    targets = {
+        'preprocessed': args.preprocessed,
+        'obographs': args.obographs,
+        'compacted': args.compacted,
+        'mapping': args.mapping,
+    }
+    outputs = {}
+    for name, fn in iteritems(targets):
+        # same suffix as target for compression by suffix
+        fd, outputs[name] = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(fn)), prefix='.tmp-',
+            suffix='-' + os.path.basename(fn))
+        os.close(fd)
+    try:
+        try:
+            Update(args).run(outputs)
+        except NotIncremental as e:
+            warn('cannot update incrementally: {}'.format(e))
+            return NOT_INCREMENTAL
+        if args.verify:
+            tmpdir = tempfile.mkdtemp()
+            full = dict((n, os.path.join(tmpdir, n)) for n in outputs)
+            full_rebuild(args, full)
+            differ = [n for n in outputs if not same_contents(
+                outputs[n], full[n])]
+            for fn in full.values():
+                os.remove(fn)
+            os.rmdir(tmpdir)
+            if differ:
+                warn('differs from full rebuild: {}'.format(', '.join(differ)))
+                return 1
+            info('identical to full rebuild')
+        for name, fn in iteritems(outputs):
+            os.chmod(fn, 0o644)
+            os.rename(fn, targets[name])
+    finally:
+        for fn in outputs.values():
+            if os.path.exists(fn):
+                os.remove(fn)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
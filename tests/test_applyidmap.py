@@ -0,0 +1,94 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+from six import StringIO
+
+TESTDIR = os.path.dirname(os.path.abspath(__file__))
+DATADIR = os.path.join(TESTDIR, 'data')
+sys.path.insert(0, os.path.join(TESTDIR, '..', 'scripts'))
+
+import applyidmap
+import compact_og
+import ontologydb
+
+from test_common import Fifo
+
+
+MAPPING = 'P37173\tPRO\tPR:000000005\nP37173-1\tPRO\tPR:000000006\n'
+
+IDS = 'P37173-1\nQ00000\nP37173\n'
+
+EXPECTED = 'PR:000000006\nQ00000\nPR:000000005\n'
+
+
+def applyidmap_output(*args):
+    stdout = sys.stdout
+    try:
+        sys.stdout = StringIO()
+        applyidmap.main(['applyidmap.py'] + list(args))
+        return sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
+
+
+@unittest.skipIf(not hasattr(os, 'mkfifo'), 'no named pipes')
+class PipeInputTest(unittest.TestCase):
+    """Mappings and IDs given as <(cat FILE)."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.mapping = self.write('pr-idmapping.dat', MAPPING)
+        self.ids = self.write('ids', IDS)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, text):
+        fn = os.path.join(self.dir, name)
+        with open(fn, 'w') as f:
+            f.write(text)
+        return fn
+
+    def test_files(self):
+        self.assertEqual(applyidmap_output(self.mapping, self.ids), EXPECTED)
+
+    def test_mapping_pipe(self):
+        fifo = Fifo(MAPPING.encode('utf-8'))
+        try:
+            self.assertEqual(applyidmap_output(fifo.fn, self.ids), EXPECTED)
+        finally:
+            fifo.close()
+
+    def test_ids_pipe(self):
+        fifo = Fifo(IDS.encode('utf-8'))
+        try:
+            self.assertEqual(applyidmap_output(self.mapping, fifo.fn),
+                             EXPECTED)
+        finally:
+            fifo.close()
+
+    def test_database(self):
+        with open(os.path.join(DATADIR, 'small.og.json')) as f:
+            compacted = compact_og.compact_document(
+                json.load(f), compact_og.context, compact_og.baseiri)
+        graph = self.write('pr.jsonld', json.dumps(compacted))
+        database = os.path.join(self.dir, 'pr.sqlite')
+        ontologydb.write_database(database, graph, self.mapping)
+        self.assertTrue(ontologydb.is_database(database))
+        self.assertEqual(applyidmap_output(database, self.ids), EXPECTED)
+
+    def test_is_database_pipe(self):
+        fifo = Fifo(MAPPING.encode('utf-8'))
+        try:
+            self.assertFalse(ontologydb.is_database(fifo.fn))
+            self.assertEqual(fifo.read(), MAPPING.encode('utf-8'))
+        finally:
+            fifo.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
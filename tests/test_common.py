@@ -0,0 +1,112 @@
+import os
+import sys
+import gzip
+import shutil
+import tempfile
+import threading
+import unittest
+
+from six import PY2
+
+TESTDIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTDIR, '..', 'scripts'))
+
+import common
+
+
+class Fifo(object):
+    """Named pipe fed with data by a thread, as given by <(cat FILE)."""
+
+    def __init__(self, data, name='fifo'):
+        self.dir = tempfile.mkdtemp()
+        self.fn = os.path.join(self.dir, name)
+        os.mkfifo(self.fn)
+        self.thread = threading.Thread(target=self._write, args=(data,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _write(self, data):
+        with open(self.fn, 'wb') as f:
+            f.write(data)
+
+    def read(self):
+        with open(self.fn, 'rb') as f:
+            return f.read()
+
+    def close(self):
+        self.thread.join(5)
+        shutil.rmtree(self.dir)
+
+
+@unittest.skipIf(not hasattr(os, 'mkfifo'), 'no named pipes')
+class HasMagicTest(unittest.TestCase):
+
+    def test_regular_file(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b'MAGIC123rest')
+            f.flush()
+            self.assertTrue(common.has_magic(f.name, b'MAGIC123'))
+            self.assertFalse(common.has_magic(f.name, b'MAGIC124'))
+
+    def test_pipe_not_read(self):
+        fifo = Fifo(b'MAGIC123rest')
+        try:
+            self.assertFalse(common.has_magic(fifo.fn, b'MAGIC123'))
+            self.assertEqual(fifo.read(), b'MAGIC123rest')
+        finally:
+            fifo.close()
+
+
+def read_input(fn):
+    with common.open_input(fn) as f:
+        return f.read()
+
+
+@unittest.skipIf(not hasattr(os, 'mkfifo'), 'no named pipes')
+class OpenInputTest(unittest.TestCase):
+
+    TEXT = 'id1\tis_a\tid2\n' * 1000
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_regular_file(self):
+        fn = os.path.join(self.dir, 'plain')
+        with open(fn, 'w') as f:
+            f.write(self.TEXT)
+        self.assertEqual(common.compression_of(fn), None)
+        self.assertEqual(read_input(fn), self.TEXT)
+
+    def test_compressed_file(self):
+        fn = os.path.join(self.dir, 'compressed')    # no suffix
+        with gzip.open(fn, 'wb') as f:
+            f.write(self.TEXT.encode('utf-8'))
+        self.assertEqual(common.compression_of(fn), 'gzip')
+        self.assertEqual(read_input(fn), self.TEXT)
+
+    def test_pipe(self):
+        fifo = Fifo(self.TEXT.encode('utf-8'))
+        try:
+            self.assertEqual(common.compression_of(fifo.fn), None)
+            self.assertEqual(read_input(fifo.fn), self.TEXT)
+        finally:
+            fifo.close()
+
+    @unittest.skipIf(PY2, 'gzip module reads only seekable files')
+    def test_compressed_pipe_by_suffix(self):
+        fn = os.path.join(self.dir, 'compressed.gz')
+        with gzip.open(fn, 'wb') as f:
+            f.write(self.TEXT.encode('utf-8'))
+        with open(fn, 'rb') as f:
+            fifo = Fifo(f.read(), 'fifo.gz')
+        try:
+            self.assertEqual(read_input(fifo.fn), self.TEXT)
+        finally:
+            fifo.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import os
+import sys
+import json
+import unittest
+
+from six import StringIO
+
+TESTDIR = os.path.dirname(os.path.abspath(__file__))
+DATADIR = os.path.join(TESTDIR, 'data')
+sys.path.insert(0, os.path.join(TESTDIR, '..', 'scripts'))
+
+import compact_og
+
+try:
+    from pyld import jsonld    # optional, reference implementation
+except ImportError:
+    jsonld = None
+
+
+def pyld_before_1_0():
+    # pyld 1.0 and later do not produce CURIEs with this context
+    if jsonld is None:
+        return False
+    version = getattr(jsonld, '__version__', '0')
+    return int(version.split('.')[0]) < 1
+
+
+FIXTURE = os.path.join(DATADIR, 'small.og.json')
+
+# Output of "compact_og.py --pyld small.og.json" with pyld 0.8.2
+GOLDEN = os.path.join(DATADIR, 'small.compacted.jsonld')
+
+
+def load_fixture():
+    with open(FIXTURE) as f:
+        return json.load(f)
+
+
+def load_golden():
+    with open(GOLDEN) as f:
+        return f.read()
+
+
+def compact(d):
+    return compact_og.compact_document(d, compact_og.context,
+                                       compact_og.baseiri)
+
+
+def written(write, *args):
+    out = StringIO()
+    write(out, *args)
+    return out.getvalue()
+
+
+def write_pretty(out, doc):
+    # write_document() with orjson
+    arrays = compact_og.graph_arrays(doc)
+    compact_og.write_pretty(out, doc, arrays, compact_og.json_dumps)
+    out.write('\n')
+
+
+class GoldenTest(unittest.TestCase):
+    """Compare the fast-path compactor output to that of pyld."""
+
+    def setUp(self):
+        self.expected = load_golden()
+
+    def test_compact_document(self):
+        doc = compact(load_fixture())
+        self.assertEqual(written(compact_og.write_document, doc),
+                         self.expected)
+        self.assertEqual(written(write_pretty, doc), self.expected)
+
+    def test_compact_stream(self):
+        doc = compact_og.compact_stream(FIXTURE, compact_og.context,
+                                        compact_og.baseiri)
+        self.assertEqual(written(compact_og.write_document, doc),
+                         self.expected)
+        self.assertEqual(written(write_pretty, doc), self.expected)
+
+    def test_parallel(self):
+        self.assertEqual(written(
+            lambda out: compact_og.write_compacted_parallel(
+                FIXTURE, compact_og.context, compact_og.baseiri, 2, out)),
+                         self.expected)
+
+    @unittest.skipIf(not pyld_before_1_0(), 'pyld before 1.0 not installed')
+    def test_pyld(self):
+        self.assertEqual(written(
+            lambda out: compact_og.process(FIXTURE, out, reference=True)),
+                         self.expected)
+
+
+class RelativizeTest(unittest.TestCase):
+
+    def test_relativize(self):
+        context = {
+            '@base': 'http://ex.org/',
+            'ref': { '@id': 'http://ex.org/ref', '@type': '@id' },
+        }
+        obj = {
+            'ref': 'http://ex.org/1',
+            'other': 'http://ex.org/2',
+            'items': [{ 'ref': 'http://other.org/3' }],
+        }
+        compact_og.relativize(obj, context)
+        self.assertEqual(obj, {
+            'ref': '1',
+            'other': 'http://ex.org/2',
+            'items': [{ 'ref': 'http://other.org/3' }],
+        })
+
+
+class JsonDumpsTest(unittest.TestCase):
+    """json_dumps() output does not depend on whether orjson is used."""
+
+    OBJ = {
+        'id': 'PR:000000001',
+        'meta': { 'values': [1e16, 1e-7, 0.5, 3, None] },
+    }
+
+    def test_pretty(self):
+        self.assertEqual(compact_og.json_dumps(self.OBJ),
+                         compact_og.pretty_dumps(self.OBJ))
+
+    def test_compact(self):
+        self.assertEqual(compact_og.json_dumps(self.OBJ, pretty=False),
+                         json.dumps(self.OBJ, sort_keys=True,
+                                    separators=(',', ':')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+TESTDIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTDIR, '..', 'scripts'))
+
+import getidmapping
+from getidmapping import OboGraph, IndexedOboGraph, DagAnalysis
+
+
+def node(id_, *categories):
+    comments = ['Category={}.'.format(c) for c in categories]
+    return { 'id': id_, 'lbl': id_, 'meta': { 'comments': comments } }
+
+
+def is_a(sub, obj):
+    return { 'sub': sub, 'pred': 'is_a', 'obj': obj }
+
+
+def graph(nodes, edges):
+    return OboGraph({ 'nodes': nodes, 'edges': edges })
+
+
+def generalized(g, id_, category):
+    n = g.get_node(id_)
+    return getidmapping.generalize_to_nearest(n, category, g, None)['id']
+
+
+class CategoryTest(unittest.TestCase):
+    """Categories are numbered for each graph separately."""
+
+    def test_numbering_per_graph(self):
+        g1 = graph([node('PR:1', 'family'), node('PR:2', 'gene')], [])
+        g2 = graph([node('PR:3', 'gene'), node('PR:4', 'organism-gene')],
+                   [])
+        for g in (g1, g2):
+            list(g.nodes())    # categories are numbered when reading nodes
+        self.assertEqual(g1.categories, ['family', 'gene'])
+        self.assertEqual(g2.categories, ['gene', 'organism-gene'])
+        n = g2.get_node('PR:3')
+        self.assertTrue(getidmapping.has_category(n, 'gene'))
+        self.assertFalse(getidmapping.has_category(n, 'family'))
+
+    def test_index_categories(self):
+        list(graph([node('PR:0', 'family')], []).nodes())
+        g = graph([node('PR:1', 'gene'), node('PR:2', 'organism-gene')],
+                  [is_a('PR:2', 'PR:1')])
+        tmpdir = tempfile.mkdtemp()
+        try:
+            fn = os.path.join(tmpdir, 'g.idx')
+            getidmapping.index_graph(g, fn)
+            indexed = IndexedOboGraph(fn)
+            self.assertEqual(indexed.index.categories,
+                             ['gene', 'organism-gene'])
+            self.assertEqual(generalized(indexed, 'PR:2', 'gene'), 'PR:1')
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class CacheTest(unittest.TestCase):
+    """Generalization with memo tables and with DagAnalysis agree."""
+
+    def make_graph(self):
+        return graph([
+            node('PR:1', 'family'),
+            node('PR:2', 'gene'),
+            node('PR:3', 'gene'),
+            node('PR:4'),
+            node('PR:5'),
+        ], [
+            is_a('PR:2', 'PR:1'),
+            is_a('PR:3', 'PR:1'),
+            is_a('PR:4', 'PR:2'),
+            is_a('PR:5', 'PR:4'),
+            is_a('PR:5', 'PR:3'),
+        ])
+
+    def test_fallback_path(self):
+        ids = ['PR:1', 'PR:2', 'PR:3', 'PR:4', 'PR:5']
+        g = self.make_graph()
+        g.cache_size = 2    # evicts
+        cached = [(generalized(g, i, c), c) for i in ids
+                  for c in ('gene', 'family')]
+        stats = dict(g.caches())
+        self.assertTrue(stats['nearest_ancestors'].evictions > 0)
+        g = self.make_graph()
+        g.analysis = DagAnalysis(g, ['gene', 'family'])
+        analyzed = [(generalized(g, i, c), c) for i in ids
+                    for c in ('gene', 'family')]
+        self.assertEqual(cached, analyzed)
+        self.assertEqual(g.caches(), [])
+
+
+
+class TieTest(unittest.TestCase):
+    """Nearest ancestors at the same depth are ordered by ID."""
+
+    def test_tie_by_id(self):
+        for parents in (['PR:2', 'PR:3'], ['PR:3', 'PR:2']):
+            g = graph([
+                node('PR:1'),
+                node('PR:3', 'gene'),
+                node('PR:2', 'gene'),
+                node('PR:4'),
+            ], [is_a('PR:3', 'PR:1'), is_a('PR:2', 'PR:1')] +
+               [is_a('PR:4', p) for p in parents])
+            self.assertEqual(generalized(g, 'PR:4', 'gene'), 'PR:2')
+            g.analysis = DagAnalysis(g, ['gene'])
+            self.assertEqual(generalized(g, 'PR:4', 'gene'), 'PR:2')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import os
+import sys
+import json
+import shutil
+import socket
+import logging
+import tempfile
+import threading
+import unittest
+
+from six import PY2
+from six.moves.http_client import HTTPConnection
+
+TESTDIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTDIR, '..', 'scripts'))
+
+from idmapserver import MappingStore, make_server
+
+from test_applyidmap import applyidmap_output
+
+
+MAPPING = ('P37173\tPRO\tPR:000000005\n'
+           'P37173-1\tPRO\tPR:000000006\n'
+           'P37173\tPRO\tPR:000000009\n')
+
+UPDATED = ('P37173\tPRO\tPR:000000005\n'
+           'Q00000\tPRO\tPR:000000010\n')
+
+IDS = 'P37173-1\nQ00000\nP37173\nPR:000000005\n'
+
+
+class UnixHTTPConnection(HTTPConnection):
+    # HTTPConnection to server listening on Unix socket
+
+    def __init__(self, path):
+        HTTPConnection.__init__(self, 'localhost')
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+class ServerTest(unittest.TestCase):
+    """Lookups over HTTP agree with applyidmap.py."""
+
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        self.dir = tempfile.mkdtemp()
+        self.mapping = self.write('pr-idmapping.dat', MAPPING)
+        self.ids = self.write('ids', IDS)
+        self.store = MappingStore(self.mapping)
+        self.server = self.start(make_server(self.store, port=0))
+        self.connect = lambda: HTTPConnection(
+            '127.0.0.1', self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir)
+        logging.disable(logging.NOTSET)
+
+    def write(self, name, text):
+        fn = os.path.join(self.dir, name)
+        with open(fn, 'w') as f:
+            f.write(text)
+        return fn
+
+    def start(self, server):
+        thread = threading.Thread(target=server.serve_forever,
+                                  args=(0.05,))    # fast shutdown()
+        thread.daemon = True
+        thread.start()
+        return server
+
+    def request(self, method, path, body=None, connect=None):
+        conn = (connect or self.connect)()
+        try:
+            conn.request(method, path, body)
+            response = conn.getresponse()
+            text = response.read()
+            text = text if PY2 else text.decode('utf-8')
+            return response, text
+        finally:
+            conn.close()
+
+    def post(self, query='', ids=IDS, **kwargs):
+        response, text = self.request('POST', '/map' + query, ids, **kwargs)
+        self.assertEqual(response.status, 200)
+        return text
+
+    def expected(self, *args):
+        return applyidmap_output(*(list(args) + [self.mapping, self.ids]))
+
+    def test_same_as_applyidmap(self):
+        for query, args in [
+                ('', []),
+                ('?echo=1', ['--echo']),
+                ('?reverse=1', ['--reverse']),
+                ('?echo=1&reverse=1', ['--echo', '--reverse']),
+                ('?echo=0&reverse=true', ['--reverse'])]:
+            self.assertEqual(self.post(query), self.expected(*args), query)
+
+    def test_counts(self):
+        response, text = self.request('POST', '/map', IDS)
+        self.assertEqual(response.getheader('X-Found'), '2')
+        self.assertEqual(response.getheader('X-Missing'), '2')
+
+    def test_bad_request(self):
+        response, text = self.request('POST', '/map', 'P37173 Q00000\n')
+        self.assertEqual(response.status, 400)
+        response, text = self.request('POST', '/other', IDS)
+        self.assertEqual(response.status, 404)
+
+    def test_unix_socket(self):
+        path = os.path.join(self.dir, 'socket')
+        server = self.start(make_server(self.store, socket_path=path))
+        connect = lambda: UnixHTTPConnection(path)
+        try:
+            self.assertEqual(self.post('?echo=1', connect=connect),
+                             self.expected('--echo'))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_reload(self):
+        self.write('pr-idmapping.dat', UPDATED)
+        self.assertFalse(self.store.check())    # not yet settled
+        self.assertEqual(self.post(), 'PR:000000006\nQ00000\n'
+                         'PR:000000005 PR:000000009\nPR:000000005\n')
+        self.assertTrue(self.store.check())
+        self.assertEqual(self.post(), self.expected())
+        self.assertEqual(self.post(), 'P37173-1\nPR:000000010\n'
+                         'PR:000000005\nPR:000000005\n')
+        response, text = self.request('GET', '/status')
+        self.assertEqual(json.loads(text)['reloads'], 1)
+
+    def test_malformed_keeps_mapping(self):
+        served = self.post('?echo=1')
+        self.write('pr-idmapping.dat', 'P37173 PR:000000005\n')
+        for i in range(3):
+            self.assertFalse(self.store.check())
+            self.assertEqual(self.post('?echo=1'), served)
+        self.assertEqual(self.store.reloads, 0)
+        # a corrected file is loaded again
+        self.write('pr-idmapping.dat', UPDATED)
+        self.store.check()
+        self.assertTrue(self.store.check())
+        self.assertEqual(self.post(), self.expected())
+
+
+if __name__ == '__main__':
+    unittest.main()
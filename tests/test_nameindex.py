@@ -0,0 +1,216 @@
+import os
+import sys
+import json
+import shutil
+import logging
+import tempfile
+import unittest
+import unicodedata
+
+from six import StringIO, PY2, unichr
+
+TESTDIR = os.path.dirname(os.path.abspath(__file__))
+DATADIR = os.path.join(TESTDIR, 'data')
+sys.path.insert(0, os.path.join(TESTDIR, '..', 'scripts'))
+
+import obo2og
+import compact_og
+import nameindex
+from nameindex import NameIndex, normalize
+
+
+def native(s):
+    # Names are returned as native strings
+    return s.encode('utf-8') if PY2 else s
+
+
+def match(id_, type_, name):
+    return ('PR:{}'.format(id_), type_, native(name))
+
+
+def write_index(dirname, include_deprecated=False):
+    # Convert and compact data/names.obo, then index it
+    out = StringIO()
+    obo2og.process(os.path.join(DATADIR, 'names.obo'), out)
+    compacted = compact_og.compact_document(
+        json.loads(out.getvalue()), compact_og.context, compact_og.baseiri)
+    graph = os.path.join(dirname, 'names.jsonld')
+    with open(graph, 'w') as f:
+        f.write(json.dumps(compacted))
+    fn = os.path.join(dirname, 'names.names')
+    nameindex.write_name_index(fn, graph, include_deprecated)
+    return fn
+
+
+class NormalizeTest(unittest.TestCase):
+
+    def test_case_and_whitespace(self):
+        self.assertEqual(normalize(u' TNF \t Alpha\n'), u'tnf alpha')
+        self.assertEqual(normalize(u'TNF-alpha'), u'tnf-alpha')
+
+    def test_greek(self):
+        self.assertEqual(normalize(u'TNF-\u03b1'), u'tnf-alpha')
+        self.assertEqual(normalize(u'\u03a3\u03c3\u03c2'),
+                         u'sigmasigmasigma')
+        self.assertEqual(normalize(u'\u00b5-crystallin'), u'mu-crystallin')
+
+    def test_greek_table(self):
+        # Every Greek letter, around the unassigned U+03A2 as well
+        for code in list(range(0x391, 0x3aa)) + list(range(0x3b1, 0x3ca)):
+            if code == 0x3a2:
+                self.assertFalse(code in nameindex.GREEK_TABLE)
+                continue
+            words = unicodedata.name(unichr(code)).split()
+            expected = words[-1].lower().replace('lamda', 'lambda')
+            self.assertEqual(normalize(unichr(code)), expected,
+                             hex(code))
+
+    def test_bytes(self):
+        self.assertEqual(normalize(u'TNF-\u03b1'.encode('utf-8')),
+                         u'tnf-alpha')
+
+
+class NameIndexTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.INFO)
+        cls.dir = tempfile.mkdtemp()
+        cls.fn = write_index(cls.dir)
+        cls.index = NameIndex(cls.fn)
+
+    @classmethod
+    def tearDownClass(cls):
+        del cls.index
+        shutil.rmtree(cls.dir)
+        logging.disable(logging.NOTSET)
+
+    def test_size(self):
+        # NARROW synonyms and deprecated terms are not indexed
+        self.assertEqual(len(self.index), 10)
+
+    def test_exact(self):
+        self.assertEqual(self.index.find('cachectin'),
+                         [match('000000101', 'RELATED', u'cachectin')])
+        self.assertEqual(self.index.find('Cytokine'),
+                         [match('000000101', 'BROAD', u'cytokine')])
+        self.assertEqual(self.index.find('TNF-alpha precursor'), [])
+        self.assertEqual(self.index.find('TNF-beta'), [])
+
+    def test_labels_first(self):
+        self.assertEqual(self.index.find('TNF-alpha'), [
+            match('000000101', 'label', u'TNF-alpha'),
+            match('000000103', 'RELATED', u'TNF-alpha'),
+        ])
+
+    def test_greek_letters(self):
+        expected = self.index.find('TNF-alpha')
+        for mention in [u'TNF-\u03b1', u'tnf-\u0391', u'TNF-ALPHA',
+                        u'TNF-\u03b1'.encode('utf-8')]:
+            self.assertEqual(self.index.find(mention), expected,
+                             repr(mention))
+        # hyphens are not folded
+        self.assertEqual(self.index.find(u'tnf alpha'),
+                         [match('000000101', 'EXACT', u'TNF  \u03b1')])
+
+    def test_sigma(self):
+        expected = [match('000000102', 'EXACT', u'\u03a3\u03a11')]
+        for mention in [u'\u03a3\u03a11', u'\u03c3\u03c11',
+                        u'\u03c2\u03c11', u'SigmaRho1']:
+            self.assertEqual(self.index.find(mention), expected,
+                             repr(mention))
+
+    def test_prefix(self):
+        self.assertEqual(self.index.find_prefix(u'tnf'), [
+            match('000000103', 'EXACT', u'TNF'),
+            match('000000101', 'EXACT', u'TNF  \u03b1'),
+            match('000000103', 'label', u'TNF family'),
+            match('000000101', 'label', u'TNF-alpha'),
+            match('000000103', 'RELATED', u'TNF-alpha'),
+        ])
+        self.assertEqual(self.index.find_prefix(u'\u03c3'), [
+            match('000000102', 'label', u'sigma-1 receptor'),
+            match('000000102', 'EXACT', u'\u03a3\u03a11'),
+        ])
+        self.assertEqual(self.index.find_prefix(u'tnfx'), [])
+
+    def test_prefix_non_ascii(self):
+        # names continuing with a multibyte character match
+        self.assertEqual(self.index.find_prefix(u'r'), [
+            match('000000104', 'label', u'receptor'),
+            match('000000102', 'RELATED', u'r\u00e9cepteur sigma-1'),
+        ])
+        self.assertEqual(self.index.find_prefix(u'R\u00c9'), [
+            match('000000102', 'RELATED', u'r\u00e9cepteur sigma-1'),
+        ])
+
+    def test_prefix_limit(self):
+        matches = self.index.find_prefix(u'tnf')
+        for limit in range(len(matches) + 2):
+            self.assertEqual(self.index.find_prefix(u'tnf', limit),
+                             matches[:limit])
+
+    def test_empty(self):
+        for mention in [u'', u'  \t']:
+            self.assertEqual(self.index.find(mention), [])
+            self.assertEqual(self.index.find_prefix(mention), [])
+
+    def test_deprecated(self):
+        dirname = tempfile.mkdtemp()
+        try:
+            index = NameIndex(write_index(dirname, True))
+            self.assertEqual(index.find('obsolete TNF-beta'),
+                             [match('000000105', 'label',
+                                    u'obsolete TNF-beta')])
+            del index
+        finally:
+            shutil.rmtree(dirname)
+
+
+class LookupTest(unittest.TestCase):
+    """nameindex.py lookup output."""
+
+    MENTIONS = u'TNF-\u03b1\nunknown protein\n\ncachectin\nunknown protein\n'
+
+    def setUp(self):
+        logging.disable(logging.INFO)
+        self.dir = tempfile.mkdtemp()
+        self.index = write_index(self.dir)
+        self.mentions = os.path.join(self.dir, 'mentions')
+        with open(self.mentions, 'wb') as f:
+            f.write(self.MENTIONS.encode('utf-8'))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        logging.disable(logging.NOTSET)
+
+    def lookup(self, *args):
+        stdout = sys.stdout
+        try:
+            sys.stdout = StringIO()
+            nameindex.main(['nameindex.py', 'lookup'] + list(args) +
+                           [self.index, self.mentions])
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+    def test_lookup(self):
+        self.assertEqual(self.lookup(), native(
+            u'TNF-\u03b1\tPR:000000101\tlabel\tTNF-alpha\n'
+            u'TNF-\u03b1\tPR:000000103\tRELATED\tTNF-alpha\n'
+            u'unknown protein\t\t\t\n'
+            u'\t\t\t\n'
+            u'cachectin\tPR:000000101\tRELATED\tcachectin\n'
+            u'unknown protein\t\t\t\n'))
+
+    def test_lookup_prefix(self):
+        self.assertEqual(self.lookup('-p', '-l', '1'), native(
+            u'TNF-\u03b1\tPR:000000101\tlabel\tTNF-alpha\n'
+            u'unknown protein\t\t\t\n'
+            u'\t\t\t\n'
+            u'cachectin\tPR:000000101\tRELATED\tcachectin\n'
+            u'unknown protein\t\t\t\n'))
+
+
+if __name__ == '__main__':
+    unittest.main()
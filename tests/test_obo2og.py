@@ -0,0 +1,80 @@
+import os
+import sys
+import json
+import unittest
+
+from six import StringIO
+
+TESTDIR = os.path.dirname(os.path.abspath(__file__))
+DATADIR = os.path.join(TESTDIR, 'data')
+sys.path.insert(0, os.path.join(TESTDIR, '..', 'scripts'))
+
+import obo2og
+
+
+def convert(fn):
+    out = StringIO()
+    obo2og.process(fn, out)
+    return out.getvalue()
+
+
+class SnapshotTest(unittest.TestCase):
+    """Compare obo2og.py output to a snapshot of its earlier output.
+
+    data/small.og.json was written by "obo2og.py -o small.og.json
+    small.obo"; it is a regression snapshot, not ogger output, and
+    parity with ogger is not verified. Regenerate it the same way
+    when the conversion is meant to change.
+    """
+
+    def test_small(self):
+        converted = convert(os.path.join(DATADIR, 'small.obo'))
+        with open(os.path.join(DATADIR, 'small.og.json')) as f:
+            expected = f.read()
+        self.assertEqual(converted, expected)
+
+    def test_undeclared_nodes_last(self):
+        nodes = json.loads(convert(os.path.join(DATADIR, 'small.obo')))[
+            'graphs'][0]['nodes']
+        ids = [n['id'] for n in nodes[-2:]]
+        self.assertEqual(ids, [
+            'http://purl.obolibrary.org/obo/CHEBI_36080',
+            'http://purl.obolibrary.org/obo/NCBITaxon_9606',
+        ])
+
+
+class SortedSpoolTest(unittest.TestCase):
+
+    def test_runs_merged(self):
+        spool = obo2og.SortedSpool(run_size=2)
+        for s in ['d', 'b', 'a', 'b', 'e', 'c', 'a']:
+            spool.add(s)
+        self.assertTrue(len(spool.runs) > 1)
+        self.assertEqual(list(spool), ['a', 'b', 'c', 'd', 'e'])
+        spool.close()
+
+    def test_undeclared(self):
+        declared, referenced = obo2og.SortedSpool(2), obo2og.SortedSpool(2)
+        for s in ['b', 'd', 'f']:
+            declared.add(s)
+        for s in ['f', 'a', 'd', 'g', 'a']:
+            referenced.add(s)
+        self.assertEqual(list(obo2og.undeclared(declared, referenced)),
+                         ['a', 'g'])
+
+
+class MainTest(unittest.TestCase):
+
+    def test_output_with_several_inputs(self):
+        fn = os.path.join(DATADIR, 'small.obo')
+        stderr = sys.stderr
+        try:
+            sys.stderr = StringIO()
+            with self.assertRaises(SystemExit):
+                obo2og.main(['obo2og.py', '-o', os.devnull, fn, fn])
+        finally:
+            sys.stderr = stderr
+
+
+if __name__ == '__main__':
+    unittest.main()
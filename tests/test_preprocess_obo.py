@@ -0,0 +1,118 @@
+import os
+import re
+import sys
+import random
+import unittest
+
+TESTDIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTDIR, '..', 'scripts'))
+
+from preprocess_obo import parse_comment, parse_synonym_line, FormatError
+
+
+def regex_parse_comment(line):
+    # parse_comment() before scanning, the reference
+    if '!' not in line:
+        return line, None
+    m = re.match(r'^((?:[^"]|"(?:\\"|[^"])*")*)(\s+\!\s.*)$', line)
+    if not m:
+        return line, None
+    else:
+        return m.groups()
+
+
+def regex_parse_synonym_line(line):
+    # parse_synonym_line() before precompiling, the reference
+    m = re.match(r'^synonym: ("(?:\\"|[^"])*") (EXACT|BROAD|NARROW|RELATED) ([A-Za-z0-9_-]*) *\[(.*)\]\s*((?:\{.*\}\s*)?)$', line)
+    if not m:
+        raise FormatError('failed to parse synonym line: {}'.format(line))
+    string, scope, type_id, xrefs, qualifiers = m.groups()
+    xrefs = [ x for x in xrefs.split(', ') if x]
+    return string, scope, type_id, xrefs, qualifiers
+
+
+def parse_or_error(parse, line):
+    try:
+        return parse(line)
+    except FormatError as e:
+        return str(e)
+
+
+# Tokens significant to the grammar for random lines
+FUZZ_TOKENS = [
+    'synonym: ', '"', '\\"', '\\', ' ', '  ', '\t', 'EXACT', 'BROAD',
+    'NARROW', 'RELATED', 'EXACTLY', 'type-1', '[', ']', ', ', 'PMID:1',
+    '{', '}', 'a="b"', '!', ' ! ', 'x', '\n', u'\u00a0',
+]
+
+
+def random_lines(n, seed=0):
+    rnd = random.Random(seed)
+    for _ in range(n):
+        tokens = [rnd.choice(FUZZ_TOKENS)
+                  for _ in range(rnd.randint(0, 12))]
+        if rnd.random() < 0.8:
+            tokens.insert(0, 'synonym: "')
+        line = ''.join(tokens)
+        if sys.version_info[0] < 3:
+            line = line.encode('utf-8')
+        yield line
+
+
+class ParseCommentTest(unittest.TestCase):
+
+    def test_comment(self):
+        self.assertEqual(parse_comment('is_a: PR:000000001 ! protein'),
+                         ('is_a: PR:000000001', ' ! protein'))
+
+    def test_no_comment(self):
+        for line in ['xref: UniProtKB:P12345', 'name: a!b', 'name: a !b',
+                     '! comment']:
+            self.assertEqual(parse_comment(line), (line, None))
+
+    def test_quoted(self):
+        line = 'synonym: "a ! b" EXACT []'
+        self.assertEqual(parse_comment(line), (line, None))
+        self.assertEqual(parse_comment(line + ' ! c'), (line, ' ! c'))
+
+    def test_last_comment_marker(self):
+        self.assertEqual(parse_comment('def: "x" [] ! a ! b'),
+                         ('def: "x" [] ! a', ' ! b'))
+
+    def test_escaped_quote(self):
+        line = 'synonym: "a \\"b\\"" EXACT []'
+        self.assertEqual(parse_comment(line + ' ! c'), (line, ' ! c'))
+
+    def test_same_as_regex(self):
+        for line in random_lines(20000):
+            self.assertEqual(parse_comment(line), regex_parse_comment(line),
+                             repr(line))
+
+
+class ParseSynonymLineTest(unittest.TestCase):
+
+    def test_synonym(self):
+        self.assertEqual(
+            parse_synonym_line('synonym: "p53" EXACT PRO-short-label '
+                               '[PRO:DNx, PMID:1] {source="PRO"}'),
+            ('"p53"', 'EXACT', 'PRO-short-label', ['PRO:DNx', 'PMID:1'],
+             '{source="PRO"}'))
+
+    def test_no_type_or_xrefs(self):
+        self.assertEqual(parse_synonym_line('synonym: "\\"a\\" b" NARROW []'),
+                         ('"\\"a\\" b"', 'NARROW', '', [], ''))
+
+    def test_invalid(self):
+        for line in ['synonym: "p53" EXACTLY []', 'synonym: "p53" EXACT',
+                     'synonym: p53 EXACT []']:
+            self.assertRaises(FormatError, parse_synonym_line, line)
+
+    def test_same_as_regex(self):
+        for line in random_lines(20000):
+            self.assertEqual(parse_or_error(parse_synonym_line, line),
+                             parse_or_error(regex_parse_synonym_line, line),
+                             repr(line))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+TESTDIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTDIR, '..', 'scripts'))
+
+import rebuild
+
+
+# Writes its arguments to stdout
+ECHO = 'import sys; sys.stdout.write(" ".join(sys.argv[1:]))\n'
+
+
+class Args(object):
+    force = False
+    dry_run = False
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+
+class EchoStage(rebuild.Stage):
+    """Stage of jobs that output their command line options."""
+
+    def __init__(self, tmpdir, inputs):
+        rebuild.Stage.__init__(self, 'echo', tmpdir, '.in', tmpdir, '.out',
+                               None, jobs_option='-j')
+        self.script_path = os.path.join(tmpdir, 'echo.py')
+        with open(self.script_path, 'w') as f:
+            f.write(ECHO)
+        self.input_files = [os.path.join(tmpdir, '{}.in'.format(i))
+                            for i in range(inputs)]
+
+    def jobs(self, state, args):
+        for input_ in self.input_files:
+            command = [sys.executable, self.script_path, input_]
+            yield rebuild.Job(self, input_, self.output(input_), command,
+                              jobs_option=self.jobs_option)
+
+
+class RunStageTest(unittest.TestCase):
+    """Processes are divided between the jobs of a stage."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.state = rebuild.State(os.path.join(self.tmpdir, 'state.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def job_options(self, stage, jobs):
+        rebuild.run_stage(stage, self.state, Args(jobs))
+        options = []
+        for input_ in stage.input_files:
+            with open(stage.output(input_)) as f:
+                options.append(f.read().split()[:2])
+        return options
+
+    def test_single_job(self):
+        stage = EchoStage(self.tmpdir, 1)
+        self.assertEqual(self.job_options(stage, 8), [['-j', '8']])
+
+    def test_several_jobs(self):
+        stage = EchoStage(self.tmpdir, 3)
+        self.assertEqual(self.job_options(stage, 8), [['-j', '2']] * 3)
+
+    def test_more_jobs_than_processes(self):
+        stage = EchoStage(self.tmpdir, 3)
+        self.assertEqual(self.job_options(stage, 2), [['-j', '1']] * 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import sys
+import shutil
+import logging
+import tempfile
+import unittest
+
+TESTDIR = os.path.dirname(os.path.abspath(__file__))
+DATADIR = os.path.join(TESTDIR, 'data')
+sys.path.insert(0, os.path.join(TESTDIR, '..', 'scripts'))
+
+import updaterelease
+
+
+OUTPUTS = ['preprocessed', 'obographs', 'compacted', 'mapping']
+
+# Changes from data/small.obo to the new release
+NEW_TERM = '''[Term]
+id: PR:000000008
+name: TGF-beta receptor type-2 isoform 2
+comment: Category=sequence.
+synonym: "TGFR-2 isoform 2" EXACT PRO-short-label [PRO:DNx]
+xref: UniProtKB:P37173-2
+is_a: PR:000000005 ! TGF-beta receptor type-2
+relationship: only_in_taxon NCBITaxon:10090 ! Mus musculus
+
+'''
+
+
+def release(header=None):
+    """Return text of a new release of data/small.obo."""
+    with open(os.path.join(DATADIR, 'small.obo')) as f:
+        text = f.read()
+    header = header or [('data-version: 50.0', 'data-version: 51.0'),
+                        ('date: 01:02:2020', 'date: 01:03:2020')]
+    for old, new in header + [
+            ('isoform 1\n', 'isoform 1 (human)\n'),
+            ('[Typedef]\nid: only_in_taxon', NEW_TERM +
+             '[Typedef]\nid: only_in_taxon')]:
+        assert old in text
+        text = text.replace(old, new)
+    removed = text.index('[Term]\nid: PR:000000007')
+    return text[:removed] + text[text.index('[', removed + 1):]
+
+
+class Args(object):
+    include_deprecated = False
+    family = False
+    generalize = True
+
+
+class UpdateTest(unittest.TestCase):
+    """Compare incremental update to running the pipeline."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        logging.disable(logging.WARNING)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        shutil.rmtree(self.tmpdir)
+
+    def path(self, *names):
+        return os.path.join(self.tmpdir, *names)
+
+    def write(self, name, text):
+        with open(self.path(name), 'w') as f:
+            f.write(text)
+        return self.path(name)
+
+    def full_rebuild(self, release_fn, name):
+        os.mkdir(self.path(name))
+        args = Args()
+        args.release = release_fn
+        outputs = dict((o, self.path(name, o)) for o in OUTPUTS)
+        updaterelease.full_rebuild(args, outputs)
+        return outputs
+
+    def update(self, new_text):
+        previous = os.path.join(DATADIR, 'small.obo')
+        new = self.write('new.obo', new_text)
+        outputs = self.full_rebuild(previous, 'update')
+        status = updaterelease.main([
+            'updaterelease.py', '-g',
+            '-p', outputs['preprocessed'], '-o', outputs['obographs'],
+            '-c', outputs['compacted'], '-m', outputs['mapping'],
+            previous, new,
+        ])
+        return status, outputs, self.full_rebuild(new, 'full')
+
+    def test_same_as_full_rebuild(self):
+        status, updated, full = self.update(release())
+        self.assertFalse(status)
+        for name in OUTPUTS:
+            self.assertTrue(updaterelease.same_contents(updated[name],
+                                                        full[name]), name)
+        with open(updated['compacted']) as f:
+            self.assertTrue('pr/51.0/pr.owl' in f.read())
+
+    def test_structural_header_change(self):
+        status, updated, full = self.update(release([(
+            'subsetdef: PRO-reference "PRO reference term"',
+            'subsetdef: PRO-reference "PRO reference"')]))
+        self.assertEqual(status, updaterelease.NOT_INCREMENTAL)
+
+
+if __name__ == '__main__':
+    unittest.main()